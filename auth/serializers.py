@@ -1,9 +1,14 @@
 from rest_framework.fields import JSONField
-from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer, TokenRefreshSerializer
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import RefreshToken
 from rest_framework import serializers
 from django.contrib.auth.models import User
 from rest_framework.validators import UniqueValidator
 from django.contrib.auth.password_validation import validate_password
+from django.conf import settings
+from inquiries.authentication import VERSION_CLAIM, add_role_claims, current_version
 
 
 class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
@@ -15,8 +20,44 @@ class MyTokenObtainPairSerializer(TokenObtainPairSerializer):
 
         # Add custom claims
         #token['user'] = JSONField.dumps(user)
+        if settings.JWT_ROLE_CLAIMS:
+            add_role_claims(token, user)
         return token
 
+    def validate(self, attrs):
+        # Токены уже выпущены родительским validate через get_token
+        data = super().validate(attrs)
+
+        data['id'] = self.user.id
+        data['username'] = self.user.username
+        data['first_name'] = self.user.first_name
+        data['last_name'] = self.user.last_name
+        return data
+
+
+class MyTokenRefreshSerializer(TokenRefreshSerializer):
+    """Обновление токена с актуальными утверждениями о роли пользователя"""
+
+    def validate(self, attrs):
+        if not settings.JWT_ROLE_CLAIMS:
+            return super().validate(attrs)
+
+        refresh = RefreshToken(attrs['refresh'])
+        user = User.objects.filter(pk=refresh[api_settings.USER_ID_CLAIM], is_active=True).first()
+        if user is None:
+            raise InvalidToken('Пользователь не найден или заблокирован')
+        if VERSION_CLAIM in refresh and refresh[VERSION_CLAIM] != current_version(user.pk):
+            raise InvalidToken('Токен отозван')
+        add_role_claims(refresh, user)
+
+        data = {'access': str(refresh.access_token)}
+        if api_settings.ROTATE_REFRESH_TOKENS:
+            refresh.set_jti()
+            refresh.set_exp()
+            refresh.set_iat()
+            data['refresh'] = str(refresh)
+        return data
+
 
 class RegisterSerializer(serializers.ModelSerializer):
     email = serializers.EmailField(
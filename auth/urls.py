@@ -1,6 +1,5 @@
 from django.urls import path
-from auth.views import MyObtainTokenPairView, RegisterView
-from rest_framework_simplejwt.views import TokenRefreshView
+from auth.views import MyObtainTokenPairView, MyTokenRefreshView, RegisterView
 from django.contrib import admin
 from django.utils.translation import gettext_lazy as _
  
@@ -11,6 +10,6 @@ admin.site.site_title = _('Управление многоквартирным 
 
 urlpatterns = [
     path('login', MyObtainTokenPairView.as_view(), name='token_obtain_pair'),
-    path('login/refresh', TokenRefreshView.as_view(), name='token_refresh'),
+    path('login/refresh', MyTokenRefreshView.as_view(), name='token_refresh'),
     path('register', RegisterView.as_view(), name='auth_register'),
 ]
\ No newline at end of file
@@ -4,7 +4,7 @@ from django.contrib.auth.admin import UserAdmin
 from django.contrib.auth.models import User
 # from django.utils.translation import ugettext_lazy as _
 from django.contrib.auth.models import Group
-from .models import Profile, ToDo, Poll, Announcement, Notification, Comment, VoteOption, Vote, Property, Ownership, Info, File
+from .models import Profile, ToDo, Poll, Announcement, Notification, Comment, VoteOption, Vote, Property, Ownership, Info, File, NotificationFanout, Job, SlowQuery
 
 class MyUserAdmin(UserAdmin):
 
@@ -29,6 +29,9 @@ admin.site.register(Property)
 admin.site.register(Ownership)
 admin.site.register(Info)
 admin.site.register(File)
+admin.site.register(NotificationFanout)
+admin.site.register(Job)
+admin.site.register(SlowQuery)
 
 admin.site.unregister(Group)
 admin.site.unregister(User)
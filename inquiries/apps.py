@@ -5,3 +5,12 @@ class InquiriesConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'inquiries'    
     verbose_name = _('Информация')
+
+    def ready(self):
+        from . import search, cache, events, thumbnails, authentication, slow_queries
+        search.connect_signals(self)
+        cache.connect_signals()
+        events.connect_signals()
+        thumbnails.connect_signals()
+        authentication.connect_signals()
+        slow_queries.connect_signals()
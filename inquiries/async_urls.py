@@ -0,0 +1,17 @@
+from django.urls import path, include
+from django.urls.conf import re_path
+
+from .async_views import get_user, todo_list, notification_list, announcement_list, info_panel, \
+    notification_unread_count
+
+# Асинхронные варианты представлений стоят первыми и перекрывают синхронные
+# с теми же адресами, остальные адреса берутся из общей конфигурации.
+urlpatterns = [
+    re_path(r'^user$', get_user),
+    re_path(r'^todos$', todo_list),
+    re_path(r'^notifications$', notification_list),
+    re_path(r'^announcements$', announcement_list),
+    re_path(r'^info$', info_panel),
+    re_path(r'^notifications/unread_count$', notification_unread_count),
+    path('', include('upravdom.urls')),
+]
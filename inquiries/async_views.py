@@ -0,0 +1,103 @@
+"""Асинхронные варианты часто читаемых представлений для ASGI-приложения.
+
+В Django 4.0 запросы ORM нельзя выполнять из корутин. Синхронное
+представление под ASGI получает собственный поток на каждый запрос и держит
+его вместе с соединением с БД, пока ответ не будет отправлен клиенту, так что
+число соединений растёт вместе с числом одновременных клиентов. Здесь чтение
+(аутентификация JWT, проверка прав, запросы и сериализация) выполняется в
+ограниченном пуле из ASYNC_DATABASE_THREADS потоков: соединение закрывается
+сразу после формирования ответа, а отдача ответа медленному клиенту уже не
+занимает ни потока, ни соединения с БД.
+
+ASGI-обработчик Django 4.0 перебирает потоковый ответ синхронно внутри цикла
+событий, где ORM недоступен, поэтому ASGIHandler из этого модуля получает
+каждую порцию потокового ответа (?stream=, inquiries.streaming) в том же
+пуле потоков и сразу отправляет её клиенту.
+"""
+import asyncio
+import contextvars
+import functools
+from concurrent.futures import ThreadPoolExecutor
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.handlers import asgi
+from django.db import close_old_connections
+
+from inquiries import views
+from inquiries.metrics import measure_queries
+
+READ_METHODS = ('GET', 'HEAD')
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(max_workers=settings.ASYNC_DATABASE_THREADS,
+                                      thread_name_prefix='inquiries-db')
+    return executor
+
+
+def call_in_database_thread(func, *args, **kwargs):
+    # Соединения с БД принадлежат потоку пула, поэтому устаревшие соединения
+    # закрываются здесь же, как это делают сигналы начала и конца запроса.
+    close_old_connections()
+    try:
+        with measure_queries():
+            return func(*args, **kwargs)
+    finally:
+        close_old_connections()
+
+
+async def run_in_database_thread(func, *args, **kwargs):
+    """Выполняет синхронную функцию с запросами к БД в пуле потоков БД"""
+    loop = asyncio.get_running_loop()
+    context = contextvars.copy_context()
+    return await loop.run_in_executor(get_executor(), functools.partial(
+        context.run, call_in_database_thread, func, *args, **kwargs))
+
+
+def async_read_view(view):
+    """Асинхронный вариант синхронного представления view.
+
+    GET и HEAD выполняются в пуле потоков БД, остальные методы - так же,
+    как синхронное представление под ASGI. Аутентификация, права,
+    условные ответы и кэш остаются за декораторами view.
+    """
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        if request.method not in READ_METHODS:
+            return await sync_to_async(view)(request, *args, **kwargs)
+        return await run_in_database_thread(view, request, *args, **kwargs)
+    return wrapper
+
+
+class ASGIHandler(asgi.ASGIHandler):
+    """ASGI-обработчик Django, который читает порции потоковых ответов в пуле потоков БД"""
+
+    async def send_response(self, response, send):
+        if not response.streaming:
+            return await super().send_response(response, send)
+        headers = [(header.encode('ascii'), value.encode('latin1')) for header, value in response.items()]
+        headers += [(b'Set-Cookie', cookie.output(header='').encode('ascii').strip())
+                    for cookie in response.cookies.values()]
+        await send({'type': 'http.response.start', 'status': response.status_code, 'headers': headers})
+        parts = iter(response)
+        while True:
+            part = await run_in_database_thread(next, parts, None)
+            if part is None:
+                break
+            for chunk, _ in self.chunk_bytes(part):
+                await send({'type': 'http.response.body', 'body': chunk, 'more_body': True})
+        await send({'type': 'http.response.body'})
+        await sync_to_async(response.close, thread_sensitive=True)()
+
+
+get_user = async_read_view(views.get_user)
+todo_list = async_read_view(views.todo_list)
+notification_list = async_read_view(views.notification_list)
+announcement_list = async_read_view(views.announcement_list)
+info_panel = async_read_view(views.info_panel)
+notification_unread_count = async_read_view(views.notification_unread_count)
@@ -0,0 +1,92 @@
+"""Авторизация по утверждениям JWT без обращений к БД.
+
+При включённой настройке JWT_ROLE_CLAIMS токен получает утверждения
+is_manager (роль пользователя) и auth_version - отпечаток роли, признака
+активности и хэша пароля. Аутентификация не загружает User и Profile, а
+собирает их из утверждений токена; для отзыва токена auth_version
+сравнивается с отпечатком текущего состояния пользователя, который
+хранится в кэше ответов не дольше JWT_CLAIMS_CACHE_TIMEOUT секунд.
+
+Сохранение User или Profile удаляет отпечаток из кэша, поэтому смена роли,
+блокировка или смена пароля отзывают выданные токены сразу, если кэш общий
+для всех процессов (Redis, Memcached), и не позже чем через
+JWT_CLAIMS_CACHE_TIMEOUT секунд с кэшем в памяти процесса. Токены без
+утверждений (выданные до включения настройки) проверяются по БД, как раньше.
+"""
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.db import DEFAULT_DB_ALIAS
+from django.db.models.signals import post_save, post_delete
+from django.utils.crypto import salted_hmac
+from rest_framework_simplejwt.authentication import JWTAuthentication
+from rest_framework_simplejwt.exceptions import InvalidToken
+from rest_framework_simplejwt.settings import api_settings
+
+from .cache import get_cache
+from .models import Profile
+
+ROLE_CLAIM = 'is_manager'
+VERSION_CLAIM = 'auth_version'
+
+
+def auth_version(is_manager, is_active, password):
+    """Отпечаток сведений о пользователе, от которых зависят права токена"""
+    return salted_hmac('inquiries.authentication', f'{is_manager}:{is_active}:{password}').hexdigest()[:16]
+
+
+def version_key(user_id):
+    return f'auth_version:{user_id}'
+
+
+def current_version(user_id):
+    """Отпечаток текущего состояния пользователя или None, если пользователя нет"""
+    cache = get_cache()
+    version = cache.get(version_key(user_id))
+    if version is None:
+        row = User.objects.filter(pk=user_id).values_list('profile__is_manager', 'is_active', 'password').first()
+        if row is None:
+            return None
+        version = auth_version(bool(row[0]), *row[1:])
+        cache.set(version_key(user_id), version, settings.JWT_CLAIMS_CACHE_TIMEOUT)
+    return version
+
+
+def add_role_claims(token, user):
+    is_manager = Profile.objects.filter(pk=user.pk).values_list('is_manager', flat=True).first() or False
+    token[ROLE_CLAIM] = is_manager
+    token[VERSION_CLAIM] = auth_version(is_manager, user.is_active, user.password)
+    return token
+
+
+def token_user(validated_token):
+    """User с профилем, собранный из утверждений токена без запросов к БД"""
+    user = User(pk=validated_token[api_settings.USER_ID_CLAIM], is_active=True)
+    user._state.adding = False
+    user._state.db = DEFAULT_DB_ALIAS
+    user.profile = Profile(user=user, is_manager=validated_token[ROLE_CLAIM])
+    return user
+
+
+class RoleClaimsJWTAuthentication(JWTAuthentication):
+    """JWTAuthentication, которая при JWT_ROLE_CLAIMS берёт пользователя из утверждений токена"""
+
+    def get_user(self, validated_token):
+        if not settings.JWT_ROLE_CLAIMS or VERSION_CLAIM not in validated_token:
+            return super().get_user(validated_token)
+        try:
+            user_id = validated_token[api_settings.USER_ID_CLAIM]
+        except KeyError:
+            raise InvalidToken('Токен не содержит идентификатора пользователя')
+        if validated_token[VERSION_CLAIM] != current_version(user_id):
+            raise InvalidToken('Токен отозван')
+        return token_user(validated_token)
+
+
+def version_changed(sender, instance, **kwargs):
+    get_cache().delete(version_key(instance.pk))
+
+
+def connect_signals():
+    for model in (User, Profile):
+        post_save.connect(version_changed, sender=model)
+        post_delete.connect(version_changed, sender=model)
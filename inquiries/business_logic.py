@@ -0,0 +1,251 @@
+import logging
+
+from django.conf import settings
+from django.db import DEFAULT_DB_ALIAS, IntegrityError, connection, connections, transaction
+from django.db.models import Exists, F, OuterRef, Q
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from .cache import invalidate
+from .events import publish
+from .jobs import enqueue, job
+from .models import Announcement, File, Inquiry, Notification, NotificationFanout, Ownership, Poll, Profile, ToDo, Vote, \
+    VoteOption
+from .search import update_search_document
+
+logger = logging.getLogger(__name__)
+
+FANOUT_TARGET_FIELDS = ('property_street_name', 'property_building_number', 'property_entrance_number',
+                        'property_type')
+
+
+class PollClosed(Exception):
+    pass
+
+
+class AlreadyVoted(Exception):
+    pass
+
+
+def visible_todos(user):
+    """Заявки, доступные пользователю: управляющему - все, жителю - собственные"""
+    if user.profile.is_manager:
+        return ToDo.objects.all()
+    return ToDo.objects.filter(inquiry_creator=user)
+
+
+def visible_announcements(user):
+    """Опубликованные объявления и собственные объявления пользователя.
+
+    Объявления с истёкшей датой актуальности снимает с публикации задание
+    expire_announcements.
+    """
+    return Announcement.objects.filter(Q(announcement_is_visible=True) | Q(inquiry_creator=user))
+
+
+def visible_notifications(user):
+    """Уведомления, доступные пользователю: управляющему - все, жителю - адресованные ему"""
+    if user.profile.is_manager:
+        return Notification.objects.all()
+    return Notification.objects.filter(notification_recipient=user)
+
+
+def visible_files(user):
+    """Файлы, доступные пользователю.
+
+    Фотографии профилей видны всем, как и список пользователей; остальные
+    файлы - управляющему и тому, кто их загрузил.
+    """
+    if user.profile.is_manager:
+        return File.objects.all()
+    return File.objects.filter(Q(profile__isnull=False) | Q(file_creator=user))
+
+
+def unread_notification_count(user):
+    return Profile.objects.filter(user=user).values_list('unread_notification_count', flat=True).first() or 0
+
+
+def mark_notifications_read(user, notifications):
+    """Отмечает прочитанными непрочитанные уведомления пользователя из notifications.
+
+    Уведомления обновляются одним UPDATE, а счётчик непрочитанных
+    уменьшается на число действительно изменённых строк, поэтому повторная
+    или одновременная отметка тех же уведомлений не искажает счётчик.
+    """
+    with transaction.atomic():
+        count = notifications.filter(notification_recipient=user, notification_is_read=False) \
+            .update(notification_is_read=True)
+        if count:
+            Profile.objects.filter(user=user).update(
+                unread_notification_count=Greatest(F('unread_notification_count') - count, 0))
+    return count
+
+
+def annotate_user_vote(polls, user):
+    """Добавляет к голосованиям признак poll_user_has_voted для пользователя user"""
+    return polls.annotate(poll_user_has_voted=Exists(
+        Vote.objects.filter(voter=user, poll=OuterRef('pk'))))
+
+
+def cast_vote(user, option_id):
+    """Регистрирует голос пользователя за вариант option_id.
+
+    Один голос на голосование гарантирует уникальное ограничение
+    (poll, voter), поэтому голос записывается одной вставкой без
+    предварительной проверки, а конфликт превращается в AlreadyVoted.
+    """
+    option = VoteOption.objects.select_related('poll').get(pk=option_id)
+    if option.poll.poll_is_closed or option.poll.poll_deadline <= timezone.now():
+        raise PollClosed()
+    try:
+        with transaction.atomic():
+            return Vote.objects.create(voter=user, selected_option=option, poll_id=option.poll_id)
+    except IntegrityError:
+        raise AlreadyVoted()
+
+
+@job(every=settings.ANNOUNCEMENT_EXPIRY_INTERVAL)
+def expire_announcements():
+    """Снимает с публикации объявления, дата актуальности которых наступила"""
+    expired = Announcement.objects.filter(
+        announcement_is_visible=True, announcement_auto_invisible_date__lte=timezone.localdate()) \
+        .update(announcement_is_visible=False, inquiry_updated_at=timezone.now())
+    if expired:
+        # update() не вызывает сигналы, которые сбрасывают кэш ответов
+        invalidate('announcement_list')
+    return expired
+
+
+@job(every=settings.POLL_CLOSE_INTERVAL)
+def close_polls():
+    """Завершает голосования, срок которых истёк"""
+    closed = Poll.objects.filter(poll_is_closed=False, poll_deadline__lte=timezone.now()) \
+        .update(poll_is_closed=True, inquiry_updated_at=timezone.now())
+    if closed:
+        invalidate('poll_list')
+    return closed
+
+
+def fanout_recipients(fanout):
+    """Идентификаторы собственников помещений, подходящих под условия рассылки"""
+    target = {f'property__{field}': getattr(fanout, field) for field in FANOUT_TARGET_FIELDS
+              if getattr(fanout, field) not in (None, '')}
+    return Ownership.objects.filter(**target).order_by('owner_id').values_list('owner_id', flat=True).distinct()
+
+
+class FanoutProgress:
+    """Записывает ход рассылки в fanout_sent отдельным соединением в режиме автофиксации.
+
+    Уведомления рассылки создаются в одной транзакции и не видны другим
+    соединениям до её фиксации, а ход выполнения должен быть виден сразу,
+    в том числе из другого процесса. SQLite не допускает второго пишущего
+    соединения при открытой транзакции записи, поэтому там ход не
+    записывается и fanout_sent обновляется только по завершении рассылки.
+    """
+
+    def __init__(self, fanout_id):
+        self.fanout_id = fanout_id
+        self.connection = None
+        if connection.vendor != 'sqlite':
+            self.connection = connections.create_connection(DEFAULT_DB_ALIAS)
+
+    def report(self, sent):
+        if self.connection is None:
+            return
+        quote_name = self.connection.ops.quote_name
+        opts = NotificationFanout._meta
+        with self.connection.cursor() as cursor:
+            cursor.execute(
+                f'UPDATE {quote_name(opts.db_table)} SET {quote_name(opts.get_field("fanout_sent").column)} = %s '
+                f'WHERE {quote_name(opts.pk.column)} = %s',
+                [sent, self.fanout_id])
+
+    def close(self):
+        if self.connection is not None:
+            self.connection.close()
+
+
+def create_notifications(fanout, recipients):
+    """Создаёт уведомления рассылки для recipients пакетными вставками.
+
+    bulk_create не работает с дочерними моделями многотабличного
+    наследования, поэтому строки Inquiry создаются bulk_create, а строки
+    Notification - многострочным INSERT. Сигналы при этом не вызываются,
+    так что поисковый индекс и события обновляются здесь же.
+    """
+    inquiries = Inquiry.objects.bulk_create([
+        Inquiry(inquiry_title=fanout.inquiry_title, inquiry_text=fanout.inquiry_text,
+                inquiry_creator_id=fanout.fanout_creator_id)
+        for recipient in recipients
+    ])
+    fields = [Notification._meta.get_field(name) for name in
+              ('inquiry_ptr', 'notification_is_read', 'notification_recipient', 'notification_category')]
+    rows = [(inquiry.pk, False, recipient, fanout.notification_category)
+            for inquiry, recipient in zip(inquiries, recipients)]
+    batch_size = connection.ops.bulk_batch_size(fields, rows)
+    columns = ', '.join(connection.ops.quote_name(field.column) for field in fields)
+    placeholders = '(%s)' % ', '.join(['%s'] * len(fields))
+    with connection.cursor() as cursor:
+        for start in range(0, len(rows), batch_size):
+            batch = rows[start:start + batch_size]
+            cursor.execute(
+                f'INSERT INTO {connection.ops.quote_name(Notification._meta.db_table)} ({columns}) '
+                f'VALUES {", ".join([placeholders] * len(batch))}',
+                [value for row in batch for value in row])
+
+    update_search_document(inquiry.pk for inquiry in inquiries)
+    Profile.objects.filter(user__in=recipients).update(unread_notification_count=F('unread_notification_count') + 1)
+    for inquiry, recipient in zip(inquiries, recipients):
+        publish(recipient, 'notification', {
+            'inquiry_id': inquiry.pk,
+            'inquiry_title': inquiry.inquiry_title,
+            'inquiry_created_at': inquiry.inquiry_created_at,
+            'notification_category': fanout.notification_category,
+        })
+
+
+@job(max_attempts=3)
+def run_fanout(fanout_id):
+    """Выполняет рассылку: все уведомления создаются в одной транзакции пакетами по FANOUT_BATCH_SIZE.
+
+    Ошибка записывается в рассылку и пробрасывается дальше, чтобы очередь
+    заданий повторила рассылку.
+    """
+    fanouts = NotificationFanout.objects.filter(pk=fanout_id)
+    fanouts.update(fanout_status='r', fanout_sent=0)
+    fanout = fanouts.get()
+    progress = FanoutProgress(fanout_id)
+    sent = 0
+    try:
+        with transaction.atomic():
+            recipients = list(fanout_recipients(fanout))
+            for start in range(0, len(recipients), settings.FANOUT_BATCH_SIZE):
+                batch = recipients[start:start + settings.FANOUT_BATCH_SIZE]
+                create_notifications(fanout, batch)
+                sent += len(batch)
+                progress.report(sent)
+            fanouts.update(fanout_status='d', fanout_total=len(recipients), fanout_sent=sent,
+                           fanout_finished_at=timezone.now())
+    except Exception as exc:
+        fanouts.update(fanout_status='f', fanout_sent=0, fanout_error=str(exc), fanout_finished_at=timezone.now())
+        raise
+    finally:
+        progress.close()
+
+
+def start_fanout(fanout):
+    """Запускает рассылку: до FANOUT_SYNC_LIMIT получателей - сразу, иначе - фоновым заданием.
+
+    Возвращает рассылку с актуальным статусом.
+    """
+    fanout.fanout_total = fanout_recipients(fanout).count()
+    fanout.save(update_fields=['fanout_total'])
+    if fanout.fanout_total <= settings.FANOUT_SYNC_LIMIT:
+        try:
+            run_fanout(fanout.pk)
+        except Exception:
+            logger.exception('Рассылка %s завершилась ошибкой', fanout.pk)
+        fanout.refresh_from_db()
+    else:
+        enqueue('run_fanout', fanout.pk)
+    return fanout
@@ -0,0 +1,153 @@
+"""Кэш ответов для часто читаемых и редко меняющихся списков.
+
+Ключ ответа складывается из имени представления, поколения кэша этого
+представления, области видимости пользователя, параметров запроса и
+состояния страницы из inquiries.conditional (идентификаторы и даты изменения
+её записей). Комментарии и голоса обновляют дату изменения своей заявки,
+поэтому устаревают только страницы с этой заявкой. Сохранение и удаление
+самих заявок и справочных данных меняет поколение, после чего старые записи
+становятся недостижимыми и вытесняются по TTL или LRU бэкенда.
+Сжатые варианты ответа (inquiries.compression) хранятся под ключом ответа
+с суффиксом алгоритма и сжимаются один раз.
+"""
+import hashlib
+import uuid
+from functools import wraps
+
+from django.conf import settings
+from django.core.cache import caches
+from django.db.models.signals import post_save, post_delete
+from django.http.response import HttpResponse
+from django.utils.cache import patch_vary_headers
+
+from .compression import compress, negotiate
+from .models import Info, Announcement, Poll
+
+CACHE_ALIAS = 'responses'
+CACHED_HEADERS = ('Link', 'X-Next-Cursor', 'X-Previous-Cursor')
+
+# Какие представления устаревают при изменении модели. Comment, Vote и
+# VoteOption здесь не нужны: они меняют состояние страницы в ключе.
+INVALIDATED_BY = {
+    Info: ('info_panel',),
+    Announcement: ('announcement_list',),
+    Poll: ('poll_list',),
+}
+
+
+def get_cache():
+    return caches[CACHE_ALIAS]
+
+
+def get_generation(endpoint):
+    cache = get_cache()
+    key = f'generation:{endpoint}'
+    generation = cache.get(key)
+    if generation is None:
+        cache.add(key, uuid.uuid4().hex, None)
+        generation = cache.get(key)
+    return generation
+
+
+def invalidate(*endpoints):
+    """Сбрасывает закэшированные ответы представлений endpoints"""
+    cache = get_cache()
+    for endpoint in endpoints:
+        cache.set(f'generation:{endpoint}', uuid.uuid4().hex, None)
+
+
+def get_scope(request, scope):
+    if scope == 'user':
+        return f'user{request.user.pk}'
+    if scope == 'role':
+        return 'manager' if request.user.profile.is_manager else 'resident'
+    return 'all'
+
+
+def get_cache_key(request, endpoint, scope):
+    params = sorted(request.GET.lists())
+    state = getattr(request, 'response_state', None)
+    raw = f'{endpoint}:{get_generation(endpoint)}:{get_scope(request, scope)}:{params}:{state}'
+    return 'response:' + hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def count(endpoint, result):
+    cache = get_cache()
+    key = f'stats:{endpoint}:{result}'
+    cache.add(key, 0, None)
+    try:
+        cache.incr(key)
+    except ValueError:
+        cache.set(key, 1, None)
+
+
+def get_stats(endpoints=None):
+    """Счётчики попаданий и промахов по представлениям"""
+    if endpoints is None:
+        endpoints = sorted({endpoint for names in INVALIDATED_BY.values() for endpoint in names})
+    cache = get_cache()
+    return {endpoint: {result: cache.get(f'stats:{endpoint}:{result}', 0) for result in ('hit', 'miss')}
+            for endpoint in endpoints}
+
+
+def cached_response(request, key, cached):
+    """Ответ из закэшированного тела; сжатый вариант берётся из кэша или сохраняется в нём"""
+    content, content_type, headers = cached
+    encoding = negotiate(request) if len(content) >= settings.COMPRESSION_MIN_SIZE else None
+    if encoding is not None:
+        cache = get_cache()
+        compressed = cache.get(f'{key}:{encoding}')
+        if compressed is None:
+            compressed = compress(content, encoding)
+            cache.set(f'{key}:{encoding}', compressed)
+        content = compressed
+    response = HttpResponse(content, content_type=content_type)
+    for header, value in headers:
+        response[header] = value
+    if encoding is not None:
+        response['Content-Encoding'] = encoding
+    patch_vary_headers(response, ('Accept-Encoding',))
+    return response
+
+
+def cache_response(endpoint, scope='role'):
+    """Кэширует успешные ответы GET представления.
+
+    scope определяет, кто видит одинаковый ответ: 'all' - все пользователи,
+    'role' - отдельно управляющие и жители, 'user' - каждый пользователь.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != 'GET':
+                return view(request, *args, **kwargs)
+            cache = get_cache()
+            key = get_cache_key(request, endpoint, scope)
+            cached = cache.get(key)
+            if cached is not None:
+                count(endpoint, 'hit')
+                response = cached_response(request, key, cached)
+                response['X-Cache'] = 'HIT'
+                return response
+
+            count(endpoint, 'miss')
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                headers = [(header, response[header]) for header in CACHED_HEADERS if response.has_header(header)]
+                cached = (response.content, response['Content-Type'], headers)
+                cache.set(key, cached)
+                response = cached_response(request, key, cached)
+            response['X-Cache'] = 'MISS'
+            return response
+        return wrapper
+    return decorator
+
+
+def model_changed(sender, **kwargs):
+    invalidate(*INVALIDATED_BY[sender])
+
+
+def connect_signals():
+    for model in INVALIDATED_BY:
+        post_save.connect(model_changed, sender=model)
+        post_delete.connect(model_changed, sender=model)
@@ -0,0 +1,121 @@
+"""Сжатие ответов API по заголовку Accept-Encoding.
+
+CompressionMiddleware сжимает ответы JSON и NDJSON, которые не меньше
+COMPRESSION_MIN_SIZE байт: алгоритмом br, если установлена библиотека
+brotli и клиент её принимает, иначе gzip. Потоковые списки сжимаются по
+мере выдачи: после каждой порции строк сжатые данные сбрасываются клиенту,
+поэтому сжатие не задерживает первые записи. Файлы (FileResponse) и ответы
+на запросы Range не сжимаются, чтобы не терять sendfile и строгий ETag.
+
+Кэш ответов (inquiries.cache) хранит рядом с ответом его сжатые варианты,
+поэтому попадание в кэш не сжимает тело заново.
+"""
+import gzip
+import zlib
+
+from django.conf import settings
+from django.http.response import FileResponse
+from django.utils.cache import patch_vary_headers
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework import status
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+# Порядок - предпочтение сервера при одинаковом q
+ENCODINGS = ('br', 'gzip') if brotli is not None else ('gzip',)
+COMPRESSIBLE_TYPES = ('application/json', 'application/x-ndjson')
+
+
+def accepted_encodings(header):
+    """Значения q из заголовка Accept-Encoding"""
+    accepted = {}
+    for item in header.split(','):
+        name, _, params = item.partition(';')
+        quality = 1.0
+        for param in params.split(';'):
+            key, _, value = param.strip().partition('=')
+            if key == 'q':
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if name.strip():
+            accepted[name.strip().lower()] = quality
+    return accepted
+
+
+def negotiate(request):
+    """Алгоритм сжатия для ответа на request или None"""
+    accepted = accepted_encodings(request.headers.get('Accept-Encoding', ''))
+    qualities = [(accepted.get(encoding, accepted.get('*', 0.0)), encoding) for encoding in ENCODINGS]
+    quality, encoding = max(qualities, key=lambda item: item[0])
+    return encoding if quality > 0 else None
+
+
+def compress(content, encoding):
+    if encoding == 'br':
+        return brotli.compress(content, quality=settings.COMPRESSION_BROTLI_QUALITY)
+    return gzip.compress(content, compresslevel=settings.COMPRESSION_GZIP_LEVEL, mtime=0)
+
+
+def compress_stream(chunks, encoding):
+    """Сжимает порции потокового ответа, сбрасывая сжатые данные после каждой"""
+    if encoding == 'br':
+        compressor = brotli.Compressor(quality=settings.COMPRESSION_BROTLI_QUALITY)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.process(chunk) + compressor.flush()
+        yield compressor.finish()
+    else:
+        compressor = zlib.compressobj(settings.COMPRESSION_GZIP_LEVEL, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        for chunk in chunks:
+            if chunk:
+                yield compressor.compress(chunk) + compressor.flush(zlib.Z_SYNC_FLUSH)
+        yield compressor.flush()
+
+
+def is_compressible(response):
+    content_type = response.get('Content-Type', '').split(';')[0].strip()
+    return (content_type in COMPRESSIBLE_TYPES and response.status_code != status.HTTP_206_PARTIAL_CONTENT
+            and not isinstance(response, FileResponse))
+
+
+def weaken_etag(response):
+    # Сжатое тело отличается от исходного побайтно
+    etag = response.get('ETag')
+    if etag and etag.startswith('"'):
+        response['ETag'] = 'W/' + etag
+
+
+class CompressionMiddleware(MiddlewareMixin):
+    """Сжимает ответы JSON алгоритмом, согласованным по Accept-Encoding"""
+
+    def process_response(self, request, response):
+        if not is_compressible(response):
+            return response
+        patch_vary_headers(response, ('Accept-Encoding',))
+        if response.has_header('Content-Encoding'):
+            # Сжатый вариант из кэша ответов
+            weaken_etag(response)
+            return response
+        encoding = negotiate(request)
+        if encoding is None:
+            return response
+
+        if response.streaming:
+            response.streaming_content = compress_stream(response.streaming_content, encoding)
+            del response['Content-Length']
+        else:
+            if len(response.content) < settings.COMPRESSION_MIN_SIZE:
+                return response
+            compressed = compress(response.content, encoding)
+            if len(compressed) >= len(response.content):
+                return response
+            response.content = compressed
+            response['Content-Length'] = str(len(compressed))
+        response['Content-Encoding'] = encoding
+        weaken_etag(response)
+        return response
@@ -0,0 +1,73 @@
+"""Условные GET-запросы (ETag / Last-Modified) для списков и карточек заявок.
+
+Состояние ответа вычисляется одним лёгким запросом по inquiry_updated_at
+ещё до сериализации, поэтому неизменившиеся данные отдаются ответом 304.
+Состояние списка - это идентификаторы и даты изменения записей запрошенной
+страницы: они выбираются тем же запросом по индексу, что и сама страница.
+Списки отдают только ETag: удаление записи или истечение срока показа
+объявления не сдвигает дату изменения, поэтому Last-Modified здесь ненадёжен.
+Комментарии и голоса обновляют inquiry_updated_at родительской заявки
+(см. сигналы в models.py), поэтому тоже меняют состояние. Поля, которые
+меняются без обновления inquiry_updated_at (например, признак прочтения
+уведомления), передаются в extra_fields и входят только в ETag.
+"""
+import hashlib
+from calendar import timegm
+from functools import wraps
+
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date, quote_etag
+
+
+def make_etag(request, *parts):
+    raw = ':'.join(str(part) for part in (request.user.pk, sorted(request.GET.lists())) + parts)
+    return hashlib.md5(raw.encode('utf-8')).hexdigest()
+
+
+def list_state(request, queryset, paginator, extra_fields=()):
+    """ETag страницы списка, которую paginator выберет из queryset"""
+    rows = paginator.get_page_queryset(queryset, request).values_list('pk', 'inquiry_updated_at', *extra_fields)
+    return make_etag(request, *rows), None
+
+
+def detail_state(request, queryset, extra_fields=()):
+    """ETag и дата изменения одной заявки; None, если заявка недоступна"""
+    row = queryset.values_list('pk', 'inquiry_updated_at', *extra_fields).first()
+    if row is None:
+        return None
+    return make_etag(request, *row), None if extra_fields else row[1]
+
+
+def conditional(state_func):
+    """Отвечает 304 без вызова представления, если состояние не изменилось.
+
+    state_func(request, *args, **kwargs) возвращает пару (etag, last_modified)
+    или None, если для запроса условная обработка не применяется.
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method not in ('GET', 'HEAD'):
+                return view(request, *args, **kwargs)
+            state = state_func(request, *args, **kwargs)
+            if state is None:
+                return view(request, *args, **kwargs)
+
+            etag, last_modified = state
+            # Кэш ответов (inquiries.cache) добавляет состояние к ключу
+            request.response_state = etag
+            etag = quote_etag(etag)
+            last_modified = timegm(last_modified.utctimetuple()) if last_modified else None
+            response = get_conditional_response(request, etag=etag, last_modified=last_modified)
+            if response is not None:
+                return response
+
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200:
+                if last_modified is not None and not response.has_header('Last-Modified'):
+                    response['Last-Modified'] = http_date(last_modified)
+                if not response.has_header('ETag'):
+                    response['ETag'] = etag
+            return response
+        return wrapper
+    return decorator
@@ -0,0 +1,80 @@
+"""Кодирование ответов API в JSON.
+
+Все ответы (JsonResponse, рендерер DRF, потоковые списки и события)
+кодируются функцией dumps, которая выбирает реализацию по настройке
+JSON_ENCODER: 'json' - стандартный модуль json, 'orjson' - библиотека
+orjson, 'auto' - orjson, если он установлен. Результат - байты UTF-8 без
+экранирования \\uXXXX и без пробелов между элементами, поэтому ответ с
+кириллицей примерно вдвое короче, чем у django.http.JsonResponse.
+
+Типы, которых нет в JSON (даты, Decimal, UUID, ленивые строки перевода),
+обе реализации передают методу default кодировщика (по умолчанию
+DjangoJSONEncoder), поэтому ответы не зависят от выбранной реализации.
+"""
+import json
+
+from django.conf import settings
+from django.core.exceptions import ImproperlyConfigured
+from django.core.serializers.json import DjangoJSONEncoder
+from django.http.response import HttpResponse
+from rest_framework import renderers
+
+try:
+    import orjson
+except ImportError:
+    orjson = None
+
+CONTENT_TYPE = 'application/json'
+
+
+def dumps_json(data, encoder_class):
+    return json.dumps(data, cls=encoder_class, ensure_ascii=False, separators=(',', ':')).encode('utf-8')
+
+
+def dumps_orjson(data, encoder_class):
+    # Даты тоже кодирует default, чтобы формат совпадал с encoder_class
+    return orjson.dumps(data, default=encoder_class().default,
+                        option=orjson.OPT_PASSTHROUGH_DATETIME | orjson.OPT_NON_STR_KEYS)
+
+
+BACKENDS = {
+    'json': dumps_json,
+    'orjson': dumps_orjson,
+}
+
+
+def get_backend_name():
+    name = settings.JSON_ENCODER
+    if name == 'auto':
+        return 'orjson' if orjson is not None else 'json'
+    if name not in BACKENDS:
+        raise ImproperlyConfigured(f'JSON_ENCODER: допустимые значения auto, {", ".join(BACKENDS)}')
+    if name == 'orjson' and orjson is None:
+        raise ImproperlyConfigured('JSON_ENCODER=orjson, но библиотека orjson не установлена')
+    return name
+
+
+def dumps(data, encoder_class=DjangoJSONEncoder):
+    """JSON-представление data в байтах UTF-8"""
+    return BACKENDS[get_backend_name()](data, encoder_class)
+
+
+class JsonResponse(HttpResponse):
+    """Замена django.http.JsonResponse, кодирующая data функцией dumps"""
+
+    def __init__(self, data, safe=True, **kwargs):
+        if safe and not isinstance(data, dict):
+            raise TypeError('In order to allow non-dict objects to be serialized set the safe parameter to False.')
+        kwargs.setdefault('content_type', CONTENT_TYPE)
+        super().__init__(content=dumps(data), **kwargs)
+
+
+class JSONRenderer(renderers.JSONRenderer):
+    """Рендерер DRF на dumps; ответы с отступами (indent) кодирует стандартный рендерер"""
+
+    def render(self, data, accepted_media_type=None, renderer_context=None):
+        if data is None:
+            return b''
+        if self.get_indent(accepted_media_type, renderer_context or {}):
+            return super().render(data, accepted_media_type, renderer_context)
+        return dumps(data, self.encoder_class)
@@ -0,0 +1,199 @@
+"""События для push-канала (SSE).
+
+Событие адресуется каналу пользователя user:<id> и передаётся брокеру,
+класс которого задаётся настройкой EVENTS_BROKER. LocalBroker доставляет
+события подписчикам того же процесса, этого достаточно для одного процесса
+и для тестов. PostgresBroker рассылает события всем процессам через
+LISTEN/NOTIFY. Событие публикуется только после фиксации транзакции.
+"""
+import asyncio
+import json
+import logging
+import select
+import threading
+import time
+from collections import defaultdict
+
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models.signals import post_init, post_save
+from django.utils.module_loading import import_string
+
+from .encoding import dumps
+from .models import Notification, ToDo
+
+logger = logging.getLogger(__name__)
+
+TODO_EVENT_FIELDS = ('inquiry_id', 'todo_status', 'todo_assigned_to', 'inquiry_updated_at')
+
+
+class Subscription:
+    """Очередь событий одного подписчика в его цикле событий.
+
+    Если подписчик не успевает читать и очередь переполнена, накопленные
+    события заменяются одним событием resync: клиенту нужно перечитать списки.
+    """
+    def __init__(self, broker, channels, maxsize):
+        self.broker = broker
+        self.channels = channels
+        self.loop = asyncio.get_running_loop()
+        self.queue = asyncio.Queue(maxsize)
+
+    def put(self, event, data):
+        # Может вызываться из любого потока
+        try:
+            self.loop.call_soon_threadsafe(self.put_nowait, (event, data))
+        except RuntimeError:
+            self.close()
+
+    def put_nowait(self, message):
+        try:
+            self.queue.put_nowait(message)
+        except asyncio.QueueFull:
+            while not self.queue.empty():
+                self.queue.get_nowait()
+            self.queue.put_nowait(('resync', {}))
+
+    async def get(self):
+        return await self.queue.get()
+
+    def close(self):
+        self.broker.unsubscribe(self)
+
+
+class LocalBroker:
+    """Брокер в памяти процесса"""
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.subscriptions = defaultdict(set)
+
+    def subscribe(self, channels, maxsize=100):
+        subscription = Subscription(self, channels, maxsize)
+        with self.lock:
+            for channel in channels:
+                self.subscriptions[channel].add(subscription)
+        return subscription
+
+    def unsubscribe(self, subscription):
+        with self.lock:
+            for channel in subscription.channels:
+                self.subscriptions[channel].discard(subscription)
+                if not self.subscriptions[channel]:
+                    del self.subscriptions[channel]
+
+    def publish(self, channel, event, data):
+        self.deliver(channel, event, data)
+
+    def deliver(self, channel, event, data):
+        with self.lock:
+            subscriptions = list(self.subscriptions.get(channel, ()))
+        for subscription in subscriptions:
+            subscription.put(event, data)
+
+
+class PostgresBroker(LocalBroker):
+    """Брокер поверх LISTEN/NOTIFY PostgreSQL.
+
+    Каждый процесс держит одно соединение, которое слушает общий канал, и
+    раздаёт полученные события своим подписчикам. Размер уведомления в
+    PostgreSQL ограничен 8000 байт, поэтому события несут только краткие поля.
+    """
+    pg_channel = 'inquiries_events'
+    reconnect_delay = 5
+
+    def __init__(self):
+        super().__init__()
+        self.listener = None
+
+    def subscribe(self, channels, maxsize=100):
+        with self.lock:
+            if self.listener is None:
+                self.listener = threading.Thread(target=self.listen, name='inquiries-events', daemon=True)
+                self.listener.start()
+        return super().subscribe(channels, maxsize)
+
+    def publish(self, channel, event, data):
+        payload = dumps([channel, event, data]).decode('utf-8')
+        with connection.cursor() as cursor:
+            cursor.execute('SELECT pg_notify(%s, %s)', [self.pg_channel, payload])
+
+    def listen(self):
+        while True:
+            try:
+                listener = connection.get_new_connection(connection.get_connection_params())
+                listener.autocommit = True
+                with listener.cursor() as cursor:
+                    cursor.execute(f'LISTEN {self.pg_channel}')
+                while True:
+                    select.select([listener], [], [], self.reconnect_delay)
+                    listener.poll()
+                    while listener.notifies:
+                        channel, event, data = json.loads(listener.notifies.pop(0).payload)
+                        self.deliver(channel, event, data)
+            except Exception:
+                logger.exception('Соединение LISTEN потеряно, повторное подключение')
+                time.sleep(self.reconnect_delay)
+
+
+broker = None
+
+
+def get_broker():
+    global broker
+    if broker is None:
+        broker = import_string(settings.EVENTS_BROKER)()
+    return broker
+
+
+def user_channel(user_id):
+    return f'user:{user_id}'
+
+
+def publish(user_id, event, data):
+    """Отправляет событие пользователю user_id после фиксации текущей транзакции"""
+    transaction.on_commit(lambda: get_broker().publish(user_channel(user_id), event, data))
+
+
+def todo_changed(todo_id):
+    """Сообщает создателю заявки об изменении её статуса или исполнителя"""
+    todo = ToDo.objects.filter(pk=todo_id).values('inquiry_creator', *TODO_EVENT_FIELDS).first()
+    if todo is not None and todo['inquiry_creator'] is not None:
+        publish(todo.pop('inquiry_creator'), 'todo', todo)
+
+
+def notification_saved(sender, instance, created, **kwargs):
+    if created and instance.notification_recipient_id is not None:
+        publish(instance.notification_recipient_id, 'notification', {
+            'inquiry_id': instance.inquiry_id,
+            'inquiry_title': instance.inquiry_title,
+            'inquiry_created_at': instance.inquiry_created_at,
+            'notification_category': instance.notification_category,
+        })
+
+
+def todo_event_state(instance):
+    # Отложенные поля не загружаются ради сравнения
+    return instance.__dict__.get('todo_status'), instance.__dict__.get('todo_assigned_to_id')
+
+
+def todo_loaded(sender, instance, **kwargs):
+    instance._event_state = todo_event_state(instance)
+
+
+def todo_saved(sender, instance, created, **kwargs):
+    """Публикует событие, только если изменились статус или исполнитель заявки"""
+    state = todo_event_state(instance)
+    previous, instance._event_state = getattr(instance, '_event_state', None), state
+    if not created and state != previous and instance.inquiry_creator_id is not None:
+        publish(instance.inquiry_creator_id, 'todo', {
+            'inquiry_id': instance.inquiry_id,
+            'todo_status': instance.todo_status,
+            'todo_assigned_to': instance.todo_assigned_to_id,
+            'inquiry_updated_at': instance.inquiry_updated_at,
+        })
+
+
+def connect_signals():
+    post_save.connect(notification_saved, sender=Notification)
+    post_init.connect(todo_loaded, sender=ToDo)
+    post_save.connect(todo_saved, sender=ToDo)
@@ -0,0 +1,187 @@
+"""Очередь фоновых заданий в таблице Job.
+
+Задание - функция, зарегистрированная декоратором @job под своим именем;
+в очередь попадают имя и аргументы (JSON), поэтому поставить задание можно
+из любого процесса, а выполняет его обработчик manage.py run_jobs. Строка
+задания вставляется в текущей транзакции и становится видна обработчикам
+только после её фиксации.
+
+Обработчик забирает готовое задание условным UPDATE (в PostgreSQL - после
+SELECT ... FOR UPDATE SKIP LOCKED), так что несколько обработчиков не
+выполнят одно задание дважды. Задание закрепляется за обработчиком на
+JOBS_LEASE секунд, срок продлевается, пока задание выполняется; задание
+обработчика, который завершился аварийно, по истечении срока забирает
+другой обработчик. Ошибка приводит к повтору через retry_delay * 2^n секунд,
+пока не исчерпаны max_attempts попыток. Периодические задания (every)
+ставятся в очередь обработчиком и после выполнения планируются заново.
+"""
+import logging
+import os
+import socket
+import threading
+import traceback
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import IntegrityError, close_old_connections, connection, transaction
+from django.db.models import F, Q
+from django.utils import timezone
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+registry = {}
+
+
+class JobSpec:
+    def __init__(self, func, name, max_attempts, retry_delay, every):
+        self.func = func
+        self.name = name
+        self.max_attempts = max_attempts
+        self.retry_delay = retry_delay
+        self.every = every
+
+
+def job(name=None, max_attempts=1, retry_delay=60, every=None):
+    """Регистрирует функцию как фоновое задание.
+
+    every - период в секундах для заданий, которые обработчик запускает сам.
+    """
+    def decorator(func):
+        spec = JobSpec(func, name or func.__name__, max_attempts, retry_delay, every)
+        registry[spec.name] = spec
+        return func
+    return decorator
+
+
+def enqueue(name, *args, run_at=None, delay=None, key=None):
+    """Ставит задание name с аргументами args в очередь.
+
+    run_at или delay (секунды) откладывают запуск. Задание с ключом key не
+    создаётся, если задание с тем же ключом уже ждёт или выполняется.
+    """
+    spec = registry[name]
+    if run_at is None:
+        run_at = timezone.now() + timedelta(seconds=delay or 0)
+    try:
+        with transaction.atomic():
+            return Job.objects.create(job_name=name, job_args=list(args), job_key=key, job_run_at=run_at,
+                                      job_max_attempts=spec.max_attempts)
+    except IntegrityError:
+        if key is None:
+            raise
+        return None
+
+
+def schedule_periodic():
+    """Ставит в очередь периодические задания, которых в ней ещё нет"""
+    pending = set(Job.objects.filter(job_status__in=('q', 'r'), job_key__in=periodic_keys())
+                  .values_list('job_key', flat=True))
+    for spec in registry.values():
+        if spec.every is not None and spec.name not in pending:
+            enqueue(spec.name, key=spec.name)
+
+
+def periodic_keys():
+    return [spec.name for spec in registry.values() if spec.every is not None]
+
+
+def worker_name():
+    return f'{socket.gethostname()}:{os.getpid()}'
+
+
+def due(now):
+    # Готовые задания и задания, срок закрепления которых истёк
+    return Q(job_status='q', job_run_at__lte=now) | Q(job_status='r', job_locked_until__lt=now)
+
+
+def claim(worker):
+    """Закрепляет за обработчиком worker ближайшее готовое задание"""
+    now = timezone.now()
+    with transaction.atomic():
+        candidate = Job.objects.select_for_update(skip_locked=True).filter(due(now)) \
+            .order_by('job_run_at').values_list('pk', flat=True).first()
+        if candidate is None:
+            return None
+        claimed = Job.objects.filter(due(now), pk=candidate).update(
+            job_status='r', job_attempts=F('job_attempts') + 1, job_locked_by=worker,
+            job_locked_until=now + timedelta(seconds=settings.JOBS_LEASE))
+    if not claimed:
+        return None
+    return Job.objects.get(pk=candidate)
+
+
+class Heartbeat(threading.Thread):
+    """Продлевает закрепление задания, пока оно выполняется"""
+    def __init__(self, job, worker):
+        super().__init__(name=f'job-{job.pk}-heartbeat', daemon=True)
+        self.job = job
+        self.worker = worker
+        self.stopped = threading.Event()
+
+    def run(self):
+        try:
+            while not self.stopped.wait(settings.JOBS_LEASE / 3):
+                Job.objects.filter(pk=self.job.pk, job_status='r', job_locked_by=self.worker).update(
+                    job_locked_until=timezone.now() + timedelta(seconds=settings.JOBS_LEASE))
+        finally:
+            connection.close()
+
+    def stop(self):
+        self.stopped.set()
+        self.join()
+
+
+def finish(job, worker, **fields):
+    spec = registry.get(job.job_name)
+    with transaction.atomic():
+        Job.objects.filter(pk=job.pk, job_locked_by=worker).update(job_locked_until=None, **fields)
+        if spec is not None and spec.every is not None and fields['job_status'] in ('d', 'f'):
+            enqueue(spec.name, key=spec.name, delay=spec.every)
+
+
+def execute(job, worker):
+    """Выполняет закреплённое задание и записывает результат"""
+    spec = registry.get(job.job_name)
+    if spec is None:
+        return finish(job, worker, job_status='f', job_finished_at=timezone.now(),
+                      job_error=f'Задание {job.job_name} не зарегистрировано')
+    if job.job_attempts > job.job_max_attempts:
+        # Попытки исчерпаны обработчиками, которые не дожили до конца задания
+        return finish(job, worker, job_status='f', job_finished_at=timezone.now(),
+                      job_error='Обработчик задания завершился аварийно')
+
+    heartbeat = Heartbeat(job, worker)
+    heartbeat.start()
+    try:
+        spec.func(*job.job_args)
+        result = {'job_status': 'd', 'job_finished_at': timezone.now()}
+    except Exception:
+        logger.exception('Задание %s (%s) завершилось ошибкой', job.pk, job.job_name)
+        result = {'job_error': traceback.format_exc()}
+        if job.job_attempts < job.job_max_attempts:
+            delay = spec.retry_delay * 2 ** (job.job_attempts - 1)
+            result.update(job_status='q', job_run_at=timezone.now() + timedelta(seconds=delay))
+        else:
+            result.update(job_status='f', job_finished_at=timezone.now())
+    finally:
+        heartbeat.stop()
+    finish(job, worker, **result)
+
+
+def run_next(worker):
+    """Выполняет одно готовое задание; возвращает False, если готовых заданий нет"""
+    close_old_connections()
+    job = claim(worker)
+    if job is None:
+        return False
+    execute(job, worker)
+    return True
+
+
+@job(every=24 * 60 * 60)
+def delete_finished_jobs():
+    """Удаляет успешно выполненные задания старше JOBS_KEEP_DAYS дней"""
+    Job.objects.filter(job_status='d', job_finished_at__lt=timezone.now() - timedelta(days=settings.JOBS_KEEP_DAYS)) \
+        .delete()
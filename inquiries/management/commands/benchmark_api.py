@@ -0,0 +1,266 @@
+import hashlib
+import json
+import os
+import platform
+import subprocess
+import tempfile
+import time
+from collections import Counter, namedtuple
+from datetime import timedelta
+
+import django
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection, transaction
+from django.test import Client
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.urls import URLPattern, resolve
+from django.utils import timezone
+
+from auth import urls as auth_urls
+from auth.serializers import MyTokenObtainPairSerializer
+from inquiries import urls as inquiries_urls
+from inquiries.management.commands.seed_building import USERNAME_PREFIX
+from inquiries.models import ToDo, Announcement, Notification, NotificationFanout, Poll, VoteOption, File, FileUpload
+
+Scenario = namedtuple('Scenario', 'name role method path kwargs')
+
+PNG = (b'\x89PNG\r\n\x1a\n\x00\x00\x00\rIHDR\x00\x00\x00\x01\x00\x00\x00\x01\x08\x06\x00\x00\x00\x1f\x15\xc4\x89'
+       b'\x00\x00\x00\rIDATx\x9cc\xf8\xff\xff?\x00\x05\xfe\x02\xfe\xa7\x35\x81\x84\x00\x00\x00\x00IEND\xaeB`\x82')
+UPLOAD = b'benchmark upload\n'
+# Настройки, от которых зависят результаты, записываются вместе с ними
+SETTINGS = ('DEBUG', 'JSON_ENCODER', 'JWT_ROLE_CLAIMS', 'COMPRESSION_MIN_SIZE')
+
+
+def percentile(values, fraction):
+    # Ближайший ранг по отсортированному списку
+    return values[min(len(values) - 1, max(0, round(fraction * len(values)) - 1))]
+
+
+def git_commit():
+    try:
+        return subprocess.run(['git', 'rev-parse', '--short', 'HEAD'], capture_output=True, text=True,
+                              cwd=settings.BASE_DIR, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def test_host():
+    for host in settings.ALLOWED_HOSTS:
+        if host == '*':
+            return 'localhost'
+        return host.lstrip('.')
+    return 'localhost'
+
+
+class Command(BaseCommand):
+    help = ('Замеряет задержку, пропускную способность и число запросов к БД для всех адресов inquiries/urls.py '
+            'и auth/urls.py на данных manage.py seed_building. Изменения базы откатываются, а файлы сохраняются '
+            'во временный MEDIA_ROOT, который удаляется после замеров')
+
+    def add_arguments(self, parser):
+        parser.add_argument('--requests', type=int, default=20, help='Замеров на сценарий (по умолчанию 20)')
+        parser.add_argument('--warmup', type=int, default=3, help='Запросов для разогрева (по умолчанию 3)')
+        parser.add_argument('--only', help='Выполнить только сценарии, в имени которых есть эта строка')
+        parser.add_argument('--password', default='password',
+                            help='Пароль пользователей seed_building для входа (по умолчанию password)')
+        parser.add_argument('--output', help='Записать результаты в JSON-файл')
+        parser.add_argument('--compare', help='Сравнить с результатами из JSON-файла (например, другого коммита)')
+
+    def handle(self, *args, **options):
+        if options['requests'] <= 0 or options['warmup'] < 0:
+            raise CommandError('--requests должно быть положительным, --warmup - неотрицательным')
+        baseline = None
+        if options['compare']:
+            with open(options['compare'], encoding='utf-8') as source:
+                baseline = {result['name']: result for result in json.load(source)['results']}
+
+        # Все изменения базы, включая сделанные представлениями, откатываются. Откат не удаляет
+        # файлы, поэтому загрузки и части загрузок пишутся во временный каталог (для хранилища
+        # вне файловой системы, заданного DEFAULT_FILE_STORAGE, это не действует).
+        with tempfile.TemporaryDirectory(prefix='benchmark-media-') as media_root, \
+                override_settings(MEDIA_ROOT=media_root, FILE_UPLOAD_PARTS_DIR=os.path.join(media_root, 'uploads')), \
+                transaction.atomic():
+            scenarios = self.prepare(options['password'])
+            self.check_coverage(scenarios)
+            if options['only']:
+                scenarios = [scenario for scenario in scenarios if options['only'] in scenario.name]
+            results = [self.measure(scenario, options['requests'], options['warmup']) for scenario in scenarios]
+            transaction.set_rollback(True)
+
+        self.report(results, baseline)
+        if options['output']:
+            document = {
+                'meta': {
+                    'commit': git_commit(),
+                    'created_at': timezone.now().isoformat(),
+                    'database': connection.vendor,
+                    'python': platform.python_version(),
+                    'django': django.get_version(),
+                    'requests': options['requests'],
+                    'settings': {name: getattr(settings, name) for name in SETTINGS},
+                },
+                'results': results,
+            }
+            with open(options['output'], 'w', encoding='utf-8') as target:
+                json.dump(document, target, ensure_ascii=False, indent=2)
+            self.stdout.write(f'Результаты записаны в {options["output"]}')
+
+    def client(self, user):
+        access = MyTokenObtainPairSerializer.get_token(user).access_token
+        return Client(HTTP_HOST=test_host(), HTTP_AUTHORIZATION=f'Bearer {access}')
+
+    def prepare(self, password):
+        seeded = User.objects.filter(username__startswith=USERNAME_PREFIX).select_related('profile').order_by('pk')
+        manager = seeded.filter(profile__is_manager=True).first()
+        resident = seeded.filter(profile__is_manager=False, inquiry__todo__isnull=False).first()
+        if manager is None or resident is None:
+            raise CommandError('Нет данных для замеров: сначала выполните manage.py seed_building')
+        self.clients = {'resident': self.client(resident), 'manager': self.client(manager), 'anonymous': Client(
+            HTTP_HOST=test_host())}
+
+        todo = ToDo.objects.filter(inquiry_creator=resident).order_by('-pk').first()
+        new_todo = ToDo.objects.filter(todo_status='n').order_by('-pk').first() or todo
+        announcement = Announcement.objects.filter(announcement_is_visible=True).order_by('-pk').first()
+        notification = Notification.objects.filter(notification_recipient=resident).order_by('-pk').first()
+        fanout = NotificationFanout.objects.order_by('-pk').first()
+        poll = Poll.objects.filter(poll_is_closed=False, poll_deadline__gt=timezone.now(), voteoption__isnull=False) \
+            .exclude(vote__voter=resident).order_by('-pk').first()
+        if poll is None:
+            # Иначе POST /vote замерял бы только отказ 403
+            poll = Poll.objects.create(inquiry_title='Замер голосования', inquiry_text='Голосование для замеров',
+                                       inquiry_creator=manager, poll_deadline=timezone.now() + timedelta(days=1))
+            VoteOption.objects.create(poll=poll, vote_option_text='За')
+        option = VoteOption.objects.filter(poll=poll).order_by('pk').first()
+        file = File(file_name='benchmark.png')
+        file.file.save('benchmark.png', SimpleUploadedFile('benchmark.png', PNG), save=False)
+        file.save()
+        upload = FileUpload.objects.create(upload_creator=resident, upload_filename='benchmark.txt',
+                                           upload_size=len(UPLOAD), upload_checksum=hashlib.sha256(UPLOAD).hexdigest())
+        refresh = str(MyTokenObtainPairSerializer.get_token(resident))
+        def png():
+            return {'data': {'file': SimpleUploadedFile('photo.png', PNG, content_type='image/png')}}
+
+        def as_json(data):
+            return {'data': json.dumps(data), 'content_type': 'application/json'}
+
+        return [
+            Scenario('GET /user', 'resident', 'get', '/user', {}),
+            Scenario('PUT /user', 'resident', 'put', '/user', as_json({
+                'first_name': resident.first_name, 'last_name': resident.last_name, 'email': resident.email,
+                'phone_number': resident.profile.phone_number})),
+            Scenario('GET /users', 'manager', 'get', '/users', {}),
+            Scenario('GET /todos', 'resident', 'get', '/todos', {}),
+            Scenario('GET /todos', 'manager', 'get', '/todos', {}),
+            Scenario('GET /todos?inquiry_title', 'manager', 'get', '/todos', {'data': {'inquiry_title': 'Протечка'}}),
+            Scenario('GET /todos?stream=ndjson', 'manager', 'get', '/todos', {'data': {'stream': 'ndjson'}}),
+            Scenario('POST /todos', 'resident', 'post', '/todos', as_json({
+                'inquiry_title': 'Протечка в ванной', 'inquiry_text': 'Течёт кран', 'todo_category': '1'})),
+            Scenario('GET /todos/<pk>', 'resident', 'get', f'/todos/{todo.pk}', {}),
+            Scenario('PUT /todos/<pk>', 'manager', 'put', f'/todos/{new_todo.pk}', as_json({
+                'todo_assigned_to': manager.pk, 'todo_status': 'w'})),
+            Scenario('POST /comments/<inquiry_id>', 'resident', 'post', f'/comments/{todo.pk}', as_json({
+                'inquiry': todo.pk, 'comment_text': 'Проблема повторяется.'})),
+            Scenario('GET /announcements', 'resident', 'get', '/announcements', {}),
+            Scenario('POST /announcements', 'resident', 'post', '/announcements', as_json({
+                'inquiry_title': 'Продам велосипед', 'inquiry_text': 'Недорого', 'announcement_is_visible': True,
+                'announcement_auto_invisible_date': timezone.now().date().isoformat(), 'announcement_category': '0'})),
+            Scenario('GET /announcements/<pk>', 'resident', 'get', f'/announcements/{announcement.pk}', {}),
+            Scenario('GET /notifications', 'resident', 'get', '/notifications', {}),
+            Scenario('GET /notifications/<pk>', 'resident', 'get', f'/notifications/{notification.pk}', {}),
+            Scenario('PUT /notifications/<pk>', 'resident', 'put', f'/notifications/{notification.pk}', {}),
+            Scenario('GET /notifications/unread_count', 'resident', 'get', '/notifications/unread_count', {}),
+            Scenario('POST /notifications/read', 'resident', 'post', '/notifications/read', as_json({
+                'before': timezone.now().isoformat()})),
+            Scenario('POST /notifications/fanout', 'manager', 'post', '/notifications/fanout', as_json({
+                'inquiry_title': 'Отключение воды', 'inquiry_text': 'С 10 до 14', 'notification_category': '0',
+                'property_entrance_number': 1})),
+            Scenario('GET /notifications/fanout/<pk>', 'manager', 'get', f'/notifications/fanout/{fanout.pk}', {}),
+            Scenario('GET /polls', 'resident', 'get', '/polls', {}),
+            Scenario('GET /polls/<pk>', 'resident', 'get', f'/polls/{poll.pk}', {}),
+            Scenario('GET /voteoptions', 'resident', 'get', '/voteoptions', {}),
+            Scenario('POST /vote', 'resident', 'post', '/vote', as_json({'selected_option': option.pk})),
+            Scenario('GET /info', 'resident', 'get', '/info', {}),
+            Scenario('POST /upload', 'resident', 'post', '/upload', {'data_factory': png}),
+            Scenario('POST /files', 'resident', 'post', '/files', {'data_factory': png}),
+            Scenario('GET /files/<pk>', 'resident', 'get', f'/files/{file.pk}', {}),
+            Scenario('GET /files/<pk>/content', 'resident', 'get', f'/files/{file.pk}/content', {}),
+            Scenario('POST /uploads', 'resident', 'post', '/uploads', as_json({
+                'upload_filename': 'plan.pdf', 'upload_size': 1024, 'upload_checksum': '0' * 64})),
+            Scenario('GET /uploads/<pk>', 'resident', 'get', f'/uploads/{upload.pk}', {}),
+            Scenario('PATCH /uploads/<pk>', 'resident', 'patch', f'/uploads/{upload.pk}', {
+                'data': UPLOAD, 'content_type': 'application/offset+octet-stream', 'HTTP_UPLOAD_OFFSET': '0'}),
+            Scenario('POST /photo/<pk>', 'resident', 'post', f'/photo/{resident.pk}', {'data_factory': png}),
+            Scenario('GET /metrics', 'manager', 'get', '/metrics', {}),
+            Scenario('POST /auth/login', 'anonymous', 'post', '/auth/login', as_json({
+                'username': resident.username, 'password': password})),
+            Scenario('POST /auth/login/refresh', 'anonymous', 'post', '/auth/login/refresh', as_json({
+                'refresh': refresh})),
+            Scenario('POST /auth/register', 'anonymous', 'post', '/auth/register', as_json({
+                'username': 'benchmark-user', 'password': 'Kv7#tq!Lm2pz', 'password2': 'Kv7#tq!Lm2pz',
+                'email': 'benchmark@example.com', 'first_name': 'Замер', 'last_name': 'Нагрузки'})),
+        ]
+
+    def check_coverage(self, scenarios):
+        """Предупреждает об адресах без сценария, например добавленных после этой команды"""
+        covered = {resolve(scenario.path).func for scenario in scenarios}
+        for urls in (inquiries_urls, auth_urls):
+            for pattern in urls.urlpatterns:
+                if isinstance(pattern, URLPattern) and pattern.callback not in covered:
+                    self.stderr.write(self.style.WARNING(f'Нет сценария для {urls.__name__}: {pattern.pattern}'))
+
+    def request(self, scenario):
+        kwargs = dict(scenario.kwargs)
+        data_factory = kwargs.pop('data_factory', None)
+        if data_factory is not None:
+            kwargs.update(data_factory())
+        response = getattr(self.clients[scenario.role], scenario.method)(scenario.path, **kwargs)
+        if response.streaming:
+            b''.join(response.streaming_content)
+        return response.status_code
+
+    def measure(self, scenario, requests, warmup):
+        for _ in range(warmup):
+            with transaction.atomic():
+                self.request(scenario)
+                transaction.set_rollback(True)
+
+        durations, queries, statuses = [], [], Counter()
+        started = time.perf_counter()
+        for _ in range(requests):
+            # Каждый запрос видит одно и то же состояние базы
+            with transaction.atomic():
+                with CaptureQueriesContext(connection) as captured:
+                    request_started = time.perf_counter()
+                    statuses[self.request(scenario)] += 1
+                    durations.append(time.perf_counter() - request_started)
+                queries.append(len(captured))
+                transaction.set_rollback(True)
+        elapsed = time.perf_counter() - started
+
+        durations.sort()
+        return {
+            'name': f'{scenario.name} [{scenario.role}]',
+            'requests': requests,
+            'status': {str(code): count for code, count in sorted(statuses.items())},
+            'p50_ms': round(percentile(durations, 0.50) * 1000, 3),
+            'p95_ms': round(percentile(durations, 0.95) * 1000, 3),
+            'p99_ms': round(percentile(durations, 0.99) * 1000, 3),
+            'throughput_rps': round(requests / elapsed, 1),
+            'queries': max(queries),
+        }
+
+    def report(self, results, baseline):
+        self.stdout.write(f'{"сценарий":52} {"статус":>8} {"p50 мс":>9} {"p95 мс":>9} {"p99 мс":>9} '
+                          f'{"запр/с":>8} {"БД":>4}')
+        for result in results:
+            line = (f'{result["name"]:52} {",".join(result["status"]):>8} {result["p50_ms"]:9.2f} '
+                    f'{result["p95_ms"]:9.2f} {result["p99_ms"]:9.2f} {result["throughput_rps"]:8.1f} '
+                    f'{result["queries"]:4}')
+            before = baseline.get(result['name']) if baseline else None
+            if before is not None:
+                change = (result['p50_ms'] - before['p50_ms']) / before['p50_ms'] * 100 if before['p50_ms'] else 0
+                line += f'  p50 {change:+.0f}%, БД {result["queries"] - before["queries"]:+d}'
+            self.stdout.write(line)
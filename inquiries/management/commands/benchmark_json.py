@@ -0,0 +1,50 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inquiries.compression import ENCODINGS, compress
+from inquiries.encoding import BACKENDS, orjson
+from inquiries.management.commands.benchmark_serializers import ENDPOINTS
+
+
+def dumps_django(data, encoder_class):
+    # Кодирование django.http.JsonResponse: ASCII с экранированием \uXXXX
+    return json.dumps(data, cls=encoder_class).encode('utf-8')
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает время кодирования и размер JSON списков заявок для доступных кодировщиков и алгоритмов сжатия'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Строк в списке (по умолчанию 1000)')
+        parser.add_argument('--repeat', type=int, default=20, help='Повторов для каждого замера (по умолчанию 20)')
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--rows и --repeat должны быть положительными')
+        encoders = {'django': dumps_django, 'json': BACKENDS['json']}
+        if orjson is not None:
+            encoders['orjson'] = BACKENDS['orjson']
+
+        for endpoint, model, _, values_serializer_class in ENDPOINTS:
+            queryset = model.objects.order_by('-inquiry_created_at', '-inquiry_id')[:options['rows']]
+            data = values_serializer_class(values_serializer_class.setup_eager_loading(queryset), many=True).data
+            if not data:
+                self.stdout.write(f'{endpoint}: нет записей')
+                continue
+            self.stdout.write(f'{endpoint}: {len(data)} строк')
+            for name, encode in encoders.items():
+                best = None
+                for _ in range(options['repeat']):
+                    started = time.perf_counter()
+                    body = encode(data, DjangoJSONEncoder)
+                    elapsed = time.perf_counter() - started
+                    best = elapsed if best is None else min(best, elapsed)
+                self.stdout.write(f'  {name:8} {best * 1000:8.2f} мс {len(body):10} байт')
+            for encoding in ENCODINGS:
+                started = time.perf_counter()
+                compressed = compress(body, encoding)
+                elapsed = time.perf_counter() - started
+                self.stdout.write(f'  +{encoding:7} {elapsed * 1000:8.2f} мс {len(compressed):10} байт')
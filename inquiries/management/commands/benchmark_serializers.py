@@ -0,0 +1,52 @@
+import json
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+from django.core.serializers.json import DjangoJSONEncoder
+
+from inquiries.models import ToDo, Announcement, Notification
+from inquiries.serializers import ToDoListSerializer, AnnouncementListSerializer, NotificationSerializer
+from inquiries.values_serializers import ToDoListValuesSerializer, AnnouncementListValuesSerializer, \
+    NotificationValuesSerializer
+
+ENDPOINTS = (
+    ('/todos', ToDo, ToDoListSerializer, ToDoListValuesSerializer),
+    ('/announcements', Announcement, AnnouncementListSerializer, AnnouncementListValuesSerializer),
+    ('/notifications', Notification, NotificationSerializer, NotificationValuesSerializer),
+)
+
+
+def measure(serializer_class, queryset, repeat):
+    """Лучшее время запроса, сериализации и кодирования JSON списка queryset"""
+    best = None
+    for _ in range(repeat):
+        started = time.perf_counter()
+        page = serializer_class.setup_eager_loading(queryset)
+        body = json.dumps(serializer_class(page, many=True).data, cls=DjangoJSONEncoder)
+        elapsed = time.perf_counter() - started
+        best = elapsed if best is None else min(best, elapsed)
+    return best, body
+
+
+class Command(BaseCommand):
+    help = 'Сравнивает скорость сериализаторов DRF и сериализаторов строк values() на списках заявок'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--rows', type=int, default=1000, help='Строк в списке (по умолчанию 1000)')
+        parser.add_argument('--repeat', type=int, default=5, help='Повторов для каждого замера (по умолчанию 5)')
+
+    def handle(self, *args, **options):
+        if options['rows'] <= 0 or options['repeat'] <= 0:
+            raise CommandError('--rows и --repeat должны быть положительными')
+        for endpoint, model, serializer_class, values_serializer_class in ENDPOINTS:
+            queryset = model.objects.order_by('-inquiry_created_at', '-inquiry_id')[:options['rows']]
+            rows = queryset.count()
+            if not rows:
+                self.stdout.write(f'{endpoint}: нет записей')
+                continue
+            drf, expected = measure(serializer_class, queryset, options['repeat'])
+            values, actual = measure(values_serializer_class, queryset, options['repeat'])
+            if actual != expected:
+                raise CommandError(f'{endpoint}: ответы сериализаторов различаются')
+            self.stdout.write(f'{endpoint}: {rows} строк, DRF {rows / drf:.0f} строк/с, '
+                              f'values() {rows / values:.0f} строк/с, ускорение {drf / values:.1f}x')
@@ -0,0 +1,44 @@
+import os
+import time
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand, CommandError
+
+from inquiries.models import File
+from inquiries.storage import BLOB_DIR, ContentAddressedStorage
+
+
+class Command(BaseCommand):
+    help = 'Удаляет содержимое файлов, на которое не ссылается ни одна строка File'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--dry-run', action='store_true', help='Только показать, что будет удалено')
+        parser.add_argument('--grace', type=int, default=60,
+                            help='Не удалять blob, изменённые за последние GRACE минут (по умолчанию 60)')
+
+    def handle(self, *args, **options):
+        if not isinstance(default_storage, ContentAddressedStorage):
+            raise CommandError('Хранилище файлов не адресуется по содержимому')
+
+        # Ссылки читаются до обхода каталога: blob, появившиеся позже, моложе --grace.
+        # Брошенные временные файлы (*.tmp) тоже ни на что не ссылаются.
+        referenced = set(File.objects.values_list('file', flat=True))
+        for thumbnails in File.objects.exclude(file_thumbnails={}).values_list('file_thumbnails', flat=True):
+            referenced.update(thumbnails.values())
+
+        threshold = time.time() - options['grace'] * 60
+        removed = freed = 0
+        for directory, _, filenames in os.walk(default_storage.path(BLOB_DIR)):
+            for filename in filenames:
+                path = os.path.join(directory, filename)
+                name = os.path.relpath(path, default_storage.location).replace(os.sep, '/')
+                if name in referenced or os.path.getmtime(path) >= threshold:
+                    continue
+                size = os.path.getsize(path)
+                if not options['dry_run']:
+                    os.remove(path)
+                removed += 1
+                freed += size
+                self.stdout.write(name)
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(f'{action}: {removed} ({freed} байт)'))
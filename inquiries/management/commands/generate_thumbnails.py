@@ -0,0 +1,22 @@
+from django.core.management.base import BaseCommand
+
+from inquiries.jobs import enqueue
+from inquiries.models import File
+
+
+class Command(BaseCommand):
+    help = 'Ставит в очередь создание уменьшенных копий фотографий профиля'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--all', action='store_true',
+                            help='Пересоздать копии и для фотографий, у которых они уже есть')
+
+    def handle(self, *args, **options):
+        photos = File.objects.filter(profile__isnull=False)
+        if not options['all']:
+            photos = photos.filter(file_thumbnails={})
+        queued = 0
+        for file_id in photos.values_list('pk', flat=True).iterator():
+            enqueue('generate_thumbnails', file_id)
+            queued += 1
+        self.stdout.write(self.style.SUCCESS(f'Поставлено в очередь: {queued}'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from inquiries.search import create_search_table, delete_search_document, update_search_document
+
+
+class Command(BaseCommand):
+    help = 'Пересобирает поисковый индекс заявок и комментариев'
+
+    def handle(self, *args, **options):
+        create_search_table()
+        with transaction.atomic():
+            delete_search_document()
+            update_search_document()
+        self.stdout.write(self.style.SUCCESS('Поисковый индекс пересобран'))
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from inquiries.models import Notification, Profile
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики непрочитанных уведомлений пользователей по таблице уведомлений'
+
+    def handle(self, *args, **options):
+        unread = Notification.objects.filter(notification_recipient=OuterRef('user'), notification_is_read=False) \
+            .order_by().values('notification_recipient').annotate(count=Count('pk')).values('count')
+        updated = Profile.objects.update(unread_notification_count=Coalesce(Subquery(unread), Value(0)))
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано профилей: {updated}'))
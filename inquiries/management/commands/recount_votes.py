@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+from django.db.models import Count, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+from inquiries.models import Vote, VoteOption
+
+
+class Command(BaseCommand):
+    help = 'Пересчитывает счётчики голосов у вариантов голосования по таблице голосов'
+
+    def handle(self, *args, **options):
+        votes = Vote.objects.filter(selected_option=OuterRef('pk')).order_by().values('selected_option') \
+            .annotate(count=Count('pk')).values('count')
+        updated = VoteOption.objects.update(vote_option_vote_count=Coalesce(Subquery(votes), Value(0)))
+        self.stdout.write(self.style.SUCCESS(f'Пересчитано вариантов: {updated}'))
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from inquiries.cache import get_stats
+
+
+class Command(BaseCommand):
+    help = 'Показывает попадания и промахи кэша ответов'
+
+    def handle(self, *args, **options):
+        for endpoint, stats in get_stats().items():
+            total = stats['hit'] + stats['miss']
+            ratio = stats['hit'] * 100 / total if total else 0
+            self.stdout.write(f"{endpoint}: попаданий {stats['hit']}, промахов {stats['miss']} ({ratio:.1f}%)")
@@ -0,0 +1,41 @@
+import logging
+import signal
+import threading
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from inquiries import business_logic, thumbnails, uploads  # noqa: F401 - регистрируют задания
+from inquiries.jobs import run_next, schedule_periodic, worker_name
+
+logger = logging.getLogger(__name__)
+
+
+class Command(BaseCommand):
+    help = 'Выполняет фоновые задания из очереди'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--once', action='store_true',
+                            help='Выполнить готовые задания и завершиться')
+
+    def handle(self, *args, **options):
+        stopped = threading.Event()
+        # Текущее задание завершается, новые не забираются
+        signal.signal(signal.SIGTERM, lambda signum, frame: stopped.set())
+        signal.signal(signal.SIGINT, lambda signum, frame: stopped.set())
+
+        worker = worker_name()
+        self.stdout.write(f'Обработчик {worker} запущен')
+        executed = 0
+        while not stopped.is_set():
+            try:
+                schedule_periodic()
+                if run_next(worker):
+                    executed += 1
+                    continue
+            except Exception:
+                logger.exception('Ошибка обработчика фоновых заданий')
+            if options['once']:
+                break
+            stopped.wait(settings.JOBS_POLL_INTERVAL)
+        self.stdout.write(self.style.SUCCESS(f'Выполнено заданий: {executed}'))
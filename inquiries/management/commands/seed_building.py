@@ -0,0 +1,270 @@
+import random
+from datetime import timedelta
+
+from django.contrib.auth.hashers import make_password
+from django.contrib.auth.models import User
+from django.core.management import call_command
+from django.core.management.base import BaseCommand, CommandError
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import Max
+from django.utils import timezone
+
+from inquiries.cache import INVALIDATED_BY, invalidate
+from inquiries.models import Profile, Property, Ownership, Inquiry, ToDo, Comment, Announcement, Poll, VoteOption, \
+    Vote, Notification, NotificationFanout, Info
+
+USERNAME_PREFIX = 'seed-'
+BATCH_SIZE = 1000
+
+STREET = 'Садовая'
+FIRST_NAMES = ('Александр', 'Мария', 'Дмитрий', 'Анна', 'Сергей', 'Елена', 'Андрей', 'Ольга', 'Иван', 'Наталья',
+               'Михаил', 'Татьяна', 'Алексей', 'Светлана', 'Николай', 'Ирина')
+LAST_NAMES = ('Иванов', 'Смирнов', 'Кузнецов', 'Попов', 'Васильев', 'Петров', 'Соколов', 'Михайлов', 'Новиков',
+              'Фёдоров', 'Морозов', 'Волков', 'Алексеев', 'Лебедев', 'Семёнов', 'Егоров')
+TODO_TITLES = {
+    '1': ('Протечка в ванной', 'Засор канализации', 'Нет горячей воды', 'Капает кран на кухне', 'Течёт стояк'),
+    '2': ('Не работает розетка', 'Перегорела лампа в подъезде', 'Выбивает автомат', 'Нет света на этаже'),
+    '3': ('Трещина в стене', 'Отходит плитка', 'Не закрывается окно в подъезде', 'Сломана дверь тамбура'),
+    '4': ('Лифт не работает', 'Лифт застревает между этажами', 'Не горит кнопка вызова лифта'),
+    '5': ('Не убран снег во дворе', 'Сломана скамейка', 'Переполнены мусорные баки', 'Яма на парковке'),
+}
+COMMENTS = ('Подтверждаю, у соседей то же самое.', 'Мастер придёт завтра с 10 до 12.', 'Проблема повторяется.',
+            'Спасибо, всё исправили.', 'Когда будет выполнено?', 'Заявка передана подрядчику.')
+ANNOUNCEMENT_TITLES = {
+    '0': ('Продам детскую коляску', 'Куплю гараж рядом с домом', 'Отдам книги даром'),
+    '1': ('Сдаётся машиноместо', 'Сниму квартиру в нашем доме', 'Сдаётся кладовая'),
+    '2': ('Ремонт кровли', 'Покраска подъезда', 'Замена окон на лестнице'),
+    '3': ('Отключение горячей воды', 'Плановое отключение электричества', 'Отключение отопления'),
+}
+POLL_TITLES = ('Установка шлагбаума', 'Выбор подрядчика для ремонта подъезда', 'Озеленение двора',
+               'Установка камер видеонаблюдения', 'Замена лифтов')
+POLL_OPTIONS = ('За', 'Против', 'Воздержался', 'Перенести решение', 'Нужны дополнительные сметы')
+NOTIFICATION_TITLES = {
+    '0': ('Собрание собственников', 'Уборка подъезда', 'Дезинсекция подвала'),
+    '1': ('Квитанция за месяц', 'Напоминание об оплате', 'Задолженность по оплате'),
+    '2': ('Передайте показания счётчиков', 'Поверка счётчиков воды'),
+}
+TEXT = ('Подробности у управляющего. Просим отнестись с пониманием и сообщать о проблемах '
+        'через приложение.')
+
+
+def batches(rows):
+    for start in range(0, len(rows), BATCH_SIZE):
+        yield rows[start:start + BATCH_SIZE]
+
+
+def insert(model, rows):
+    """Вставляет строки (attname -> значение) только в таблицу model.
+
+    В отличие от bulk_create работает с дочерними моделями многотабличного
+    наследования и не заменяет даты auto_now/auto_now_add текущим временем.
+    Сигналы не отправляются.
+    """
+    fields = model._meta.local_concrete_fields
+    quote = connection.ops.quote_name
+    sql = 'INSERT INTO {} ({}) VALUES ({})'.format(
+        quote(model._meta.db_table), ', '.join(quote(field.column) for field in fields),
+        ', '.join(['%s'] * len(fields)))
+    with connection.cursor() as cursor:
+        for batch in batches(rows):
+            cursor.executemany(sql, [
+                [field.get_db_prep_save(row[field.attname] if field.attname in row else field.get_default(),
+                                        connection) for field in fields]
+                for row in batch])
+
+
+class Command(BaseCommand):
+    help = 'Заполняет базу данными многоквартирного дома для нагрузочных замеров (manage.py benchmark_api)'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--seed', type=int, default=1, help='Зерно генератора: одинаковые параметры дают одинаковые данные')
+        parser.add_argument('--entrances', type=int, default=6, help='Подъездов (по умолчанию 6)')
+        parser.add_argument('--floors', type=int, default=9, help='Этажей (по умолчанию 9)')
+        parser.add_argument('--flats', type=int, default=4, help='Квартир на этаже (по умолчанию 4)')
+        parser.add_argument('--commercial', type=int, default=10, help='Коммерческих помещений (по умолчанию 10)')
+        parser.add_argument('--managers', type=int, default=3, help='Управляющих (по умолчанию 3)')
+        parser.add_argument('--todos', type=int, default=5000, help='Заявок на исполнение (по умолчанию 5000)')
+        parser.add_argument('--comments', type=int, default=3, help='Комментариев на заявку в среднем (по умолчанию 3)')
+        parser.add_argument('--announcements', type=int, default=500, help='Объявлений (по умолчанию 500)')
+        parser.add_argument('--polls', type=int, default=30, help='Голосований (по умолчанию 30)')
+        parser.add_argument('--turnout', type=float, default=0.6, help='Доля проголосовавших жителей (по умолчанию 0.6)')
+        parser.add_argument('--notifications', type=int, default=20,
+                            help='Уведомлений на жителя (по умолчанию 20)')
+        parser.add_argument('--days', type=int, default=365, help='За сколько дней создаются записи (по умолчанию 365)')
+        parser.add_argument('--password', default='password', help='Пароль всех созданных пользователей')
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=USERNAME_PREFIX).exists():
+            raise CommandError(f'В базе уже есть пользователи {USERNAME_PREFIX}*: данные нужно создавать в пустой базе')
+        if min(options['managers'], options['entrances'], options['floors'], options['flats'], options['days']) <= 0:
+            raise CommandError('--managers, --entrances, --floors, --flats и --days должны быть положительными')
+        self.rng = random.Random(options['seed'])
+        self.now = timezone.now()
+        self.options = options
+
+        with transaction.atomic():
+            managers, residents = self.create_users()
+            self.create_properties(residents)
+            self.next_inquiry_id = (Inquiry.objects.aggregate(max=Max('pk'))['max'] or 0) + 1
+            self.next_comment_id = (Comment.objects.aggregate(max=Max('pk'))['max'] or 0) + 1
+            self.create_todos(managers, residents)
+            self.create_announcements(managers, residents)
+            self.create_polls(managers, residents)
+            self.create_notifications(managers, residents)
+            Info.objects.bulk_create(Info(info_title=title, info_text=TEXT) for title in (
+                'Аварийная служба', 'Часы приёма управляющего', 'Реквизиты для оплаты'))
+            with connection.cursor() as cursor:
+                for sql in connection.ops.sequence_reset_sql(no_style(), [Inquiry, Comment]):
+                    cursor.execute(sql)
+
+        # Счётчики и поисковый индекс обновляют сигналы, а строки вставлены без них
+        call_command('recount_votes', stdout=self.stdout)
+        call_command('recount_unread_notifications', stdout=self.stdout)
+        call_command('rebuild_search_index', stdout=self.stdout)
+        invalidate(*{endpoint for endpoints in INVALIDATED_BY.values() for endpoint in endpoints})
+        if connection.vendor == 'postgresql':
+            with connection.cursor() as cursor:
+                cursor.execute('ANALYZE')
+        self.stdout.write(self.style.SUCCESS(
+            f'Создано: управляющих {len(managers)}, жителей {len(residents)}, заявок {options["todos"]}, '
+            f'объявлений {options["announcements"]}, голосований {options["polls"]}; '
+            f'пароль пользователей {USERNAME_PREFIX}*: {options["password"]}'))
+
+    def moment(self, days=None):
+        """Случайный момент за последние days дней"""
+        return self.now - timedelta(seconds=self.rng.uniform(0, (days or self.options['days']) * 86400))
+
+    def create_users(self):
+        password = make_password(self.options['password'])
+        flats = self.options['entrances'] * self.options['floors'] * self.options['flats']
+        users = [User(username=f'{USERNAME_PREFIX}manager-{number}', password=password, is_staff=True,
+                      first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                      email=f'manager{number}@example.com') for number in range(self.options['managers'])]
+        users += [User(username=f'{USERNAME_PREFIX}resident-{number}', password=password,
+                       first_name=self.rng.choice(FIRST_NAMES), last_name=self.rng.choice(LAST_NAMES),
+                       email=f'resident{number}@example.com') for number in range(flats)]
+        User.objects.bulk_create(users, batch_size=BATCH_SIZE)
+        users = list(User.objects.filter(username__startswith=USERNAME_PREFIX).order_by('pk'))
+        managers = [user for user in users if user.is_staff]
+        residents = [user for user in users if not user.is_staff]
+        Profile.objects.bulk_create(
+            (Profile(user=user, is_manager=user.is_staff, phone_number=f'+7 900 {user.pk:07d}') for user in users),
+            batch_size=BATCH_SIZE)
+        return managers, residents
+
+    def create_properties(self, residents):
+        options = self.options
+        properties = [
+            Property(property_street_name=STREET, property_building_number=1, property_entrance_number=entrance,
+                     property_flat_number=floor, property_room_number=number, property_type='0',
+                     property_area=self.rng.randint(30, 120))
+            for number, (entrance, floor) in enumerate(
+                ((entrance, floor) for entrance in range(1, options['entrances'] + 1)
+                 for floor in range(1, options['floors'] + 1) for _ in range(options['flats'])), start=1)]
+        properties += [
+            Property(property_street_name=STREET, property_building_number=1, property_entrance_number=0,
+                     property_flat_number=1, property_room_number=1000 + number, property_type='1',
+                     property_area=self.rng.randint(50, 300))
+            for number in range(options['commercial'])]
+        Property.objects.bulk_create(properties, batch_size=BATCH_SIZE)
+        properties = list(Property.objects.filter(property_street_name=STREET).order_by('pk'))
+
+        # Каждый житель владеет своей квартирой, часть - ещё и вторым помещением
+        ownerships = [Ownership(owner=owner, property=flat) for owner, flat in zip(residents, properties)]
+        ownerships += [Ownership(owner=self.rng.choice(residents), property=flat)
+                       for flat in properties[len(residents):] + self.rng.sample(properties, len(properties) // 10)]
+        Ownership.objects.bulk_create(ownerships, batch_size=BATCH_SIZE)
+
+    def inquiry(self, creator, title, created_at):
+        row = {'inquiry_id': self.next_inquiry_id, 'inquiry_title': title, 'inquiry_text': TEXT,
+               'inquiry_creator_id': creator.pk, 'inquiry_created_at': created_at,
+               'inquiry_updated_at': min(created_at + timedelta(minutes=self.rng.randint(0, 60 * 24)), self.now)}
+        self.next_inquiry_id += 1
+        return row
+
+    def create_children(self, model, rows):
+        insert(Inquiry, [parent for parent, _ in rows])
+        insert(model, [dict(child, inquiry_ptr_id=parent['inquiry_id']) for parent, child in rows])
+
+    def create_todos(self, managers, residents):
+        rows, comments = [], []
+        for _ in range(self.options['todos']):
+            category = self.rng.choice(list(TODO_TITLES))
+            created_at = self.moment()
+            parent = self.inquiry(self.rng.choice(residents), self.rng.choice(TODO_TITLES[category]), created_at)
+            # Старые заявки чаще завершены
+            age = (self.now - created_at).days
+            status = self.rng.choices('nwrc', weights=(1, 2, 1, 1 + age // 7))[0]
+            rows.append((parent, {
+                'todo_category': category, 'todo_status': status,
+                'todo_priority': self.rng.choices('3210', weights=(3, 5, 2, 1))[0],
+                'todo_assigned_to_id': None if status == 'n' else self.rng.choice(managers).pk,
+            }))
+            for _ in range(self.rng.randint(0, 2 * self.options['comments'])):
+                comments.append({'comment_id': self.next_comment_id, 'inquiry_id': parent['inquiry_id'],
+                                 'comment_text': self.rng.choice(COMMENTS),
+                                 'comment_creator_id': self.rng.choice((parent['inquiry_creator_id'],
+                                                                        self.rng.choice(managers).pk)),
+                                 'comment_created_at': min(created_at + timedelta(hours=self.rng.randint(1, 72)),
+                                                           self.now)})
+                self.next_comment_id += 1
+        self.create_children(ToDo, rows)
+        insert(Comment, comments)
+
+    def create_announcements(self, managers, residents):
+        rows = []
+        for _ in range(self.options['announcements']):
+            category = self.rng.choice(list(ANNOUNCEMENT_TITLES))
+            creator = self.rng.choice(managers) if category in '23' else self.rng.choice(residents)
+            created_at = self.moment()
+            expires = (created_at + timedelta(days=self.rng.randint(7, 90))).date()
+            rows.append((self.inquiry(creator, self.rng.choice(ANNOUNCEMENT_TITLES[category]), created_at), {
+                'announcement_category': category, 'announcement_auto_invisible_date': expires,
+                'announcement_is_visible': expires >= self.now.date(),
+            }))
+        self.create_children(Announcement, rows)
+
+    def create_polls(self, managers, residents):
+        rows = []
+        for _ in range(self.options['polls']):
+            created_at = self.moment()
+            deadline = created_at + timedelta(days=self.rng.randint(7, 60))
+            rows.append((self.inquiry(self.rng.choice(managers), self.rng.choice(POLL_TITLES), created_at), {
+                'poll_preliminary_results': self.rng.random() < 0.5, 'poll_deadline': deadline,
+                'poll_is_closed': deadline < self.now,
+            }))
+        self.create_children(Poll, rows)
+
+        VoteOption.objects.bulk_create(
+            (VoteOption(poll_id=parent['inquiry_id'], vote_option_text=text)
+             for parent, _ in rows for text in POLL_OPTIONS[:self.rng.randint(2, len(POLL_OPTIONS))]),
+            batch_size=BATCH_SIZE)
+        options = {}
+        for poll_id, option_id in VoteOption.objects.filter(poll__in=[parent['inquiry_id'] for parent, _ in rows]) \
+                .order_by('pk').values_list('poll', 'pk'):
+            options.setdefault(poll_id, []).append(option_id)
+        turnout = min(max(self.options['turnout'], 0), 1)
+        Vote.objects.bulk_create(
+            (Vote(poll_id=poll_id, selected_option_id=self.rng.choice(option_ids), voter=voter)
+             for poll_id, option_ids in options.items()
+             for voter in self.rng.sample(residents, int(len(residents) * turnout))),
+            batch_size=BATCH_SIZE)
+
+    def create_notifications(self, managers, residents):
+        rows = []
+        for recipient in residents:
+            for _ in range(self.options['notifications']):
+                category = self.rng.choice(list(NOTIFICATION_TITLES))
+                created_at = self.moment()
+                parent = self.inquiry(self.rng.choice(managers), self.rng.choice(NOTIFICATION_TITLES[category]),
+                                      created_at)
+                # Свежие уведомления чаще не прочитаны
+                is_read = self.rng.random() < min(0.95, (self.now - created_at).days / 30)
+                rows.append((parent, {'notification_category': category, 'notification_recipient_id': recipient.pk,
+                                      'notification_is_read': is_read}))
+        self.create_children(Notification, rows)
+        NotificationFanout.objects.create(
+            fanout_creator=managers[0], inquiry_title=NOTIFICATION_TITLES['1'][0], inquiry_text=TEXT,
+            notification_category='1', property_street_name=STREET, fanout_status='d',
+            fanout_total=len(residents), fanout_sent=len(residents), fanout_finished_at=self.now)
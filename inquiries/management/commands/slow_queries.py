@@ -0,0 +1,74 @@
+from datetime import timedelta
+
+from django.core.management.base import BaseCommand, CommandError
+from django.db.models import Avg, Count, Max, Sum
+from django.utils import timezone
+
+from inquiries.models import SlowQuery
+
+ORDERING = {'total': '-total', 'max': '-max', 'count': '-count'}
+
+
+class Command(BaseCommand):
+    help = 'Сводка журнала медленных запросов к БД по отпечаткам нормализованного SQL'
+
+    def add_arguments(self, parser):
+        parser.add_argument('--days', type=int, default=7, help='За сколько последних дней (по умолчанию 7)')
+        parser.add_argument('--limit', type=int, default=20, help='Сколько отпечатков показать (по умолчанию 20)')
+        parser.add_argument('--order', choices=ORDERING, default='total',
+                            help='Порядок: суммарное время (total), максимум (max) или число запросов (count)')
+        parser.add_argument('--fingerprint', help='Показать запрос, представления, стек и последний план отпечатка')
+
+    def handle(self, *args, **options):
+        if options['days'] <= 0 or options['limit'] <= 0:
+            raise CommandError('--days и --limit должны быть положительными')
+        queries = SlowQuery.objects.filter(query_created_at__gte=timezone.now() - timedelta(days=options['days']))
+        if options['fingerprint']:
+            self.show(queries.filter(query_fingerprint=options['fingerprint']))
+            return
+
+        worst = queries.values('query_fingerprint') \
+            .annotate(count=Count('pk'), total=Sum('query_duration'), mean=Avg('query_duration'),
+                      max=Max('query_duration')) \
+            .order_by(ORDERING[options['order']])[:options['limit']]
+        if not worst:
+            self.stdout.write('Медленных запросов нет')
+            return
+        self.stdout.write(f'{"отпечаток":16} {"число":>7} {"всего мс":>11} {"среднее":>9} {"макс":>9}  представления')
+        for row in worst:
+            rows = queries.filter(query_fingerprint=row['query_fingerprint'])
+            views = rows.values('query_view').annotate(count=Count('pk')).order_by('-count')[:3]
+            sql = rows.order_by('-query_created_at').values_list('query_sql', flat=True).first()
+            self.stdout.write(
+                f'{row["query_fingerprint"]:16} {row["count"]:7} {row["total"]:11.0f} {row["mean"]:9.1f} '
+                f'{row["max"]:9.1f}  ' + ', '.join(f'{view["query_view"] or "-"} ({view["count"]})' for view in views))
+            self.stdout.write(f'  {sql[:200]}')
+
+    def show(self, queries):
+        latest = queries.order_by('-query_created_at').first()
+        if latest is None:
+            raise CommandError('Запросов с таким отпечатком нет')
+        summary = queries.aggregate(count=Count('pk'), mean=Avg('query_duration'), max=Max('query_duration'))
+        self.stdout.write(f'Запросов: {summary["count"]}, среднее {summary["mean"]:.1f} мс, '
+                          f'максимум {summary["max"]:.1f} мс')
+        self.stdout.write(latest.query_sql)
+        for view in queries.values('query_view').annotate(count=Count('pk')).order_by('-count'):
+            self.stdout.write(f'  {view["query_view"] or "-"}: {view["count"]}')
+        self.stdout.write('Стек последнего запроса:')
+        self.stdout.write(latest.query_stack or '-')
+        planned = queries.exclude(query_plan=None).order_by('-query_created_at').first()
+        if planned is None:
+            self.stdout.write('Плана нет: он сохраняется только в PostgreSQL для доли SLOW_QUERY_EXPLAIN_RATE запросов')
+            return
+        plan = planned.query_plan[0]
+        self.stdout.write(f'План от {planned.query_created_at:%Y-%m-%d %H:%M} (оценки планировщика):')
+        self.write_node(plan['Plan'], 0)
+
+    def write_node(self, node, depth):
+        relation = f' on {node["Relation Name"]}' if 'Relation Name' in node else ''
+        index = f' using {node["Index Name"]}' if 'Index Name' in node else ''
+        self.stdout.write(
+            f'{"  " * depth}-> {node["Node Type"]}{relation}{index} (строк {node.get("Plan Rows")}, '
+            f'стоимость {node.get("Startup Cost")}..{node.get("Total Cost")})')
+        for child in node.get('Plans', ()):
+            self.write_node(child, depth + 1)
@@ -0,0 +1,190 @@
+"""Метрики запросов API в формате Prometheus.
+
+MetricsMiddleware записывает для каждого представления (имя функции,
+например todo_list, или класса) длительность запроса, число запросов к БД
+и их суммарное время, размер ответа и коды статуса. Потоковые ответы
+учитываются, когда тело отдано клиенту: строки списка читаются из БД по
+мере выдачи. Запросы к БД считает обёртка выполнения запросов на соединении
+потока обработки запроса; асинхронные представления ASGI
+(inquiries.async_views) читают БД в пуле потоков, куда замеры текущего
+запроса передаются через contextvar (measure_queries).
+
+Значения хранит библиотека prometheus_client. Если задана переменная
+окружения PROMETHEUS_MULTIPROC_DIR, каждый воркер gunicorn пишет метрики в
+свои файлы в этом каталоге, а /metrics суммирует их по всем воркерам;
+каталог нужно очищать перед запуском сервера. Без библиотеки промежуточный
+слой отключается.
+
+/metrics доступен управляющим и сборщику метрик со статическим токеном
+METRICS_TOKEN в заголовке Authorization: Bearer <токен>.
+"""
+import os
+import time
+from contextlib import nullcontext
+from contextvars import ContextVar
+
+from django.conf import settings
+from django.contrib.auth.models import AnonymousUser
+from django.core.exceptions import MiddlewareNotUsed
+from django.db import connection
+from django.http.response import FileResponse
+from django.utils.crypto import constant_time_compare
+from django.utils.deprecation import MiddlewareMixin
+from rest_framework.authentication import BaseAuthentication
+from rest_framework.permissions import BasePermission
+
+try:
+    import prometheus_client
+    from prometheus_client import multiprocess
+except ImportError:
+    prometheus_client = None
+
+current_metrics = ContextVar('current_metrics', default=None)
+
+METHODS = ('GET', 'HEAD', 'POST', 'PUT', 'PATCH', 'DELETE', 'OPTIONS')
+SCRAPER = 'metrics'
+
+if prometheus_client is not None:
+    REQUESTS = prometheus_client.Counter(
+        'upravdom_http_requests', 'Запросы по представлению, методу и коду статуса', ['view', 'method', 'status'])
+    LATENCY = prometheus_client.Histogram(
+        'upravdom_http_request_duration_seconds', 'Длительность обработки запроса', ['view', 'method'],
+        buckets=(.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10))
+    DB_QUERIES = prometheus_client.Histogram(
+        'upravdom_http_request_db_queries', 'Запросов к БД на один запрос', ['view'],
+        buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89))
+    DB_TIME = prometheus_client.Histogram(
+        'upravdom_http_request_db_duration_seconds', 'Время запросов к БД на один запрос', ['view'],
+        buckets=(.001, .0025, .005, .01, .025, .05, .1, .25, .5, 1, 2.5))
+    RESPONSE_SIZE = prometheus_client.Histogram(
+        'upravdom_http_response_bytes', 'Размер тела ответа', ['view'],
+        buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304, 16777216))
+
+
+def view_name(request):
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unresolved'
+    # У представлений @api_view и as_view() имя хранит класс
+    return getattr(match.func, 'view_class', match.func).__name__
+
+
+def render_metrics():
+    """Текст метрик и его Content-Type"""
+    if os.environ.get('PROMETHEUS_MULTIPROC_DIR'):
+        registry = prometheus_client.CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = prometheus_client.REGISTRY
+    return prometheus_client.generate_latest(registry), prometheus_client.CONTENT_TYPE_LATEST
+
+
+class RequestMetrics:
+    """Замеры одного запроса; вызывается как обёртка выполнения запросов к БД"""
+
+    def __init__(self, request):
+        self.request = request
+        self.started = time.perf_counter()
+        self.queries = 0
+        self.db_time = 0.0
+        self.finished = False
+        connection.execute_wrappers.append(self)
+        current_metrics.set(self)
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.queries += 1
+            self.db_time += time.perf_counter() - started
+
+    def finish(self, response, size):
+        if self.finished:
+            return
+        self.finished = True
+        if self in connection.execute_wrappers:
+            connection.execute_wrappers.remove(self)
+        view = view_name(self.request)
+        method = self.request.method if self.request.method in METHODS else 'other'
+        REQUESTS.labels(view, method, str(response.status_code)).inc()
+        LATENCY.labels(view, method).observe(time.perf_counter() - self.started)
+        DB_QUERIES.labels(view).observe(self.queries)
+        DB_TIME.labels(view).observe(self.db_time)
+        RESPONSE_SIZE.labels(view).observe(size)
+
+
+def measure_queries():
+    """Учитывает запросы к БД текущего потока в замерах запроса, который его занял"""
+    metrics = current_metrics.get()
+    if metrics is None or metrics.finished:
+        return nullcontext()
+    return connection.execute_wrapper(metrics)
+
+
+class MeasuredStream:
+    """Тело потокового ответа, которое завершает замеры, когда его закрывают"""
+
+    def __init__(self, chunks, metrics, response):
+        self.chunks = chunks
+        self.metrics = metrics
+        self.response = response
+        self.size = 0
+
+    def __iter__(self):
+        for chunk in self.chunks:
+            self.size += len(chunk)
+            yield chunk
+
+    def close(self):
+        close = getattr(self.chunks, 'close', None)
+        if close is not None:
+            close()
+        self.metrics.finish(self.response, self.size)
+
+
+class MetricsMiddleware(MiddlewareMixin):
+    """Записывает метрики запросов; стоит первым, чтобы учитывать сжатие"""
+
+    def __init__(self, get_response):
+        if prometheus_client is None:
+            raise MiddlewareNotUsed('prometheus_client не установлен')
+        super().__init__(get_response)
+
+    def process_request(self, request):
+        request.metrics = RequestMetrics(request)
+
+    def process_response(self, request, response):
+        metrics = getattr(request, 'metrics', None)
+        if metrics is None:
+            return response
+        if response.streaming and not isinstance(response, FileResponse):
+            response.streaming_content = MeasuredStream(response.streaming_content, metrics, response)
+        else:
+            # Замена тела FileResponse отключила бы отдачу файла через sendfile
+            size = int(response['Content-Length']) if response.has_header('Content-Length') \
+                else 0 if response.streaming else len(response.content)
+            metrics.finish(response, size)
+        return response
+
+
+class MetricsTokenAuthentication(BaseAuthentication):
+    """Статический токен сборщика метрик из настройки METRICS_TOKEN"""
+
+    def authenticate(self, request):
+        token = settings.METRICS_TOKEN
+        if token and constant_time_compare(request.headers.get('Authorization', ''), f'Bearer {token}'):
+            return AnonymousUser(), SCRAPER
+        return None
+
+    def authenticate_header(self, request):
+        return 'Bearer realm="metrics"'
+
+
+class CanReadMetrics(BasePermission):
+    """Сборщик метрик с токеном или управляющий"""
+
+    def has_permission(self, request, view):
+        if request.auth == SCRAPER:
+            return True
+        return bool(request.user and request.user.is_authenticated and request.user.profile.is_manager)
@@ -0,0 +1,55 @@
+"""Операции миграций для баз, в которых уже есть данные.
+
+Миграции в репозитории не хранятся и создаются командой makemigrations.
+Для пустой базы этого достаточно, но некоторые изменения моделей нельзя
+применить к заполненной таблице одной автоматической миграцией. Такие
+изменения переносятся в созданную вручную пустую миграцию:
+
+    python manage.py makemigrations inquiries --empty --name vote_poll
+
+в которой записывается operations = VOTE_POLL_OPERATIONS (из этого модуля),
+после чего makemigrations создаёт миграцию для остальных изменений моделей.
+
+Vote.poll: поле добавляется необязательным и заполняется по
+selected_option.poll; из повторных голосов пользователя в одном голосовании
+остаётся первый, счётчики вариантов пересчитываются. Только после этого поле
+становится обязательным и добавляется ограничение unique_vote_per_poll.
+"""
+import django.db.models.deletion
+from django.db import migrations, models
+from django.db.models import Count, Exists, OuterRef, Subquery, Value
+from django.db.models.functions import Coalesce
+
+
+def backfill_vote_polls(apps, schema_editor):
+    Vote = apps.get_model('inquiries', 'Vote')
+    VoteOption = apps.get_model('inquiries', 'VoteOption')
+    Vote.objects.filter(poll__isnull=True).update(
+        poll=Subquery(VoteOption.objects.filter(pk=OuterRef('selected_option')).values('poll')[:1]))
+    earlier = Vote.objects.filter(poll=OuterRef('poll'), voter=OuterRef('voter'), pk__lt=OuterRef('pk'))
+    Vote.objects.filter(Exists(earlier)).delete()
+
+    votes = Vote.objects.filter(selected_option=OuterRef('pk')).order_by().values('selected_option') \
+        .annotate(count=Count('pk')).values('count')
+    VoteOption.objects.update(vote_option_vote_count=Coalesce(Subquery(votes), Value(0)))
+
+
+VOTE_POLL_OPERATIONS = [
+    migrations.AddField(
+        model_name='vote',
+        name='poll',
+        field=models.ForeignKey(null=True, on_delete=django.db.models.deletion.CASCADE, to='inquiries.poll',
+                                help_text='Голосование'),
+    ),
+    migrations.RunPython(backfill_vote_polls, migrations.RunPython.noop),
+    migrations.AlterField(
+        model_name='vote',
+        name='poll',
+        field=models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='inquiries.poll',
+                                help_text='Голосование'),
+    ),
+    migrations.AddConstraint(
+        model_name='vote',
+        constraint=models.UniqueConstraint(fields=('poll', 'voter'), name='unique_vote_per_poll'),
+    ),
+]
@@ -1,8 +1,13 @@
+import os
+import uuid
+
 from django.db import models
-from django.db.models.signals import post_save
+from django.db.models import F
+from django.db.models.signals import post_save, post_delete
 from django.dispatch import receiver
 from django.contrib.auth.models import User
 from django.forms import ModelForm
+from django.utils import timezone
 from django.contrib.postgres.fields import ArrayField
 from django.utils.translation import gettext_lazy as _
 
@@ -18,7 +23,15 @@ class Inquiry(models.Model):
     inquiry_text = models.TextField(max_length=4096, help_text='Текст заявки', blank=False)
     inquiry_creator = models.ForeignKey(User, help_text='Создатель заявки', on_delete=models.SET_NULL, null=True)
     inquiry_created_at = models.DateTimeField(auto_now_add=True, help_text='Дата создания заявки')
-    inquiry_updated_at = models.DateTimeField(auto_now_add=True, help_text='Дата обновления заявки')
+    inquiry_updated_at = models.DateTimeField(auto_now=True, help_text='Дата обновления заявки')
+
+    class Meta:
+        indexes = [
+            # Порядок курсорной пагинации списков (KeysetPagination)
+            models.Index(fields=['-inquiry_created_at', '-inquiry_id'], name='inquiry_created_idx'),
+            # Списки пользователя: собственные заявки и объявления автора
+            models.Index(fields=['inquiry_creator', '-inquiry_created_at', '-inquiry_id'], name='inquiry_creator_created_idx'),
+        ]
 
 
 # class Attachment(models.Model):
@@ -124,9 +137,15 @@ class Poll(Inquiry):
     # poll_open = models.BooleanField(blank=True, default=False, help_text='Открытое голосование')
     poll_preliminary_results = models.BooleanField(blank=True, default=False, help_text='Предварительные результаты')
     poll_deadline = models.DateTimeField(null=False, help_text='Дата завершения голосования')
+    poll_is_closed = models.BooleanField(default=False, help_text='Голосование завершено')
     # poll_variants = models.JSONField(help_text='Варианты голосования')
     # poll_variants = ArrayField(models.CharField(max_length=255), blank=True)
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['poll_deadline'], condition=models.Q(poll_is_closed=False), name='poll_open_idx'),
+        ]
+
     def __str__(self):
         return f'Опрос: {self.inquiry_created_at} - {self.inquiry_title}'
 
@@ -152,6 +171,12 @@ class Announcement(Inquiry):
         blank=False,
     )
 
+    class Meta:
+        indexes = [
+            models.Index(fields=['announcement_auto_invisible_date'], condition=models.Q(announcement_is_visible=True),
+                         name='announcement_visible_idx'),
+        ]
+
     def __str__(self):
         return f'Объявление: {self.inquiry_created_at} - {self.inquiry_title}'
 
@@ -219,7 +244,89 @@ class Ownership(models.Model):
 
     class Meta:
         verbose_name = _('владение недвижимостью')
-        verbose_name_plural = _('владение недвижимостью') 
+        verbose_name_plural = _('владение недвижимостью')
+
+
+class NotificationFanout(models.Model):
+    """Модель массовой рассылки уведомлений собственникам помещений.
+
+    Пустые поля адреса и типа помещения не ограничивают выборку, поэтому
+    рассылку без условий получают все собственники.
+    """
+    fanout_id = models.AutoField(primary_key=True, help_text='Идентификатор рассылки', blank=False)
+    fanout_creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, help_text='Автор рассылки')
+    fanout_created_at = models.DateTimeField(auto_now_add=True, help_text='Дата создания рассылки')
+    fanout_finished_at = models.DateTimeField(null=True, blank=True, help_text='Дата завершения рассылки')
+    inquiry_title = models.CharField(max_length=256, help_text='Заголовок уведомления', blank=False)
+    inquiry_text = models.TextField(max_length=4096, help_text='Текст уведомления', blank=False)
+    notification_category = models.CharField(
+        max_length=1,
+        choices=Notification.NOTIFICATION_CATEGORY,
+        default='0',
+        help_text='Категория уведомления',
+        blank=False,
+    )
+    property_street_name = models.CharField(max_length=100, blank=True, help_text='Улица')
+    property_building_number = models.IntegerField(null=True, blank=True, help_text='Номер дома')
+    property_entrance_number = models.IntegerField(null=True, blank=True, help_text='Номер подъезда')
+    property_type = models.CharField(max_length=1, choices=Property.PROPERTY_TYPES, blank=True,
+                                     help_text='Тип помещения')
+    FANOUT_STATUS = (
+        ('q', 'В очереди'),
+        ('r', 'Выполняется'),
+        ('d', 'Завершена'),
+        ('f', 'Ошибка'),
+    )
+    fanout_status = models.CharField(max_length=1, choices=FANOUT_STATUS, default='q', help_text='Статус рассылки')
+    fanout_total = models.PositiveIntegerField(default=0, help_text='Количество получателей')
+    fanout_sent = models.PositiveIntegerField(default=0, help_text='Количество созданных уведомлений')
+    fanout_error = models.TextField(blank=True, help_text='Описание ошибки')
+
+    def __str__(self):
+        return f'Рассылка: {self.fanout_created_at} - {self.inquiry_title}'
+
+    class Meta:
+        verbose_name = _('рассылка уведомлений')
+        verbose_name_plural = _('рассылки уведомлений')
+
+
+class Job(models.Model):
+    """Модель фонового задания (inquiries.jobs)"""
+    job_id = models.AutoField(primary_key=True, help_text='Идентификатор задания', blank=False)
+    job_name = models.CharField(max_length=100, help_text='Имя задания')
+    job_args = models.JSONField(default=list, blank=True, help_text='Аргументы задания')
+    job_key = models.CharField(max_length=100, null=True, blank=True, help_text='Ключ уникальности')
+    JOB_STATUS = (
+        ('q', 'В очереди'),
+        ('r', 'Выполняется'),
+        ('d', 'Завершено'),
+        ('f', 'Ошибка'),
+    )
+    job_status = models.CharField(max_length=1, choices=JOB_STATUS, default='q', help_text='Статус задания')
+    job_run_at = models.DateTimeField(default=timezone.now, help_text='Время запуска')
+    job_attempts = models.PositiveIntegerField(default=0, help_text='Количество попыток')
+    job_max_attempts = models.PositiveIntegerField(default=1, help_text='Допустимое количество попыток')
+    job_locked_by = models.CharField(max_length=100, blank=True, help_text='Обработчик задания')
+    job_locked_until = models.DateTimeField(null=True, blank=True, help_text='Задание закреплено за обработчиком до')
+    job_created_at = models.DateTimeField(auto_now_add=True, help_text='Дата создания задания')
+    job_finished_at = models.DateTimeField(null=True, blank=True, help_text='Дата завершения задания')
+    job_error = models.TextField(blank=True, help_text='Описание ошибки')
+
+    def __str__(self):
+        return f'Задание: {self.job_run_at} - {self.job_name}'
+
+    class Meta:
+        verbose_name = _('фоновое задание')
+        verbose_name_plural = _('фоновые задания')
+        indexes = [
+            models.Index(fields=['job_run_at'], condition=models.Q(job_status__in=('q', 'r')),
+                         name='job_pending_idx'),
+        ]
+        constraints = [
+            # Периодическое задание стоит в очереди не более одного раза
+            models.UniqueConstraint(fields=['job_key'], condition=models.Q(job_status__in=('q', 'r')),
+                                    name='job_key_pending_uniq'),
+        ]
 
 class Comment(models.Model):
     """Модель комментария в заявке на исполнение"""
@@ -234,6 +341,7 @@ class VoteOption(models.Model):
     """Модель варианта голосования"""
     poll = models.ForeignKey('Poll', on_delete=models.CASCADE, blank=False, help_text='Голосование')
     vote_option_text = models.TextField(max_length=512, help_text='Текст варианта голосования', blank=False)
+    vote_option_vote_count = models.PositiveIntegerField(default=0, help_text='Количество голосов за вариант')
 
     def __str__(self):
         return f'{self.vote_option_text}'
@@ -244,10 +352,22 @@ class Vote(models.Model):
     voter = models.ForeignKey(User, on_delete=models.CASCADE, blank=False, help_text='Пользователь')
     selected_option = models.ForeignKey('VoteOption', on_delete=models.CASCADE, blank=False, help_text='Выбранный '
                                                                                                        'вариант')
+    # В базе с голосами поле и ограничение добавляются миграцией из inquiries.migration_operations
+    poll = models.ForeignKey('Poll', on_delete=models.CASCADE, blank=False, help_text='Голосование')
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=['poll', 'voter'], name='unique_vote_per_poll'),
+        ]
 
     def __str__(self):
         return f'{self.voter}'
 
+    def save(self, *args, **kwargs):
+        if self.poll_id is None:
+            self.poll_id = self.selected_option.poll_id
+        super().save(*args, **kwargs)
+
 
 class Profile(models.Model):
     """Профиль пользователя системы"""
@@ -255,6 +375,7 @@ class Profile(models.Model):
     phone_number = models.CharField("Номер телефона", max_length=100)
     is_manager = models.BooleanField("Признак управляющего", default=False, blank=False)
     photo = models.OneToOneField('File', on_delete=models.CASCADE, blank=True, null=True, help_text='Фотография профиля')
+    unread_notification_count = models.PositiveIntegerField("Непрочитанные уведомления", default=0)
 
     class Meta:
         ordering = ['is_manager', 'user']
@@ -278,9 +399,54 @@ class Info(models.Model):
 
 
 class File(models.Model):
-    file = models.FileField(blank=False, null=False)
+    file = models.FileField(blank=False, null=False, db_index=True)
+    file_name = models.CharField(max_length=255, blank=True, help_text='Исходное имя файла')
+    file_thumbnails = models.JSONField(default=dict, blank=True, help_text='Уменьшенные копии изображения')
+    file_creator = models.ForeignKey(User, on_delete=models.SET_NULL, null=True, blank=True,
+                                     help_text='Автор загрузки')
     def __str__(self):
-        return self.file.name
+        return self.file_name or self.file.name
+
+    def save(self, *args, **kwargs):
+        # Хранилище называет файлы по содержимому, поэтому имя загруженного
+        # файла запоминается до сохранения
+        if self.file and not self.file._committed:
+            self.file_name = os.path.basename(self.file.name)
+        super().save(*args, **kwargs)
+
+
+class FileUpload(models.Model):
+    """Модель незавершённой загрузки файла по частям (inquiries.uploads)"""
+    upload_id = models.UUIDField(primary_key=True, default=uuid.uuid4, editable=False,
+                                 help_text='Идентификатор загрузки')
+    upload_creator = models.ForeignKey(User, on_delete=models.CASCADE, help_text='Автор загрузки')
+    upload_filename = models.CharField(max_length=255, help_text='Имя файла')
+    upload_size = models.PositiveBigIntegerField(help_text='Размер файла в байтах')
+    upload_checksum = models.CharField(max_length=64, help_text='Контрольная сумма SHA-256')
+    upload_created_at = models.DateTimeField(auto_now_add=True, help_text='Дата начала загрузки')
+    upload_updated_at = models.DateTimeField(auto_now=True, help_text='Дата получения последней части')
+    upload_locked_until = models.DateTimeField(null=True, blank=True, help_text='Часть принимается до')
+
+    def __str__(self):
+        return f'Загрузка: {self.upload_created_at} - {self.upload_filename}'
+
+
+class SlowQuery(models.Model):
+    """Модель медленного запроса к БД (inquiries.slow_queries)"""
+    query_fingerprint = models.CharField(max_length=16, db_index=True, help_text='Отпечаток нормализованного запроса')
+    query_sql = models.TextField(help_text='Нормализованный текст запроса')
+    query_duration = models.FloatField(help_text='Длительность, мс')
+    query_view = models.CharField(max_length=100, blank=True, help_text='Представление, выполнившее запрос')
+    query_stack = models.TextField(blank=True, help_text='Стек вызовов')
+    query_plan = models.JSONField(null=True, blank=True, help_text='План EXPLAIN (ANALYZE, BUFFERS)')
+    query_created_at = models.DateTimeField(auto_now_add=True, db_index=True, help_text='Дата выполнения')
+
+    def __str__(self):
+        return f'Медленный запрос: {self.query_created_at} - {self.query_fingerprint}'
+
+    class Meta:
+        verbose_name = _('медленный запрос')
+        verbose_name_plural = _('медленные запросы')
 
 
 @receiver(post_save, sender=User)
@@ -289,6 +455,49 @@ def update_profile_signal(sender, instance, created, **kwargs):
         Profile.objects.create(user=instance)
     instance.profile.save()
 
+@receiver(post_save, sender=Vote)
+def increment_vote_count_signal(sender, instance, created, **kwargs):
+    if created:
+        VoteOption.objects.filter(pk=instance.selected_option_id).update(
+            vote_option_vote_count=F('vote_option_vote_count') + 1)
+
+
+@receiver(post_delete, sender=Vote)
+def decrement_vote_count_signal(sender, instance, **kwargs):
+    VoteOption.objects.filter(pk=instance.selected_option_id, vote_option_vote_count__gt=0).update(
+        vote_option_vote_count=F('vote_option_vote_count') - 1)
+
+
+@receiver(post_save, sender=Notification)
+def increment_unread_count_signal(sender, instance, created, **kwargs):
+    if created and not instance.notification_is_read and instance.notification_recipient_id is not None:
+        Profile.objects.filter(user=instance.notification_recipient_id).update(
+            unread_notification_count=F('unread_notification_count') + 1)
+
+
+@receiver(post_delete, sender=Notification)
+def decrement_unread_count_signal(sender, instance, **kwargs):
+    if not instance.notification_is_read and instance.notification_recipient_id is not None:
+        Profile.objects.filter(user=instance.notification_recipient_id, unread_notification_count__gt=0).update(
+            unread_notification_count=F('unread_notification_count') - 1)
+
+
+def touch_inquiry(inquiry_id):
+    """Отмечает изменение заявки при активности во вложенных объектах"""
+    Inquiry.objects.filter(pk=inquiry_id).update(inquiry_updated_at=timezone.now())
+
+
+@receiver([post_save, post_delete], sender=Comment)
+def touch_commented_inquiry_signal(sender, instance, **kwargs):
+    touch_inquiry(instance.inquiry_id)
+
+
+@receiver([post_save, post_delete], sender=VoteOption)
+@receiver([post_save, post_delete], sender=Vote)
+def touch_voted_poll_signal(sender, instance, **kwargs):
+    touch_inquiry(instance.poll_id)
+
+
 def get_name(self):
     return f'{self.first_name} {self.last_name}'
 
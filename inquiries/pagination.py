@@ -0,0 +1,137 @@
+import base64
+import binascii
+import json
+from datetime import datetime
+
+from django.db.models import Q
+from django.utils.dateparse import parse_datetime
+from rest_framework.exceptions import NotFound
+from rest_framework.pagination import BasePagination
+from rest_framework.settings import api_settings
+from rest_framework.utils.urls import replace_query_param
+
+from .encoding import JsonResponse
+
+
+class KeysetPagination(BasePagination):
+    """Курсорная пагинация по паре (дата создания, идентификатор).
+
+    Записи отдаются от новых к старым; вместо даты первым ключом может быть
+    числовое поле, например релевантность поиска. Курсор содержит ключ последней
+    (или первой) записи страницы, поэтому любая страница выбирается одним
+    запросом по индексу без OFFSET. Тело ответа остаётся списком, курсоры
+    передаются в заголовках Link, X-Next-Cursor и X-Previous-Cursor.
+    """
+    ordering = ('inquiry_created_at', 'inquiry_id')
+    cursor_query_param = 'cursor'
+    page_size_query_param = 'page_size'
+    max_page_size = 500
+    invalid_cursor_message = 'Неверный курсор'
+
+    def __init__(self, ordering=None):
+        if ordering is not None:
+            self.ordering = ordering
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.request = request
+        cursor = self.decode_cursor(request)
+        results = list(self.get_page_queryset(queryset, request))
+        has_more = len(results) > self.page_size
+        results = results[:self.page_size]
+        reverse = cursor is not None and cursor[0]
+        if reverse:
+            results.reverse()
+            self.has_next, self.has_previous = True, has_more
+        else:
+            self.has_next, self.has_previous = has_more, cursor is not None
+
+        self.page = results
+        return results
+
+    def get_page_queryset(self, queryset, request):
+        """Невыполненный запрос страницы: на одну запись больше размера страницы"""
+        self.page_size = self.get_page_size(request)
+        cursor = self.decode_cursor(request)
+
+        key_field, id_field = self.ordering
+        if cursor is None:
+            queryset = queryset.order_by('-' + key_field, '-' + id_field)
+        else:
+            reverse, key, pk = cursor
+            if reverse:
+                queryset = queryset.filter(
+                    Q(**{key_field + '__gt': key}) |
+                    Q(**{key_field: key, id_field + '__gt': pk})
+                ).order_by(key_field, id_field)
+            else:
+                queryset = queryset.filter(
+                    Q(**{key_field + '__lt': key}) |
+                    Q(**{key_field: key, id_field + '__lt': pk})
+                ).order_by('-' + key_field, '-' + id_field)
+        return queryset[:self.page_size + 1]
+
+    def get_page_size(self, request):
+        try:
+            page_size = int(request.query_params[self.page_size_query_param])
+        except (KeyError, ValueError):
+            return api_settings.PAGE_SIZE
+        if page_size <= 0:
+            return api_settings.PAGE_SIZE
+        return min(page_size, self.max_page_size)
+
+    def decode_cursor(self, request):
+        encoded = request.query_params.get(self.cursor_query_param)
+        if not encoded:
+            return None
+        try:
+            raw = base64.urlsafe_b64decode(encoded.encode('ascii')).decode('ascii')
+            direction, key, pk = json.loads(raw)
+            if isinstance(key, str):
+                key = parse_datetime(key)
+            pk = int(pk)
+        except (binascii.Error, UnicodeError, ValueError, TypeError):
+            raise NotFound(self.invalid_cursor_message)
+        if not isinstance(key, (datetime, int, float)) or direction not in ('n', 'p'):
+            raise NotFound(self.invalid_cursor_message)
+        return direction == 'p', key, pk
+
+    def encode_cursor(self, instance, reverse):
+        key_field, id_field = self.ordering
+        # Страница состоит из экземпляров моделей или строк values()
+        if isinstance(instance, dict):
+            key, pk = instance[key_field], instance[id_field]
+        else:
+            key, pk = getattr(instance, key_field), getattr(instance, id_field)
+        if isinstance(key, datetime):
+            key = key.isoformat()
+        raw = json.dumps(['p' if reverse else 'n', key, pk])
+        return base64.urlsafe_b64encode(raw.encode('ascii')).decode('ascii')
+
+    def get_next_cursor(self):
+        if not self.has_next or not self.page:
+            return None
+        return self.encode_cursor(self.page[-1], reverse=False)
+
+    def get_previous_cursor(self):
+        if not self.has_previous or not self.page:
+            return None
+        return self.encode_cursor(self.page[0], reverse=True)
+
+    def get_link(self, cursor):
+        url = self.request.build_absolute_uri()
+        return replace_query_param(url, self.cursor_query_param, cursor)
+
+    def get_paginated_response(self, data):
+        response = JsonResponse(data, safe=False)
+        links = []
+        next_cursor = self.get_next_cursor()
+        previous_cursor = self.get_previous_cursor()
+        if next_cursor is not None:
+            response['X-Next-Cursor'] = next_cursor
+            links.append('<%s>; rel="next"' % self.get_link(next_cursor))
+        if previous_cursor is not None:
+            response['X-Previous-Cursor'] = previous_cursor
+            links.append('<%s>; rel="prev"' % self.get_link(previous_cursor))
+        if links:
+            response['Link'] = ', '.join(links)
+        return response
@@ -0,0 +1,143 @@
+"""Полнотекстовый поиск по заявкам.
+
+Поисковый документ заявки (заголовок, текст и комментарии) хранится в
+отдельной таблице, которая создаётся после миграций под конкретную СУБД:
+в PostgreSQL это tsvector с русской морфологией и GIN-индексом, в SQLite
+(DEVELOPMENT_MODE) - виртуальная таблица FTS5. Документ обновляется
+сигналами при сохранении заявки или комментария.
+"""
+from django.db import connection, connections
+from django.db.models import Q, Value, FloatField
+from django.db.models.expressions import RawSQL
+from django.db.models.signals import post_save, post_delete, post_migrate
+
+from .models import ToDo, Poll, Announcement, Notification, Comment
+
+SEARCH_TABLE = 'inquiries_inquiry_search'
+SEARCH_CONFIG = 'russian'
+INQUIRY_MODELS = (ToDo, Poll, Announcement, Notification)
+SEARCH_ORDERING = ('search_rank', 'inquiry_id')
+
+POSTGRESQL_SCHEMA = (
+    f'CREATE TABLE IF NOT EXISTS {SEARCH_TABLE} (inquiry_id integer PRIMARY KEY, document tsvector NOT NULL)',
+    f'CREATE INDEX IF NOT EXISTS {SEARCH_TABLE}_document_idx ON {SEARCH_TABLE} USING gin (document)',
+)
+POSTGRESQL_UPDATE = f"""
+    INSERT INTO {SEARCH_TABLE} (inquiry_id, document)
+    SELECT i.inquiry_id,
+           setweight(to_tsvector('{SEARCH_CONFIG}', i.inquiry_title), 'A') ||
+           setweight(to_tsvector('{SEARCH_CONFIG}', i.inquiry_text), 'B') ||
+           setweight(to_tsvector('{SEARCH_CONFIG}', coalesce(
+               (SELECT string_agg(c.comment_text, ' ') FROM inquiries_comment c WHERE c.inquiry_id = i.inquiry_id),
+               '')), 'C')
+    FROM inquiries_inquiry i
+    {{where}}
+    ON CONFLICT (inquiry_id) DO UPDATE SET document = EXCLUDED.document
+"""
+POSTGRESQL_MATCH = f"SELECT inquiry_id FROM {SEARCH_TABLE} WHERE document @@ websearch_to_tsquery('{SEARCH_CONFIG}', %s)"
+POSTGRESQL_RANK = (f"SELECT ts_rank(document, websearch_to_tsquery('{SEARCH_CONFIG}', %s))::double precision "
+                   f"FROM {SEARCH_TABLE} "
+                   f"WHERE {SEARCH_TABLE}.inquiry_id = {{pk}}")
+
+SQLITE_SCHEMA = (
+    f"CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE} USING fts5("
+    f"inquiry_title, inquiry_text, comments, tokenize = 'unicode61 remove_diacritics 2')",
+)
+SQLITE_UPDATE = f"""
+    INSERT INTO {SEARCH_TABLE} (rowid, inquiry_title, inquiry_text, comments)
+    SELECT i.inquiry_id, i.inquiry_title, i.inquiry_text, coalesce(
+        (SELECT group_concat(c.comment_text, ' ') FROM inquiries_comment c WHERE c.inquiry_id = i.inquiry_id), '')
+    FROM inquiries_inquiry i
+    {{where}}
+"""
+SQLITE_MATCH = f'SELECT rowid FROM {SEARCH_TABLE} WHERE {SEARCH_TABLE} MATCH %s'
+SQLITE_RANK = (f'SELECT -bm25({SEARCH_TABLE}, 10.0, 5.0, 1.0) FROM {SEARCH_TABLE} '
+               f'WHERE {SEARCH_TABLE} MATCH %s AND rowid = {{pk}}')
+
+
+def create_search_table(using='default', **kwargs):
+    """Создаёт таблицу поискового документа, если её ещё нет"""
+    connection = connections[using]
+    schema = {'postgresql': POSTGRESQL_SCHEMA, 'sqlite': SQLITE_SCHEMA}.get(connection.vendor, ())
+    with connection.cursor() as cursor:
+        for statement in schema:
+            cursor.execute(statement)
+
+
+def update_search_document(inquiry_ids=None):
+    """Пересчитывает поисковый документ заявок inquiry_ids, а без аргумента - всех заявок"""
+    if inquiry_ids is not None:
+        inquiry_ids = list(inquiry_ids)
+        if not inquiry_ids:
+            return
+        where = 'WHERE i.inquiry_id IN (%s)' % ', '.join(['%s'] * len(inquiry_ids))
+        params = inquiry_ids
+    else:
+        where, params = '', []
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(POSTGRESQL_UPDATE.format(where=where), params)
+        elif connection.vendor == 'sqlite':
+            delete_search_document(inquiry_ids, cursor)
+            cursor.execute(SQLITE_UPDATE.format(where=where), params)
+
+
+def delete_search_document(inquiry_ids=None, cursor=None):
+    if connection.vendor not in ('postgresql', 'sqlite'):
+        return
+    if cursor is None:
+        with connection.cursor() as cursor:
+            return delete_search_document(inquiry_ids, cursor)
+    key = 'inquiry_id' if connection.vendor == 'postgresql' else 'rowid'
+    if inquiry_ids is None:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE}')
+    else:
+        cursor.execute(f'DELETE FROM {SEARCH_TABLE} WHERE {key} IN (%s)' % ', '.join(['%s'] * len(inquiry_ids)),
+                       inquiry_ids)
+
+
+def sqlite_match_query(query):
+    """Запрос FTS5: каждое слово ищется как префикс, спецсимволы экранируются кавычками"""
+    terms = ['"%s"*' % term.replace('"', '""') for term in query.split()]
+    return ' '.join(terms)
+
+
+def search(queryset, query):
+    """Фильтрует queryset заявок по поисковой строке и добавляет релевантность search_rank"""
+    query = query.strip()
+    if not query:
+        return queryset.annotate(search_rank=Value(0.0, output_field=FloatField()))
+    if connection.vendor == 'postgresql':
+        match, rank, params = POSTGRESQL_MATCH, POSTGRESQL_RANK, [query]
+    elif connection.vendor == 'sqlite':
+        match, rank, params = SQLITE_MATCH, SQLITE_RANK, [sqlite_match_query(query)]
+    else:
+        return queryset.filter(Q(inquiry_title__icontains=query) | Q(inquiry_text__icontains=query)) \
+            .annotate(search_rank=Value(0.0, output_field=FloatField()))
+    # Релевантность связывается с первичным ключом основной таблицы запроса:
+    # у дочерних моделей соединение с inquiries_inquiry есть не во всех запросах.
+    opts = queryset.model._meta
+    pk = f'{connection.ops.quote_name(opts.db_table)}.{connection.ops.quote_name(opts.pk.column)}'
+    return queryset.filter(inquiry_id__in=RawSQL(match, params)) \
+        .annotate(search_rank=RawSQL(rank.format(pk=pk), params, output_field=FloatField()))
+
+
+def inquiry_saved(sender, instance, **kwargs):
+    update_search_document([instance.pk])
+
+
+def inquiry_deleted(sender, instance, **kwargs):
+    delete_search_document([instance.pk])
+
+
+def comment_changed(sender, instance, **kwargs):
+    update_search_document([instance.inquiry_id])
+
+
+def connect_signals(app_config):
+    post_migrate.connect(create_search_table, sender=app_config)
+    for model in INQUIRY_MODELS:
+        post_save.connect(inquiry_saved, sender=model)
+        post_delete.connect(inquiry_deleted, sender=model)
+    post_save.connect(comment_changed, sender=Comment)
+    post_delete.connect(comment_changed, sender=Comment)
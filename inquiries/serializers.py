@@ -1,16 +1,84 @@
+import re
+
+from django.conf import settings
 from django.contrib.auth.models import User
+from django.db.models import Prefetch
 from rest_framework import serializers
 from rest_framework.fields import ReadOnlyField
 from rest_framework.relations import PrimaryKeyRelatedField
-from .models import Announcement, ToDo, Poll, Notification, Property, Comment, ToDoCategory, VoteOption, Vote, Profile, Info, File
+from .models import Announcement, ToDo, Poll, Notification, Property, Comment, ToDoCategory, VoteOption, Vote, Profile, Info, File, \
+    NotificationFanout, FileUpload
+from .uploads import received
+
+
+def user_relations(field):
+    """Связи, которые читает UserSerializer для пользователя в поле field"""
+    return f'{field}__profile__photo'
+
+
+class EagerLoadingMixin:
+    """Объявление графа связей, которые сериализатор читает у каждой записи.
+
+    Списочные представления передают queryset в setup_eager_loading, чтобы
+    все связи загружались фиксированным числом запросов независимо от
+    количества строк. Элемент prefetch_related_fields может быть функцией,
+    возвращающей Prefetch, если для вложенной связи нужен свой queryset.
+    """
+    select_related_fields = ()
+    prefetch_related_fields = ()
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        if cls.select_related_fields:
+            queryset = queryset.select_related(*cls.select_related_fields)
+        if cls.prefetch_related_fields:
+            queryset = queryset.prefetch_related(*[
+                lookup() if callable(lookup) else lookup for lookup in cls.prefetch_related_fields
+            ])
+        return queryset
 
 
 class FileSerializer(serializers.ModelSerializer):
+    thumbnails = serializers.SerializerMethodField()
+
     class Meta:
         model = File
-        fields = "__all__"
+        fields = ('id', 'file', 'file_name', 'thumbnails')
+        read_only_fields = ('file_name',)
+
+    def get_thumbnails(self, instance):
+        request = self.context.get('request', None)
+        urls = {}
+        for size, name in instance.file_thumbnails.items():
+            url = instance.file.storage.url(name)
+            urls[size] = request.build_absolute_uri(url) if request is not None else url
+        return urls
+
+
+class FileUploadSerializer(serializers.ModelSerializer):
+    upload_offset = serializers.SerializerMethodField()
+
+    class Meta:
+        model = FileUpload
+        fields = ('upload_id', 'upload_filename', 'upload_size', 'upload_checksum', 'upload_offset',
+                  'upload_created_at')
+
+    def get_upload_offset(self, instance):
+        return received(instance)
+
+    def validate_upload_size(self, value):
+        if value > settings.FILE_UPLOAD_MAX_SIZE:
+            raise serializers.ValidationError(f'Размер файла не должен превышать {settings.FILE_UPLOAD_MAX_SIZE} байт.')
+        return value
+
+    def validate_upload_checksum(self, value):
+        if not re.fullmatch(r'[0-9a-fA-F]{64}', value):
+            raise serializers.ValidationError('Ожидается контрольная сумма SHA-256 в шестнадцатеричном виде.')
+        return value.lower()
+
+class UserSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = ('profile__photo',)
 
-class UserSerializer(serializers.ModelSerializer):
     is_manager = PrimaryKeyRelatedField(source='profile.is_manager', read_only=True)
     phone_number = PrimaryKeyRelatedField(source='profile.phone_number', read_only=True)
     photo = FileSerializer(source='profile.photo', read_only=True)
@@ -19,7 +87,8 @@ class UserSerializer(serializers.ModelSerializer):
         model = User
         fields = 'id', 'username', 'first_name', 'last_name', 'phone_number', 'is_manager', 'photo', 'email'
 
-class CommentSerializer(serializers.ModelSerializer):
+class CommentSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('comment_creator'),)
 
     def to_representation(self, instance):
             representation = super(CommentSerializer, self).to_representation(instance)
@@ -40,7 +109,13 @@ class CommentSerializer(serializers.ModelSerializer):
         return comment
 
 
-class ToDoSerializer(serializers.ModelSerializer):
+def comments_prefetch():
+    return Prefetch('comment_set', queryset=CommentSerializer.setup_eager_loading(Comment.objects.all()))
+
+
+class ToDoSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('inquiry_creator'), user_relations('todo_assigned_to'))
+    prefetch_related_fields = (comments_prefetch,)
     todo_category_name = serializers.CharField(read_only=True, source='get_todo_category_display')
     todo_status_name = serializers.CharField(read_only=True, source='get_todo_status_display')
     todo_priority_name = serializers.CharField(read_only=True, source='get_todo_priority_display')
@@ -66,7 +141,8 @@ class ToDoSerializer(serializers.ModelSerializer):
         todo.save()
         return todo
 
-class ToDoListSerializer(serializers.ModelSerializer):
+class ToDoListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('inquiry_creator'),)
     todo_category_name = serializers.CharField(read_only=True, source='get_todo_category_display')
     todo_status_name = serializers.CharField(read_only=True, source='get_todo_status_display')
     todo_priority_name = serializers.CharField(read_only=True, source='get_todo_priority_display')
@@ -101,7 +177,9 @@ class ToDoCategorySerializer(serializers.ModelSerializer):
         fields = '__all__'
 
 
-class AnnouncementSerializer(serializers.ModelSerializer):
+class AnnouncementSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('inquiry_creator'),)
+    prefetch_related_fields = (comments_prefetch,)
     announcement_category_name = serializers.CharField(read_only=True, source='get_announcement_category_display')
     comments = CommentSerializer(read_only=True, source='comment_set', many=True)
     
@@ -128,7 +206,8 @@ class AnnouncementSerializer(serializers.ModelSerializer):
         return announcement
 
 
-class AnnouncementListSerializer(serializers.ModelSerializer):
+class AnnouncementListSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('inquiry_creator'),)
     announcement_category_name = serializers.CharField(read_only=True, source='get_announcement_category_display')
     
     class Meta:
@@ -171,16 +250,32 @@ class VoteOptionSerializer(serializers.ModelSerializer):
         return voteoption
 
 
-class PollSerializer(serializers.ModelSerializer):
-    vote_options = VoteOptionSerializer(read_only=True, source='voteoption_set', many=True)
+class VoteOptionResultSerializer(serializers.ModelSerializer):
+    """Итоги по варианту голосования без списка отдельных голосов"""
+
+    class Meta:
+        model = VoteOption
+        fields = 'id', 'poll', 'vote_option_text', 'vote_option_vote_count'
+
+
+class PollSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('inquiry_creator'),)
+    prefetch_related_fields = ('voteoption_set',)
+    vote_options = VoteOptionResultSerializer(read_only=True, source='voteoption_set', many=True)
+    poll_user_has_voted = serializers.BooleanField(read_only=True)
 
     class Meta:
         model = Poll
         fields = '__all__'
+        read_only_fields = ('poll_is_closed',)
 
     def to_representation(self, instance):
             representation = super(PollSerializer, self).to_representation(instance)
             representation['inquiry_creator'] = UserSerializer(instance.inquiry_creator).data
+            total = sum(option['vote_option_vote_count'] for option in representation['vote_options'])
+            for option in representation['vote_options']:
+                option['vote_option_percentage'] = round(option['vote_option_vote_count'] * 100 / total, 1) if total else 0
+            representation['poll_vote_count'] = total
             return representation
 
     def create(self, validated_data):
@@ -203,7 +298,8 @@ class PollSerializer(serializers.ModelSerializer):
         return instance
 
 
-class NotificationSerializer(serializers.ModelSerializer):
+class NotificationSerializer(EagerLoadingMixin, serializers.ModelSerializer):
+    select_related_fields = (user_relations('notification_recipient'),)
     notification_category_name = serializers.CharField(read_only=True, source='get_notification_category_display')
     class Meta:
         model = Notification
@@ -232,6 +328,24 @@ class NotificationSerializer(serializers.ModelSerializer):
     #     return instance
 
 
+class NotificationReadSerializer(serializers.Serializer):
+    """Уведомления для отметки о прочтении: список идентификаторов или все до момента before"""
+    ids = serializers.ListField(child=serializers.IntegerField(), required=False, max_length=1000)
+    before = serializers.DateTimeField(required=False)
+
+    def validate(self, data):
+        if 'ids' not in data and 'before' not in data:
+            raise serializers.ValidationError('Укажите ids или before.')
+        return data
+
+
+class NotificationFanoutSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = NotificationFanout
+        fields = '__all__'
+        read_only_fields = ('fanout_finished_at', 'fanout_status', 'fanout_total', 'fanout_sent', 'fanout_error')
+
+
 class PropertySerializer(serializers.ModelSerializer):
     class Meta:
         model = Property
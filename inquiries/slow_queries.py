@@ -0,0 +1,158 @@
+"""Журнал медленных запросов к БД.
+
+Обёртка выполнения запросов ставится на каждое соединение с БД и замечает
+запросы дольше SLOW_QUERY_THRESHOLD миллисекунд. Такой запрос пишется в лог
+и в таблицу SlowQuery вместе с представлением, которое его выполнило
+(его запоминает SlowQueryMiddleware), и коротким стеком вызовов кода
+проекта. Текст запроса нормализуется: литералы и параметры заменяются на ?,
+списки IN сворачиваются, поэтому запросы, которые отличаются только
+значениями, получают один отпечаток.
+
+В PostgreSQL для доли SLOW_QUERY_EXPLAIN_RATE медленных SELECT сохраняется
+план EXPLAIN с оценками планировщика. Запрос при этом не выполняется
+повторно: EXPLAIN ANALYZE выполнил бы ещё раз и побочные действия запроса
+(pg_notify, блокировки FOR UPDATE). Запись в SlowQuery делается после
+фиксации текущей транзакции (transaction.on_commit), чтобы не удлинять её и
+не менять её результат; при откате транзакции запись пропадает. Сводку по
+отпечаткам выводит manage.py slow_queries.
+"""
+import functools
+import hashlib
+import logging
+import os
+import random
+import re
+import time
+import traceback
+from contextlib import contextmanager
+from contextvars import ContextVar
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import DatabaseError, transaction
+from django.db.backends.signals import connection_created
+from django.utils import timezone
+from django.utils.deprecation import MiddlewareMixin
+
+from .jobs import job
+from .metrics import view_name
+from .models import SlowQuery
+
+logger = logging.getLogger(__name__)
+
+current_view = ContextVar('current_view', default=None)
+
+NORMALIZE = (
+    (re.compile(r"'(?:[^']|'')*'"), '?'),
+    (re.compile(r'\b\d+(?:\.\d+)?\b'), '?'),
+    (re.compile(r'%s|%\(\w+\)s'), '?'),
+    (re.compile(r'\(\s*\?(?:\s*,\s*\?)*\s*\)'), '(...)'),
+    (re.compile(r'\s+'), ' '),
+)
+RECORDED_STATEMENTS = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH')
+PROJECT_DIR = str(settings.BASE_DIR)
+
+
+def normalize(sql):
+    for pattern, replacement in NORMALIZE:
+        sql = pattern.sub(replacement, sql)
+    return sql.strip()
+
+
+def fingerprint(normalized):
+    return hashlib.sha1(normalized.encode('utf-8')).hexdigest()[:16]
+
+
+def short_stack():
+    """Последние SLOW_QUERY_STACK_DEPTH вызовов в коде проекта"""
+    frames = [frame for frame in traceback.extract_stack()
+              if frame.filename.startswith(PROJECT_DIR) and 'site-packages' not in frame.filename
+              and frame.filename != __file__]
+    return '\n'.join(f'{os.path.relpath(frame.filename, PROJECT_DIR)}:{frame.lineno} in {frame.name}'
+                     for frame in frames[-settings.SLOW_QUERY_STACK_DEPTH:])
+
+
+def explain(connection, sql, params):
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return cursor.fetchone()[0]
+
+
+@contextmanager
+def unwrapped(connection):
+    """Запросы самого журнала не проходят через обёртки и не попадают в метрики"""
+    wrappers, connection.execute_wrappers = connection.execute_wrappers, []
+    try:
+        yield
+    finally:
+        connection.execute_wrappers = wrappers
+
+
+def save(connection, **fields):
+    with unwrapped(connection):
+        try:
+            SlowQuery.objects.using(connection.alias).create(**fields)
+        except DatabaseError:
+            logger.exception('Не удалось сохранить медленный запрос')
+
+
+def record(connection, sql, params, many, duration):
+    normalized = normalize(sql)
+    view = current_view.get() or ''
+    stack = short_stack()
+    logger.warning('Медленный запрос к БД: %.0f мс, %s\n%s\n%s', duration, view or '-', normalized, stack)
+    if not sql.lstrip().upper().startswith(RECORDED_STATEMENTS):
+        return
+
+    plan = None
+    if (connection.vendor == 'postgresql' and not many and sql.lstrip().upper().startswith('SELECT')
+            and random.random() < settings.SLOW_QUERY_EXPLAIN_RATE):
+        with unwrapped(connection):
+            try:
+                # Точка сохранения: ошибка EXPLAIN не прерывает транзакцию вызывающего кода
+                with transaction.atomic(using=connection.alias):
+                    plan = explain(connection, sql, params)
+            except DatabaseError:
+                logger.exception('Не удалось получить план медленного запроса')
+    transaction.on_commit(functools.partial(
+        save, connection, query_fingerprint=fingerprint(normalized), query_sql=normalized, query_duration=duration,
+        query_view=view, query_stack=stack, query_plan=plan), using=connection.alias)
+
+
+def log_slow_queries(execute, sql, params, many, context):
+    started = time.perf_counter()
+    result = execute(sql, params, many, context)
+    duration = (time.perf_counter() - started) * 1000
+    if 0 < settings.SLOW_QUERY_THRESHOLD <= duration:
+        record(context['connection'], sql, params, many, duration)
+    return result
+
+
+def install(sender, connection, **kwargs):
+    if log_slow_queries not in connection.execute_wrappers:
+        connection.execute_wrappers.insert(0, log_slow_queries)
+
+
+def connect_signals():
+    connection_created.connect(install)
+
+
+class SlowQueryMiddleware(MiddlewareMixin):
+    """Запоминает представление запроса для журнала медленных запросов.
+
+    Значение не сбрасывается после ответа: строки потоковых списков
+    читаются из БД, когда ответ уже возвращён.
+    """
+
+    def process_request(self, request):
+        current_view.set(None)
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        current_view.set(view_name(request))
+
+
+@job(every=24 * 60 * 60)
+def delete_slow_queries():
+    """Удаляет записи о медленных запросах старше SLOW_QUERY_KEEP_DAYS дней"""
+    SlowQuery.objects.filter(query_created_at__lt=timezone.now() - timedelta(days=settings.SLOW_QUERY_KEEP_DAYS)) \
+        .delete()
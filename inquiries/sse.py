@@ -0,0 +1,112 @@
+"""Push-канал Server-Sent Events.
+
+ASGI-обработчик Django 4.0 перебирает тело ответа синхронно, поэтому
+бесконечный поток событий отдаётся отдельным ASGI-приложением, которое
+стоит перед приложением Django и перехватывает только EVENTS_PATH.
+Подключённый клиент ждёт событий из брокера (inquiries.events) и не
+занимает ни потока, ни соединения с БД; раз в EVENTS_KEEPALIVE секунд
+ему отправляется комментарий, чтобы прокси не закрывали соединение.
+"""
+import asyncio
+import io
+
+from corsheaders.conf import conf as cors_conf
+from django.conf import settings
+from django.core.handlers.asgi import ASGIRequest
+from rest_framework import exceptions, status
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+
+from .async_views import run_in_database_thread
+from .authentication import RoleClaimsJWTAuthentication
+from .encoding import dumps
+from .events import get_broker, user_channel
+
+EVENTS_PATH = '/events'
+RETRY_MILLISECONDS = 5000
+
+
+def authenticate(request):
+    token = request.GET.get('access_token', None)
+    if token is not None:
+        # EventSource в браузере не умеет передавать заголовок Authorization
+        authentication = RoleClaimsJWTAuthentication()
+        return authentication.get_user(authentication.get_validated_token(token))
+    authenticators = [authentication() for authentication in api_settings.DEFAULT_AUTHENTICATION_CLASSES]
+    user = Request(request, authenticators=authenticators).user
+    if not user.is_authenticated:
+        raise exceptions.NotAuthenticated()
+    return user
+
+
+def format_event(event, data):
+    return f'event: {event}\ndata: '.encode('utf-8') + dumps(data) + b'\n\n'
+
+
+def cors_headers(request):
+    origin = request.headers.get('Origin')
+    if origin and (cors_conf.CORS_ALLOW_ALL_ORIGINS or origin in cors_conf.CORS_ALLOWED_ORIGINS):
+        return [(b'access-control-allow-origin', origin.encode('latin-1'))]
+    return []
+
+
+class EventStreamApplication:
+    """ASGI-приложение: EVENTS_PATH отдаёт события пользователя, остальное - application"""
+    def __init__(self, application):
+        self.application = application
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] != EVENTS_PATH:
+            return await self.application(scope, receive, send)
+
+        request = ASGIRequest(scope, io.BytesIO())
+        if request.method != 'GET':
+            return await self.respond(send, status.HTTP_405_METHOD_NOT_ALLOWED, {'message': 'Метод не разрешён'})
+        try:
+            user = await run_in_database_thread(authenticate, request)
+        except exceptions.APIException as exc:
+            return await self.respond(send, status.HTTP_401_UNAUTHORIZED, {'detail': str(exc.detail)})
+
+        subscription = get_broker().subscribe([user_channel(user.pk)])
+        disconnect = asyncio.ensure_future(self.wait_disconnect(receive))
+        message = asyncio.ensure_future(subscription.get())
+        try:
+            await send({
+                'type': 'http.response.start',
+                'status': status.HTTP_200_OK,
+                'headers': [
+                    (b'content-type', b'text/event-stream; charset=utf-8'),
+                    (b'cache-control', b'no-cache'),
+                    (b'x-accel-buffering', b'no'),
+                ] + cors_headers(request),
+            })
+            await self.send_body(send, f'retry: {RETRY_MILLISECONDS}\n\n'.encode('ascii'))
+            while True:
+                done, pending = await asyncio.wait({message, disconnect}, timeout=settings.EVENTS_KEEPALIVE,
+                                                   return_when=asyncio.FIRST_COMPLETED)
+                if disconnect in done:
+                    break
+                if message in done:
+                    await self.send_body(send, format_event(*message.result()))
+                    message = asyncio.ensure_future(subscription.get())
+                else:
+                    await self.send_body(send, b': keepalive\n\n')
+        finally:
+            subscription.close()
+            message.cancel()
+            disconnect.cancel()
+
+    async def wait_disconnect(self, receive):
+        while (await receive())['type'] != 'http.disconnect':
+            pass
+
+    async def send_body(self, send, body):
+        await send({'type': 'http.response.body', 'body': body, 'more_body': True})
+
+    async def respond(self, send, status_code, data):
+        await send({
+            'type': 'http.response.start',
+            'status': status_code,
+            'headers': [(b'content-type', b'application/json')],
+        })
+        await send({'type': 'http.response.body', 'body': dumps(data)})
@@ -0,0 +1,85 @@
+"""Хранилище файлов с адресацией по содержимому.
+
+Файл сохраняется под именем blobs/<первые два знака>/<SHA-256><расширение>,
+поэтому одинаковое содержимое хранится один раз, сколько бы строк File на
+него ни ссылалось. Контрольная сумма считается в том же проходе, в котором
+содержимое копируется на диск; временный файл загрузки (и файл, собранный
+из частей) не копируется, а переносится, если такого содержимого ещё нет.
+
+Один blob может принадлежать нескольким строкам File, поэтому delete() его
+не удаляет: blob, на который не ссылается ни одна строка, удаляет команда
+manage.py collect_blobs.
+"""
+import hashlib
+import os
+import tempfile
+
+from django.core.files.move import file_move_safe
+from django.core.files.storage import FileSystemStorage
+
+BLOB_DIR = 'blobs'
+BLOCK_SIZE = 64 * 1024
+
+
+def blob_name(digest, name):
+    ext = os.path.splitext(name)[1].lower()
+    return f'{BLOB_DIR}/{digest[:2]}/{digest}{ext if len(ext) <= 10 else ""}'
+
+
+def is_blob(name):
+    return name.startswith(BLOB_DIR + '/')
+
+
+class ContentAddressedStorage(FileSystemStorage):
+
+    def _save(self, name, content):
+        os.makedirs(self.path(BLOB_DIR), exist_ok=True)
+        if hasattr(content, 'temporary_file_path'):
+            source, temporary = content.temporary_file_path(), False
+            digest = getattr(content, 'sha256', None) or self.file_digest(source)
+        else:
+            source, temporary, digest = self.copy_to_temporary(content)
+
+        name = blob_name(digest, name)
+        if self.exists(name):
+            if temporary:
+                os.remove(source)
+            # Свежая дата изменения защищает blob от collect_blobs, пока
+            # ссылающаяся на него строка File не сохранена
+            os.utime(self.path(name))
+            return name
+
+        path = self.path(name)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        file_move_safe(source, path, allow_overwrite=True)
+        if self.file_permissions_mode is not None:
+            os.chmod(path, self.file_permissions_mode)
+        return name
+
+    def copy_to_temporary(self, content):
+        checksum = hashlib.sha256()
+        descriptor, path = tempfile.mkstemp(dir=self.path(BLOB_DIR), suffix='.tmp')
+        try:
+            with os.fdopen(descriptor, 'wb') as temporary:
+                for chunk in content.chunks(BLOCK_SIZE):
+                    checksum.update(chunk)
+                    temporary.write(chunk)
+        except BaseException:
+            os.remove(path)
+            raise
+        return path, True, checksum.hexdigest()
+
+    def file_digest(self, path):
+        checksum = hashlib.sha256()
+        with open(path, 'rb') as source:
+            for block in iter(lambda: source.read(BLOCK_SIZE), b''):
+                checksum.update(block)
+        return checksum.hexdigest()
+
+    def get_available_name(self, name, max_length=None):
+        # Имя определяется содержимым в _save
+        return name
+
+    def delete(self, name):
+        if not is_blob(name):
+            super().delete(name)
@@ -0,0 +1,70 @@
+"""Потоковая выдача больших списков без пагинации.
+
+Queryset читается порциями по STREAMING_CHUNK_SIZE строк, каждая порция
+сериализуется и сразу отправляется клиенту, поэтому память процесса не
+зависит от размера таблицы. Порция выбирается отдельным запросом по ключу
+последней записи предыдущей порции, как страница KeysetPagination, а не
+курсором БД: следующую порцию может прочитать любой поток со своим
+соединением (так ответ отдаёт ASGI-обработчик inquiries.async_views), и
+между порциями соединение не удерживается. Формат 'json' побайтно совпадает
+с ответом JsonResponse (inquiries.encoding) для того же списка, 'ndjson'
+отдаёт по записи в строке.
+"""
+from django.conf import settings
+from django.db.models import Q
+from django.http.response import StreamingHttpResponse
+
+from .encoding import dumps
+
+STREAM_QUERY_PARAM = 'stream'
+STREAM_CONTENT_TYPES = {
+    'json': 'application/json',
+    'ndjson': 'application/x-ndjson',
+}
+
+
+def get_stream_format(request):
+    """Запрошенный формат потоковой выдачи или None для обычного ответа"""
+    return request.GET.get(STREAM_QUERY_PARAM, None)
+
+
+def iterate_chunks(queryset, ordering, chunk_size):
+    """Порции queryset от новых записей к старым по паре полей ordering (ключ, идентификатор)"""
+    key_field, id_field = ordering
+    queryset = queryset.order_by('-' + key_field, '-' + id_field)
+    chunk = list(queryset[:chunk_size])
+    while chunk:
+        yield chunk
+        if len(chunk) < chunk_size:
+            return
+        # Строки values() или экземпляры моделей
+        last = chunk[-1]
+        key, pk = (last[key_field], last[id_field]) if isinstance(last, dict) else \
+            (getattr(last, key_field), getattr(last, id_field))
+        chunk = list(queryset.filter(Q(**{key_field + '__lt': key}) |
+                                     Q(**{key_field: key, id_field + '__lt': pk}))[:chunk_size])
+
+
+def stream_json(chunks, serializer_class):
+    separator = b'['
+    for chunk in chunks:
+        parts = []
+        for data in serializer_class(chunk, many=True).data:
+            parts.append(separator + dumps(data))
+            separator = b','
+        yield b''.join(parts)
+    yield b'[]' if separator == b'[' else b']'
+
+
+def stream_ndjson(chunks, serializer_class):
+    for chunk in chunks:
+        yield b''.join(dumps(data) + b'\n' for data in serializer_class(chunk, many=True).data)
+
+
+def streaming_response(queryset, ordering, serializer_class, stream_format, chunk_size=None):
+    """StreamingHttpResponse со списком queryset в порядке ordering в формате stream_format ('json' или 'ndjson')"""
+    if chunk_size is None:
+        chunk_size = settings.STREAMING_CHUNK_SIZE
+    stream = stream_ndjson if stream_format == 'ndjson' else stream_json
+    return StreamingHttpResponse(stream(iterate_chunks(queryset, ordering, chunk_size), serializer_class),
+                                 content_type=STREAM_CONTENT_TYPES[stream_format])
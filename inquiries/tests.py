@@ -1,3 +1,1615 @@
-from django.test import TestCase
+import asyncio
+import gzip
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+import time
+from datetime import date, datetime, timedelta, timezone
+from decimal import Decimal
+from io import BytesIO, StringIO
+from unittest import skipUnless
+from unittest.mock import patch
+from urllib.parse import quote
 
-# Create your tests here.
+from django.contrib.auth.models import User
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import TemporaryUploadedFile
+from django.core.management import call_command
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import DEFAULT_DB_ALIAS, connection, connections, transaction
+from django.test import AsyncClient, TestCase, TransactionTestCase
+from django.test.utils import CaptureQueriesContext, override_settings
+from django.utils import timezone as django_timezone
+from django.utils.translation import gettext_lazy as _
+from PIL import Image
+from rest_framework.request import Request
+from rest_framework.settings import api_settings
+from rest_framework.test import APIClient, APIRequestFactory
+from rest_framework_simplejwt.tokens import AccessToken, RefreshToken
+
+from .async_views import ASGIHandler, run_in_database_thread
+from .authentication import RoleClaimsJWTAuthentication, add_role_claims
+from .business_logic import cast_vote, close_polls, create_notifications, expire_announcements, fanout_recipients, \
+    start_fanout, PollClosed, AlreadyVoted
+from .cache import get_cache, get_generation
+from .encoding import dumps, orjson
+from .events import todo_changed
+from .jobs import JobSpec, claim, enqueue, execute, schedule_periodic
+from .uploads import OFFSET_HEADER, part_path
+from .metrics import prometheus_client
+from .pagination import KeysetPagination
+from .search import search
+from .models import Profile, Inquiry, ToDo, Announcement, Poll, Notification, File, SlowQuery, VoteOption, Vote, \
+    Comment, Job, NotificationFanout, Ownership, Property, FileUpload
+from .serializers import ToDoListSerializer, AnnouncementListSerializer, NotificationSerializer
+from .slow_queries import normalize
+from .storage import blob_name
+from .thumbnails import generate_thumbnails
+from .sse import EventStreamApplication
+from .values_serializers import ToDoListValuesSerializer, AnnouncementListValuesSerializer, \
+    NotificationValuesSerializer
+
+
+@skipUnless(connection.vendor == 'postgresql', 'Планы запросов проверяются на PostgreSQL')
+class ListQueryPlanTest(TransactionTestCase):
+    """Списочные запросы не должны читать таблицы заявок последовательным сканированием"""
+    rows = 50000
+    users = 5000
+    endpoints = ['/todos', '/announcements', '/polls', '/notifications']
+    tables = [model._meta.db_table for model in (Inquiry, ToDo, Announcement, Poll, Notification)]
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager', password='manager')
+        self.manager.profile.is_manager = True
+        self.manager.profile.save()
+        residents = User.objects.bulk_create(User(username=f'owner{i}') for i in range(self.users))
+        Profile.objects.bulk_create(Profile(user=user) for user in residents)
+        self.resident = residents[0]
+
+        # bulk_create не работает с дочерними моделями многотабличного
+        # наследования, поэтому строки добавляются через INSERT ... SELECT.
+        # VACUUM ANALYZE приводит статистику и карту видимости к состоянию
+        # рабочей базы, поэтому тест не может выполняться внутри транзакции.
+        with connection.cursor() as cursor:
+            for model, values in (
+                (ToDo, {'todo_priority': "'2'", 'todo_status': "'n'", 'todo_category': "'1'"}),
+                (Announcement, {'announcement_is_visible': 'TRUE', 'announcement_auto_invisible_date': "'2099-01-01'",
+                                'announcement_category': "'0'"}),
+                (Poll, {'poll_preliminary_results': 'FALSE', 'poll_deadline': "'2099-01-01'",
+                        'poll_is_closed': 'FALSE'}),
+                (Notification, {'notification_is_read': 'FALSE', 'notification_recipient_id': 'inquiry_creator_id',
+                                'notification_category': "'0'"}),
+            ):
+                cursor.execute('SELECT COALESCE(MAX(inquiry_id), 0) FROM inquiries_inquiry')
+                start = cursor.fetchone()[0]
+                cursor.execute(
+                    "INSERT INTO inquiries_inquiry (inquiry_title, inquiry_text, inquiry_creator_id, "
+                    "inquiry_created_at, inquiry_updated_at) "
+                    "SELECT 'Заявка ' || n, 'Текст', %s + n %% %s, now() - n * interval '1 minute', now() "
+                    "FROM generate_series(1, %s) AS n", [self.resident.pk, self.users, self.rows])
+                cursor.execute('INSERT INTO %s (inquiry_ptr_id, %s) SELECT inquiry_id, %s FROM inquiries_inquiry '
+                               'WHERE inquiry_id > %%s' % (model._meta.db_table, ', '.join(values),
+                                                           ', '.join(values.values())), [start])
+            cursor.execute('VACUUM ANALYZE')
+
+    def assertNoSequentialScans(self, user):
+        client = APIClient()
+        client.force_authenticate(user)
+        for endpoint in self.endpoints:
+            with CaptureQueriesContext(connection) as queries:
+                response = client.get(endpoint)
+            self.assertEqual(response.status_code, 200)
+            for query in queries.captured_queries:
+                if not query['sql'].startswith('SELECT'):
+                    continue
+                with connection.cursor() as cursor:
+                    cursor.execute('EXPLAIN ' + query['sql'])
+                    plan = [row[0] for row in cursor.fetchall()]
+                scans = [line for line in plan if any(f'Seq Scan on {table} ' in line for table in self.tables)]
+                self.assertEqual(scans, [], f'{endpoint}: {query["sql"]}\n' + '\n'.join(plan))
+
+    def test_manager_lists(self):
+        self.assertNoSequentialScans(self.manager)
+
+    def test_resident_lists(self):
+        self.assertNoSequentialScans(self.resident)
+
+
+class EventStreamTest(TransactionTestCase):
+    """Push-канал доставляет получателю новые уведомления и изменения его заявок"""
+
+    def setUp(self):
+        self.resident = User.objects.create_user('resident')
+        self.other = User.objects.create_user('other')
+        self.todo = ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                                        todo_priority='2', todo_status='n', todo_category='1')
+
+    async def open_stream(self, query_string):
+        self.received = asyncio.Queue()
+        self.sent = asyncio.Queue()
+        application = EventStreamApplication(None)
+        scope = {'type': 'http', 'method': 'GET', 'path': '/events', 'query_string': query_string, 'headers': []}
+        self.stream = asyncio.ensure_future(application(scope, self.received.get, self.sent.put))
+        return await asyncio.wait_for(self.sent.get(), 5)
+
+    async def next_body(self):
+        return (await asyncio.wait_for(self.sent.get(), 5))['body'].decode('utf-8')
+
+    def test_unauthenticated(self):
+        async def scenario():
+            start = await self.open_stream(b'access_token=invalid')
+            await self.stream
+            return start['status']
+        self.assertEqual(asyncio.run(scenario()), 401)
+
+    def test_events(self):
+        token = str(AccessToken.for_user(self.resident)).encode('ascii')
+
+        async def scenario():
+            start = await self.open_stream(b'access_token=' + token)
+            self.assertEqual(start['status'], 200)
+            self.assertTrue((await self.next_body()).startswith('retry:'))
+
+            await run_in_database_thread(
+                Notification.objects.create, inquiry_title='Отключение воды', inquiry_text='Текст',
+                inquiry_creator=self.other, notification_recipient=self.other, notification_category='0')
+            await run_in_database_thread(
+                Notification.objects.create, inquiry_title='Собрание', inquiry_text='Текст',
+                inquiry_creator=self.other, notification_recipient=self.resident, notification_category='0')
+            notification = await self.next_body()
+
+            await run_in_database_thread(ToDo.objects.filter(pk=self.todo.pk).update, todo_status='w')
+            await run_in_database_thread(todo_changed, self.todo.pk)
+            todo = await self.next_body()
+
+            await self.received.put({'type': 'http.disconnect'})
+            await asyncio.wait_for(self.stream, 5)
+            return notification, todo
+
+        notification, todo = asyncio.run(scenario())
+        event, data = notification.splitlines()[:2]
+        self.assertEqual(event, 'event: notification')
+        self.assertEqual(json.loads(data[len('data: '):])['inquiry_title'], 'Собрание')
+        event, data = todo.splitlines()[:2]
+        self.assertEqual(event, 'event: todo')
+        self.assertEqual(json.loads(data[len('data: '):])['todo_status'], 'w')
+
+
+class ValuesSerializerParityTest(TestCase):
+    """Сериализаторы строк values() дают тот же JSON, что и сериализаторы DRF"""
+
+    def setUp(self):
+        photo = File.objects.create(file='blobs/ab/photo.jpg', file_name='Фото.jpg',
+                                    file_thumbnails={'64': 'blobs/ab/photo_64.webp'})
+        self.manager = User.objects.create_user('manager', first_name='Иван', last_name='Петров', email='m@example.com')
+        Profile.objects.filter(pk=self.manager.pk).update(is_manager=True, phone_number='+7 900', photo=photo)
+        self.resident = User.objects.create_user('resident')
+        ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                            todo_priority='2', todo_status='n', todo_category='1')
+        ToDo.objects.create(inquiry_title='Лифт', inquiry_text='Текст', inquiry_creator=self.manager,
+                            todo_assigned_to=self.manager, todo_priority='3', todo_status='w', todo_category='2')
+        Announcement.objects.create(inquiry_title='Собрание', inquiry_text='Текст', inquiry_creator=self.manager,
+                                    announcement_auto_invisible_date='2099-01-01', announcement_category='1')
+        Notification.objects.create(inquiry_title='Вода', inquiry_text='Текст', inquiry_creator=self.manager,
+                                    notification_recipient=self.resident, notification_category='0')
+        Notification.objects.create(inquiry_title='Всем', inquiry_text='Текст', inquiry_creator=self.manager,
+                                    notification_category='2', notification_is_read=True)
+
+    def assertSameJSON(self, serializer_class, values_serializer_class, queryset):
+        queryset = queryset.order_by('inquiry_id')
+        expected = serializer_class(serializer_class.setup_eager_loading(queryset), many=True).data
+        actual = values_serializer_class(values_serializer_class.setup_eager_loading(queryset), many=True).data
+        self.assertEqual(json.dumps(actual, cls=DjangoJSONEncoder), json.dumps(expected, cls=DjangoJSONEncoder))
+
+    def test_parity(self):
+        self.assertSameJSON(ToDoListSerializer, ToDoListValuesSerializer, ToDo.objects.all())
+        self.assertSameJSON(AnnouncementListSerializer, AnnouncementListValuesSerializer, Announcement.objects.all())
+        self.assertSameJSON(NotificationSerializer, NotificationValuesSerializer, Notification.objects.all())
+
+    def test_single_query(self):
+        queryset = ToDoListValuesSerializer.setup_eager_loading(ToDo.objects.all())
+        with CaptureQueriesContext(connection) as queries:
+            ToDoListValuesSerializer(queryset, many=True).data
+        self.assertEqual(len(queries), 1)
+
+
+class EncodingTest(TestCase):
+    """Кодировщики JSON дают одинаковый UTF-8 без экранирования"""
+    data = {'title': 'Собрание', 'label': _('Информация'), 'amount': Decimal('1.50'), 1: [None, True, 2.5],
+            'created_at': datetime(2024, 1, 2, 3, 4, 5, 123456, tzinfo=timezone.utc), 'deadline': date(2024, 1, 2)}
+    expected = ('{"title":"Собрание","label":"Информация","amount":"1.50","1":[null,true,2.5],'
+                '"created_at":"2024-01-02T03:04:05.123Z","deadline":"2024-01-02"}').encode('utf-8')
+
+    def test_json(self):
+        with override_settings(JSON_ENCODER='json'):
+            self.assertEqual(dumps(self.data), self.expected)
+
+    @skipUnless(orjson is not None, 'orjson не установлен')
+    def test_orjson(self):
+        with override_settings(JSON_ENCODER='orjson'):
+            self.assertEqual(dumps(self.data), self.expected)
+
+
+class CompressionTest(TestCase):
+    """Списки сжимаются согласованным алгоритмом, потоковые - по порциям"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        for number in range(100):
+            ToDo.objects.create(inquiry_title=f'Протечка {number}', inquiry_text='Текст', inquiry_creator=self.manager,
+                                todo_priority='2', todo_status='n', todo_category='1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_page(self):
+        plain = self.client.get('/todos?page_size=100')
+        compressed = self.client.get('/todos?page_size=100', HTTP_ACCEPT_ENCODING='gzip;q=0.5, identity')
+        self.assertFalse(plain.has_header('Content-Encoding'))
+        self.assertEqual(compressed['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', compressed['Vary'])
+        self.assertEqual(compressed['ETag'], 'W/' + plain['ETag'])
+        self.assertEqual(gzip.decompress(compressed.content), plain.content)
+        refused = self.client.get('/todos?page_size=100', HTTP_ACCEPT_ENCODING='gzip;q=0')
+        self.assertFalse(refused.has_header('Content-Encoding'))
+
+    def test_stream(self):
+        plain = b''.join(self.client.get('/todos?stream=json').streaming_content)
+        response = self.client.get('/todos?stream=json', HTTP_ACCEPT_ENCODING='gzip')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(gzip.decompress(b''.join(response.streaming_content)), plain)
+
+
+@skipUnless(prometheus_client is not None, 'prometheus_client не установлен')
+class MetricsTest(TestCase):
+    """Метрики записываются по имени представления и отдаются только управляющим и сборщику"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.manager.refresh_from_db()
+        self.resident = User.objects.create_user('resident')
+        ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                            todo_priority='2', todo_status='n', todo_category='1')
+        self.client = APIClient()
+
+    def sample(self, name, **labels):
+        return prometheus_client.REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_records_view(self):
+        self.client.force_authenticate(self.resident)
+        requests = self.sample('upravdom_http_requests_total', view='todo_list', method='GET', status='200')
+        queries = self.sample('upravdom_http_request_db_queries_sum', view='todo_list')
+        self.client.get('/todos')
+        b''.join(self.client.get('/todos?stream=ndjson').streaming_content)
+        self.assertEqual(self.sample('upravdom_http_requests_total', view='todo_list', method='GET', status='200'),
+                         requests + 2)
+        self.assertGreater(self.sample('upravdom_http_request_db_queries_sum', view='todo_list'), queries + 1)
+        self.assertGreater(self.sample('upravdom_http_response_bytes_sum', view='todo_list'), 0)
+
+    def test_access(self):
+        self.assertEqual(self.client.get('/metrics').status_code, 401)
+        self.client.force_authenticate(self.resident)
+        self.assertEqual(self.client.get('/metrics').status_code, 403)
+        self.client.force_authenticate(self.manager)
+        response = self.client.get('/metrics')
+        self.assertEqual(response.status_code, 200)
+        self.assertIn(b'upravdom_http_request_duration_seconds_bucket', response.content)
+        self.client.force_authenticate(None)
+        with override_settings(METRICS_TOKEN='secret'):
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer secret').status_code, 200)
+            self.assertEqual(self.client.get('/metrics', HTTP_AUTHORIZATION='Bearer wrong').status_code, 401)
+
+
+class SlowQueryTest(TestCase):
+    """Медленные запросы записываются с представлением, стеком и отпечатком"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.manager,
+                            todo_priority='2', todo_status='n', todo_category='1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def test_normalize(self):
+        self.assertEqual(normalize('SELECT * FROM t WHERE a IN (%s, %s, %s) AND b = \'x\'  LIMIT 21'),
+                         'SELECT * FROM t WHERE a IN (...) AND b = ? LIMIT ?')
+        self.assertEqual(normalize('SELECT "T3"."id" FROM t WHERE a IN (%s)'), 'SELECT "T3"."id" FROM t WHERE a IN (...)')
+
+    def test_record(self):
+        with override_settings(SLOW_QUERY_THRESHOLD=1e-6, SLOW_QUERY_EXPLAIN_RATE=1), \
+                self.assertLogs('inquiries.slow_queries', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            self.client.get('/todos')
+        queries = SlowQuery.objects.filter(query_view='todo_list', query_sql__contains='inquiries_todo')
+        self.assertTrue(queries.exists())
+        self.assertIn('inquiries/', queries[0].query_stack)
+        output = StringIO()
+        call_command('slow_queries', stdout=output)
+        self.assertIn(queries[0].query_fingerprint, output.getvalue())
+        if connection.vendor == 'postgresql':
+            planned = queries.exclude(query_plan=None)[0]
+            self.assertIn('Plan', planned.query_plan[0])
+            output = StringIO()
+            call_command('slow_queries', fingerprint=planned.query_fingerprint, stdout=output)
+            self.assertIn('оценки планировщика', output.getvalue())
+
+    def test_recorded_after_commit(self):
+        with override_settings(SLOW_QUERY_THRESHOLD=1e-6), self.assertLogs('inquiries.slow_queries', 'WARNING'):
+            with self.captureOnCommitCallbacks() as callbacks, transaction.atomic():
+                ToDo.objects.count()
+                self.assertFalse(SlowQuery.objects.exists())
+            for callback in callbacks:
+                callback()
+            self.assertTrue(SlowQuery.objects.filter(query_sql__contains='inquiries_todo').exists())
+
+            SlowQuery.objects.all().delete()
+            with self.captureOnCommitCallbacks(execute=True), self.assertRaises(RuntimeError), \
+                    transaction.atomic():
+                ToDo.objects.count()
+                raise RuntimeError('Откат транзакции')
+        self.assertFalse(SlowQuery.objects.exists())
+
+    @skipUnless(connection.vendor == 'postgresql', 'Планы запросов сохраняются только в PostgreSQL')
+    def test_explain_does_not_execute(self):
+        with connection.cursor() as cursor:
+            cursor.execute('CREATE TEMPORARY SEQUENCE slow_query_test')
+        with override_settings(SLOW_QUERY_THRESHOLD=1e-6, SLOW_QUERY_EXPLAIN_RATE=1), \
+                self.assertLogs('inquiries.slow_queries', 'WARNING'), \
+                self.captureOnCommitCallbacks(execute=True):
+            with connection.cursor() as cursor:
+                cursor.execute("SELECT nextval('slow_query_test')")
+                cursor.execute("SELECT currval('slow_query_test')")
+                self.assertEqual(cursor.fetchone()[0], 1)
+        self.assertTrue(SlowQuery.objects.filter(query_sql__contains='nextval').exclude(query_plan=None).exists())
+
+
+class KeysetPaginationTest(TestCase):
+    """Курсоры проходят список в обе стороны без пропусков и повторов"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        for number in range(10):
+            ToDo.objects.create(inquiry_title=f'Протечка {number}', inquiry_text='Текст', inquiry_creator=self.manager,
+                                todo_priority='2', todo_status='n', todo_category='1')
+        # Одинаковая дата создания: порядок задаёт только идентификатор
+        Inquiry.objects.update(inquiry_created_at=datetime(2024, 1, 2, tzinfo=timezone.utc))
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def ids(self, response):
+        return [row['inquiry_id'] for row in response.json()]
+
+    def test_round_trip(self):
+        pages = []
+        response = self.client.get('/todos?page_size=3')
+        while True:
+            self.assertEqual(response.status_code, 200)
+            pages.append(self.ids(response))
+            if not response.has_header('X-Next-Cursor'):
+                break
+            response = self.client.get('/todos', {'page_size': 3, 'cursor': response['X-Next-Cursor']})
+        expected = sorted(ToDo.objects.values_list('pk', flat=True), reverse=True)
+        self.assertEqual([pk for page in pages for pk in page], expected)
+        self.assertEqual([len(page) for page in pages], [3, 3, 3, 1])
+
+        for page in reversed(pages[:-1]):
+            response = self.client.get('/todos', {'page_size': 3, 'cursor': response['X-Previous-Cursor']})
+            self.assertEqual(self.ids(response), page)
+        self.assertFalse(response.has_header('X-Previous-Cursor'))
+
+    def test_page_size(self):
+        paginator = KeysetPagination()
+        self.assertEqual(paginator.get_page_size(Request(APIRequestFactory().get('/todos?page_size=100000'))), 500)
+        self.assertEqual(paginator.get_page_size(Request(APIRequestFactory().get('/todos?page_size=0'))),
+                         api_settings.PAGE_SIZE)
+
+    def test_invalid_cursor(self):
+        for cursor in ('garbage', 'WyJ4IiwgMSwgMl0=', 'WyJuIiwgImRhdGUiLCAxXQ=='):
+            self.assertEqual(self.client.get('/todos', {'cursor': cursor}).status_code, 404)
+
+
+class CastVoteTest(TestCase):
+    """Один голос на голосование и только до его завершения"""
+
+    def setUp(self):
+        self.resident = User.objects.create_user('resident')
+        self.poll = Poll.objects.create(inquiry_title='Ремонт крыльца', inquiry_text='Текст',
+                                        inquiry_creator=self.resident,
+                                        poll_deadline=django_timezone.now() + timedelta(days=1))
+        self.yes = VoteOption.objects.create(poll=self.poll, vote_option_text='За')
+        self.no = VoteOption.objects.create(poll=self.poll, vote_option_text='Против')
+        self.client = APIClient()
+        self.client.force_authenticate(self.resident)
+
+    def vote(self, option):
+        return self.client.post('/vote', {'selected_option': option.pk}, format='json')
+
+    def test_second_vote(self):
+        self.assertEqual(self.vote(self.yes).status_code, 201)
+        self.assertEqual(self.vote(self.no).status_code, 403)
+        with self.assertRaises(AlreadyVoted):
+            cast_vote(self.resident, self.yes.pk)
+        self.assertEqual(Vote.objects.filter(poll=self.poll, voter=self.resident).count(), 1)
+        self.assertEqual(list(VoteOption.objects.order_by('pk').values_list('vote_option_vote_count', flat=True)),
+                         [1, 0])
+
+    def test_closed(self):
+        Poll.objects.filter(pk=self.poll.pk).update(poll_deadline=django_timezone.now() - timedelta(minutes=1))
+        with self.assertRaises(PollClosed):
+            cast_vote(self.resident, self.yes.pk)
+        Poll.objects.filter(pk=self.poll.pk).update(poll_deadline=django_timezone.now() + timedelta(days=1),
+                                                    poll_is_closed=True)
+        with self.assertRaises(PollClosed):
+            cast_vote(self.resident, self.yes.pk)
+        self.assertEqual(self.vote(self.yes).status_code, 403)
+        self.assertFalse(Vote.objects.exists())
+
+
+class SearchTest(TestCase):
+    """Поиск по заголовку, тексту и комментариям с ранжированием и курсорами"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.title = self.todo('Протечка в подвале', 'Вода на полу')
+        self.text = self.todo('Подвал', 'Протечка трубы')
+        self.comment = self.todo('Подвал', 'Сырость')
+        Comment.objects.create(inquiry=self.comment, comment_text='Похоже на протечку', comment_creator=self.manager)
+        self.todo('Лифт', 'Не работает')
+        self.client = APIClient()
+        self.client.force_authenticate(User.objects.get(pk=self.manager.pk))
+
+    def todo(self, title, text):
+        return ToDo.objects.create(inquiry_title=title, inquiry_text=text, inquiry_creator=self.manager,
+                                   todo_priority='2', todo_status='n', todo_category='1')
+
+    def test_child_model_count(self):
+        self.assertEqual(search(ToDo.objects.all(), 'протечк').count(), 3)
+        self.assertTrue(search(ToDo.objects.all(), 'лифт').exists())
+        self.assertFalse(search(Notification.objects.all(), 'лифт').exists())
+
+    def test_ranking_and_cursor(self):
+        expected = [self.title.pk, self.text.pk, self.comment.pk]
+        ranked = search(ToDo.objects.all(), 'протечк').order_by('-search_rank', '-inquiry_id')
+        self.assertEqual([todo.pk for todo in ranked], expected)
+
+        ids = []
+        response = self.client.get('/todos', {'inquiry_title': 'протечк', 'page_size': 1})
+        while True:
+            ids += [row['inquiry_id'] for row in response.json()]
+            if not response.has_header('X-Next-Cursor'):
+                break
+            response = self.client.get('/todos', {'inquiry_title': 'протечк', 'page_size': 1,
+                                                  'cursor': response['X-Next-Cursor']})
+        self.assertEqual(ids, expected)
+
+
+class ResponseCacheTest(TestCase):
+    """Кэш ответов списков: попадания, промахи и устаревание после изменений"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.resident = User.objects.create_user('resident')
+        self.voter = User.objects.create_user('voter')
+        deadline = django_timezone.now() + timedelta(days=1)
+        Poll.objects.create(inquiry_title='Замена лифта', inquiry_text='Текст', inquiry_creator=self.resident,
+                            poll_deadline=deadline)
+        self.old_poll = Poll.objects.create(inquiry_title='Ремонт крыльца', inquiry_text='Текст',
+                                            inquiry_creator=self.resident, poll_deadline=deadline)
+        self.new_poll = Poll.objects.create(inquiry_title='Покраска стен', inquiry_text='Текст',
+                                            inquiry_creator=self.resident, poll_deadline=deadline)
+        self.new_option = VoteOption.objects.create(poll=self.new_poll, vote_option_text='За')
+        self.announcement = Announcement.objects.create(inquiry_title='Продам велосипед', inquiry_text='Текст',
+                                                        inquiry_creator=self.resident)
+        self.todo = ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                                        todo_priority='2', todo_status='n', todo_category='1')
+        self.client = APIClient()
+        self.client.force_authenticate(self.resident)
+
+    def cache_status(self, path):
+        return self.client.get(path)['X-Cache']
+
+    def test_hit_and_miss(self):
+        self.assertEqual(self.cache_status('/announcements'), 'MISS')
+        self.assertEqual(self.cache_status('/announcements'), 'HIT')
+        self.assertEqual(self.cache_status('/announcements?page_size=1'), 'MISS')
+        self.client.force_authenticate(self.voter)
+        self.assertEqual(self.cache_status('/announcements'), 'MISS')
+
+    def test_announcement_changes(self):
+        self.cache_status('/announcements')
+        Comment.objects.create(inquiry=self.todo, comment_text='Текст', comment_creator=self.resident)
+        self.assertEqual(self.cache_status('/announcements'), 'HIT')
+        Comment.objects.create(inquiry=self.announcement, comment_text='Текст', comment_creator=self.resident)
+        self.assertEqual(self.cache_status('/announcements'), 'MISS')
+        Announcement.objects.filter(pk=self.announcement.pk).update(announcement_category='1')
+        self.announcement.refresh_from_db()
+        self.announcement.save()
+        self.assertEqual(self.cache_status('/announcements'), 'MISS')
+
+    def test_poll_changes(self):
+        self.cache_status('/polls?page_size=1')
+        self.cache_status('/polls')
+        # Голос устаревает только страницы со своим голосованием (страница
+        # выбирается с одной лишней записью, она тоже входит в состояние)
+        cast_vote(self.voter, VoteOption.objects.create(poll=Poll.objects.order_by('pk').first(),
+                                                        vote_option_text='За').pk)
+        self.assertEqual(self.cache_status('/polls?page_size=1'), 'HIT')
+        self.assertEqual(self.cache_status('/polls'), 'MISS')
+        cast_vote(self.voter, self.new_option.pk)
+        self.assertEqual(self.cache_status('/polls?page_size=1'), 'MISS')
+        cast_vote(self.resident, self.new_option.pk)
+        response = self.client.get('/polls?page_size=1')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()[0]['poll_vote_count'], 2)
+        self.assertTrue(response.json()[0]['poll_user_has_voted'])
+        self.new_poll.save()
+        self.assertEqual(self.cache_status('/polls?page_size=1'), 'MISS')
+
+
+class ConditionalGetTest(TestCase):
+    """Неизменившиеся списки и карточки отдаются ответом 304"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.resident = User.objects.create_user('resident')
+        self.neighbour = User.objects.create_user('neighbour')
+        self.todo = ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                                        todo_priority='2', todo_status='n', todo_category='1')
+        self.poll = Poll.objects.create(inquiry_title='Ремонт крыльца', inquiry_text='Текст',
+                                        inquiry_creator=self.resident,
+                                        poll_deadline=django_timezone.now() + timedelta(days=1))
+        self.option = VoteOption.objects.create(poll=self.poll, vote_option_text='За')
+        self.hidden = Announcement.objects.create(inquiry_title='Черновик', inquiry_text='Текст',
+                                                  inquiry_creator=self.neighbour, announcement_is_visible=False)
+        self.client = APIClient()
+        self.client.force_authenticate(self.resident)
+
+    def assertNotModified(self, path):
+        etag = self.client.get(path)['ETag']
+        self.assertEqual(self.client.get(path, HTTP_IF_NONE_MATCH=etag).status_code, 304)
+        return etag
+
+    def test_unchanged(self):
+        for path in ('/todos', f'/todos/{self.todo.pk}', '/polls', f'/polls/{self.poll.pk}', '/announcements'):
+            self.assertNotModified(path)
+
+    def test_comment_changes_etag(self):
+        list_etag = self.assertNotModified('/todos')
+        detail_etag = self.assertNotModified(f'/todos/{self.todo.pk}')
+        Comment.objects.create(inquiry=self.todo, comment_text='Текст', comment_creator=self.resident)
+        self.assertEqual(self.client.get('/todos', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(f'/todos/{self.todo.pk}', HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_vote_changes_etag(self):
+        list_etag = self.assertNotModified('/polls')
+        detail_etag = self.assertNotModified(f'/polls/{self.poll.pk}')
+        cast_vote(self.neighbour, self.option.pk)
+        self.assertEqual(self.client.get('/polls', HTTP_IF_NONE_MATCH=list_etag).status_code, 200)
+        self.assertEqual(self.client.get(f'/polls/{self.poll.pk}', HTTP_IF_NONE_MATCH=detail_etag).status_code, 200)
+
+    def test_detail_scoped_to_visible(self):
+        # Недоступные пользователю записи не получают ETag
+        self.assertFalse(self.client.get(f'/announcements/{self.hidden.pk}').has_header('ETag'))
+        self.client.force_authenticate(self.neighbour)
+        self.assertNotModified(f'/announcements/{self.hidden.pk}')
+        self.assertFalse(self.client.get(f'/todos/{self.todo.pk}').has_header('ETag'))
+
+
+class TodoEventTest(TestCase):
+    """Событие todo публикуется только при смене статуса или исполнителя"""
+
+    def setUp(self):
+        self.resident = User.objects.create_user('resident')
+        self.manager = User.objects.create_user('manager')
+        self.todo = ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=self.resident,
+                                        todo_priority='2', todo_status='n', todo_category='1')
+
+    def test_publish_on_change(self):
+        with patch('inquiries.events.publish') as publish:
+            todo = ToDo.objects.get(pk=self.todo.pk)
+            todo.inquiry_title = 'Протечка в подвале'
+            todo.save()
+            self.assertEqual(publish.call_count, 0)
+            todo.todo_status = 'w'
+            todo.save()
+            self.assertEqual(publish.call_count, 1)
+            self.assertEqual(publish.call_args[0][2]['todo_status'], 'w')
+            todo.save()
+            self.assertEqual(publish.call_count, 1)
+            todo.todo_assigned_to = self.manager
+            todo.save(update_fields=['todo_assigned_to'])
+            self.assertEqual(publish.call_count, 2)
+            ToDo.objects.only('inquiry_ptr_id').get(pk=self.todo.pk).save(update_fields=['inquiry_title'])
+            self.assertEqual(publish.call_count, 2)
+
+
+class NotificationFanoutTest(TestCase):
+    """Рассылка уведомлений собственникам помещений"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.manager = User.objects.get(pk=self.manager.pk)
+        self.owners = [User.objects.create_user(f'owner{i}') for i in range(3)]
+        properties = [('Лесная', 1, 1, '0'), ('Лесная', 1, 2, '0'), ('Лесная', 1, 2, '1'), ('Садовая', 3, 1, '0')]
+        properties = [Property.objects.create(property_street_name=street, property_building_number=building,
+                                              property_entrance_number=entrance, property_type=kind,
+                                              property_flat_number=1, property_room_number=i, property_area=50)
+                      for i, (street, building, entrance, kind) in enumerate(properties)]
+        for owner, property in zip(self.owners + [self.owners[0]], [properties[0], properties[1], properties[3],
+                                                                   properties[2]]):
+            Ownership.objects.create(owner=owner, property=property)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def post(self, **data):
+        return self.client.post('/notifications/fanout', {'inquiry_title': 'Отключение воды',
+                                                          'inquiry_text': 'С 10 до 14', 'notification_category': '1',
+                                                          **data}, format='json')
+
+    def unread(self, user):
+        return Profile.objects.get(user=user).unread_notification_count
+
+    def test_recipients(self):
+        def recipients(**target):
+            return list(fanout_recipients(NotificationFanout(**target)))
+        owner0, owner1, owner2 = (owner.pk for owner in self.owners)
+        self.assertEqual(recipients(), [owner0, owner1, owner2])
+        self.assertEqual(recipients(property_street_name='Лесная'), [owner0, owner1])
+        self.assertEqual(recipients(property_street_name='Лесная', property_entrance_number=2), [owner0, owner1])
+        self.assertEqual(recipients(property_street_name='Лесная', property_entrance_number=2, property_type='0'),
+                         [owner1])
+        self.assertEqual(recipients(property_street_name='Лесная', property_type='1'), [owner0])
+        self.assertEqual(recipients(property_building_number=7), [])
+
+    @override_settings(FANOUT_BATCH_SIZE=1)
+    def test_sync_fanout(self):
+        notifications = connection.ops.quote_name(Notification._meta.db_table)
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(property_street_name='Лесная')
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual((response.json()['fanout_status'], response.json()['fanout_total'],
+                          response.json()['fanout_sent']), ('d', 2, 2))
+        # По одному INSERT дочерних строк на пакет из FANOUT_BATCH_SIZE получателей
+        self.assertEqual(sum(query['sql'].startswith(f'INSERT INTO {notifications}')
+                             for query in queries.captured_queries), 2)
+        created = Notification.objects.filter(inquiry_creator=self.manager).order_by('notification_recipient')
+        self.assertEqual([(n.notification_recipient_id, n.inquiry_title, n.inquiry_text, n.notification_category,
+                           n.notification_is_read) for n in created],
+                         [(owner.pk, 'Отключение воды', 'С 10 до 14', '1', False) for owner in self.owners[:2]])
+        self.assertEqual(Inquiry.objects.filter(inquiry_creator=self.manager).count(), 2)
+        self.assertEqual([self.unread(owner) for owner in self.owners], [1, 1, 0])
+
+        self.post()
+        self.assertEqual([self.unread(owner) for owner in self.owners], [2, 2, 1])
+
+    def test_failed_fanout(self):
+        with patch('inquiries.business_logic.create_notifications', side_effect=RuntimeError('Сбой вставки')), \
+                self.assertLogs('inquiries.business_logic', 'ERROR'):
+            response = self.post()
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual((response.json()['fanout_status'], response.json()['fanout_error'],
+                          response.json()['fanout_sent']), ('f', 'Сбой вставки', 0))
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(FANOUT_SYNC_LIMIT=2)
+    def test_queued_fanout(self):
+        response = self.post()
+        self.assertEqual(response.status_code, 202)
+        self.assertEqual(response.json()['fanout_status'], 'q')
+        self.assertEqual(Job.objects.get().job_args, [response.json()['fanout_id']])
+        self.assertFalse(Notification.objects.exists())
+
+    @override_settings(FANOUT_SYNC_LIMIT=0)
+    def test_failed_fanout_job_retried(self):
+        fanout_id = self.post().json()['fanout_id']
+        with patch('inquiries.business_logic.create_notifications', side_effect=RuntimeError('Сбой вставки')) as insert, \
+                self.assertLogs('inquiries.jobs', 'ERROR'):
+            for attempt in range(1, 4):
+                Job.objects.update(job_run_at=django_timezone.now())
+                execute(claim('worker'), 'worker')
+                job = Job.objects.get()
+                self.assertEqual((job.job_attempts, job.job_status), (attempt, 'q' if attempt < 3 else 'f'))
+                self.assertEqual(NotificationFanout.objects.get(pk=fanout_id).fanout_status, 'f')
+        self.assertEqual(insert.call_count, 3)
+        self.assertIn('Сбой вставки', job.job_error)
+        self.assertIsNone(claim('worker'))
+        self.assertEqual(NotificationFanout.objects.get(pk=fanout_id).fanout_error, 'Сбой вставки')
+
+    @override_settings(FANOUT_SYNC_LIMIT=0)
+    def test_fanout_job_succeeds_on_retry(self):
+        fanout_id = self.post().json()['fanout_id']
+        with patch('inquiries.business_logic.create_notifications', side_effect=RuntimeError('Сбой вставки')), \
+                self.assertLogs('inquiries.jobs', 'ERROR'):
+            execute(claim('worker'), 'worker')
+        Job.objects.update(job_run_at=django_timezone.now())
+        execute(claim('worker'), 'worker')
+        self.assertEqual(Job.objects.get().job_status, 'd')
+        fanout = NotificationFanout.objects.get(pk=fanout_id)
+        self.assertEqual((fanout.fanout_status, fanout.fanout_sent), ('d', 3))
+        self.assertEqual(Notification.objects.count(), 3)
+
+    def test_resident_forbidden(self):
+        self.client.force_authenticate(self.owners[0])
+        self.assertEqual(self.post().status_code, 403)
+
+
+@skipUnless(connection.vendor == 'postgresql', 'SQLite не допускает второго пишущего соединения')
+class FanoutProgressTest(TransactionTestCase):
+    """Ход фоновой рассылки виден другим соединениям до её завершения"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        owners = [User.objects.create_user(f'owner{i}') for i in range(3)]
+        for i, owner in enumerate(owners):
+            Ownership.objects.create(owner=owner, property=Property.objects.create(
+                property_street_name='Лесная', property_building_number=1, property_entrance_number=1,
+                property_type='0', property_flat_number=i, property_room_number=1, property_area=50))
+        self.fanout = NotificationFanout.objects.create(inquiry_title='Отключение воды', inquiry_text='С 10 до 14',
+                                                        notification_category='1', fanout_creator=self.manager)
+        self.observer = connections.create_connection(DEFAULT_DB_ALIAS)
+        self.addCleanup(self.observer.close)
+
+    def observed_progress(self):
+        with self.observer.cursor() as cursor:
+            cursor.execute(f'SELECT fanout_status, fanout_sent FROM {NotificationFanout._meta.db_table} '
+                           f'WHERE fanout_id = %s', [self.fanout.pk])
+            return cursor.fetchone()
+
+    @override_settings(FANOUT_SYNC_LIMIT=0, FANOUT_BATCH_SIZE=1)
+    def test_progress_visible_mid_run(self):
+        start_fanout(self.fanout)
+        observed = []
+
+        def observe(fanout, batch):
+            observed.append(self.observed_progress())
+            create_notifications(fanout, batch)
+
+        with patch('inquiries.business_logic.create_notifications', side_effect=observe):
+            execute(claim('worker'), 'worker')
+        self.assertEqual(observed, [('r', 0), ('r', 1), ('r', 2)])
+        self.assertEqual(self.observed_progress(), ('d', 3))
+        self.assertEqual(Notification.objects.count(), 3)
+
+    @override_settings(FANOUT_SYNC_LIMIT=0, FANOUT_BATCH_SIZE=1)
+    def test_progress_reset_on_failure(self):
+        start_fanout(self.fanout)
+
+        def fail_second_batch(fanout, batch):
+            if self.observed_progress()[1]:
+                raise RuntimeError('Сбой вставки')
+            create_notifications(fanout, batch)
+
+        with patch('inquiries.business_logic.create_notifications', side_effect=fail_second_batch), \
+                self.assertLogs('inquiries.jobs', 'ERROR'):
+            execute(claim('worker'), 'worker')
+        self.assertEqual(self.observed_progress(), ('f', 0))
+        self.assertFalse(Notification.objects.exists())
+
+
+class JobQueueTest(TestCase):
+    """Очередь заданий: закрепление, повторы и периодические задания"""
+
+    def setUp(self):
+        self.calls = []
+        registry = {
+            'record': JobSpec(self.calls.append, 'record', 2, 60, None),
+            'fail': JobSpec(self.fail_job, 'fail', 4, 10, None),
+            'tick': JobSpec(lambda: self.calls.append('tick'), 'tick', 1, 60, 60),
+        }
+        patcher = patch.dict('inquiries.jobs.registry', registry)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def fail_job(self):
+        raise RuntimeError('Сбой задания')
+
+    def make_due(self):
+        Job.objects.filter(job_status='q').update(job_run_at=django_timezone.now())
+
+    def test_expired_lease_reclaimed(self):
+        job = enqueue('record', 'payload')
+        first = claim('worker1')
+        self.assertEqual((first.pk, first.job_locked_by, first.job_attempts), (job.pk, 'worker1', 1))
+        self.assertIsNone(claim('worker2'))
+
+        Job.objects.update(job_locked_until=django_timezone.now() - timedelta(seconds=1))
+        second = claim('worker2')
+        self.assertEqual((second.pk, second.job_locked_by, second.job_attempts), (job.pk, 'worker2', 2))
+        # Результат обработчика, потерявшего задание, не записывается
+        execute(first, 'worker1')
+        job.refresh_from_db()
+        self.assertEqual((job.job_status, job.job_locked_by), ('r', 'worker2'))
+        execute(second, 'worker2')
+        job.refresh_from_db()
+        self.assertEqual((job.job_status, job.job_locked_until), ('d', None))
+        self.assertEqual(self.calls, ['payload', 'payload'])
+
+    def test_reclaimed_job_out_of_attempts(self):
+        job = enqueue('record', 'payload')
+        claim('worker1')
+        Job.objects.update(job_locked_until=django_timezone.now() - timedelta(seconds=1))
+        claim('worker2')
+        Job.objects.update(job_locked_until=django_timezone.now() - timedelta(seconds=1))
+        execute(claim('worker3'), 'worker3')
+        job.refresh_from_db()
+        self.assertEqual((job.job_status, job.job_attempts, job.job_error),
+                         ('f', 3, 'Обработчик задания завершился аварийно'))
+        self.assertEqual(self.calls, [])
+
+    def test_exponential_backoff(self):
+        job = enqueue('fail')
+        with self.assertLogs('inquiries.jobs', 'ERROR'):
+            for delay in (10, 20, 40):
+                self.make_due()
+                before = django_timezone.now()
+                execute(claim('worker'), 'worker')
+                after = django_timezone.now()
+                job.refresh_from_db()
+                self.assertEqual(job.job_status, 'q')
+                self.assertLessEqual(before + timedelta(seconds=delay), job.job_run_at)
+                self.assertLessEqual(job.job_run_at, after + timedelta(seconds=delay))
+            self.make_due()
+            execute(claim('worker'), 'worker')
+        job.refresh_from_db()
+        self.assertEqual((job.job_status, job.job_attempts), ('f', 4))
+        self.assertIn('Сбой задания', job.job_error)
+        self.assertIsNone(claim('worker'))
+
+    def test_periodic_job_rescheduled(self):
+        schedule_periodic()
+        schedule_periodic()
+        self.assertEqual(Job.objects.filter(job_key='tick').count(), 1)
+        # Пока задание ждёт или выполняется, второе с тем же ключом не создаётся
+        self.assertIsNone(enqueue('tick', key='tick'))
+        Job.objects.exclude(job_key='tick').delete()
+
+        before = django_timezone.now()
+        execute(claim('worker'), 'worker')
+        self.assertEqual(self.calls, ['tick'])
+        done, pending = Job.objects.filter(job_key='tick').order_by('pk')
+        self.assertEqual((done.job_status, pending.job_status), ('d', 'q'))
+        self.assertLessEqual(before + timedelta(seconds=60), pending.job_run_at)
+        self.assertIsNone(claim('worker'))
+
+        self.make_due()
+        with self.assertLogs('inquiries.jobs', 'ERROR'), \
+                patch.dict('inquiries.jobs.registry', tick=JobSpec(self.fail_job, 'tick', 1, 60, 60)):
+            execute(claim('worker'), 'worker')
+        # Задание планируется заново и после ошибки
+        self.assertEqual(list(Job.objects.filter(job_key='tick').order_by('pk').values_list('job_status', flat=True)),
+                         ['d', 'f', 'q'])
+
+
+class ScheduledJobsTest(TestCase):
+    """Периодические задания снятия объявлений с публикации и завершения голосований"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.resident = User.objects.create_user('resident')
+        self.client = APIClient()
+        self.client.force_authenticate(self.resident)
+
+    def test_expire_announcements(self):
+        today = django_timezone.localdate()
+        expired = Announcement.objects.create(inquiry_title='Продам велосипед', inquiry_text='Текст',
+                                              inquiry_creator=self.resident,
+                                              announcement_auto_invisible_date=today)
+        current = Announcement.objects.create(inquiry_title='Куплю шкаф', inquiry_text='Текст',
+                                              inquiry_creator=self.resident,
+                                              announcement_auto_invisible_date=today + timedelta(days=1))
+        self.assertEqual(self.client.get('/announcements')['X-Cache'], 'MISS')
+        self.assertEqual(self.client.get('/announcements')['X-Cache'], 'HIT')
+        generation = get_generation('announcement_list')
+
+        self.assertEqual(expire_announcements(), 1)
+        self.assertEqual(list(Announcement.objects.filter(announcement_is_visible=True)), [current])
+        expired.refresh_from_db()
+        self.assertFalse(expired.announcement_is_visible)
+        self.assertNotEqual(get_generation('announcement_list'), generation)
+        self.assertEqual(self.client.get('/announcements')['X-Cache'], 'MISS')
+
+        generation = get_generation('announcement_list')
+        self.assertEqual(expire_announcements(), 0)
+        self.assertEqual(get_generation('announcement_list'), generation)
+
+    def test_close_polls(self):
+        now = django_timezone.now()
+        expired = Poll.objects.create(inquiry_title='Ремонт крыльца', inquiry_text='Текст',
+                                      inquiry_creator=self.resident, poll_deadline=now - timedelta(minutes=1))
+        current = Poll.objects.create(inquiry_title='Замена лифта', inquiry_text='Текст',
+                                      inquiry_creator=self.resident, poll_deadline=now + timedelta(days=1))
+        self.assertEqual(self.client.get('/polls')['X-Cache'], 'MISS')
+        generation = get_generation('poll_list')
+
+        self.assertEqual(close_polls(), 1)
+        self.assertEqual(list(Poll.objects.filter(poll_is_closed=True)), [expired])
+        current.refresh_from_db()
+        self.assertFalse(current.poll_is_closed)
+        self.assertNotEqual(get_generation('poll_list'), generation)
+        response = self.client.get('/polls')
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual({poll['inquiry_id']: poll['poll_is_closed'] for poll in response.json()},
+                         {expired.pk: True, current.pk: False})
+
+        generation = get_generation('poll_list')
+        self.assertEqual(close_polls(), 0)
+        self.assertEqual(get_generation('poll_list'), generation)
+
+
+class UnreadNotificationCountTest(TestCase):
+    """Счётчик непрочитанных уведомлений совпадает с их фактическим числом"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        self.resident = User.objects.create_user('resident')
+        self.other = User.objects.create_user('other')
+        property = Property.objects.create(property_street_name='Лесная', property_building_number=1,
+                                           property_entrance_number=1, property_flat_number=1,
+                                           property_room_number=1, property_area=50)
+        Ownership.objects.create(owner=self.resident, property=property)
+        self.client = APIClient()
+        self.client.force_authenticate(self.resident)
+
+    def notify(self, recipient, title='Уведомление'):
+        return Notification.objects.create(inquiry_title=title, inquiry_text='Текст', inquiry_creator=self.manager,
+                                           notification_recipient=recipient)
+
+    def read(self, **data):
+        return self.client.post('/notifications/read', data, format='json').json()
+
+    def assertUnreadCount(self, expected):
+        actual = Notification.objects.filter(notification_recipient=self.resident, notification_is_read=False).count()
+        self.assertEqual(actual, expected)
+        self.assertEqual(self.client.get('/notifications/unread_count').json(), {'unread_count': expected})
+
+    def test_counter_follows_changes(self):
+        self.assertUnreadCount(0)
+        first, second, third = (self.notify(self.resident, f'Уведомление {i}') for i in range(3))
+        other = self.notify(self.other)
+        self.assertUnreadCount(3)
+
+        start_fanout(NotificationFanout.objects.create(inquiry_title='Рассылка', inquiry_text='Текст',
+                                                       fanout_creator=self.manager))
+        self.assertUnreadCount(4)
+
+        # Чужие уведомления не отмечаются и не уменьшают счётчик
+        self.assertEqual(self.read(ids=[first.pk, other.pk]), {'updated': 1, 'unread_count': 3})
+        self.assertUnreadCount(3)
+        self.assertEqual(self.read(ids=[first.pk]), {'updated': 0, 'unread_count': 3})
+        self.assertUnreadCount(3)
+
+        Notification.objects.filter(pk=second.pk).update(inquiry_created_at=django_timezone.now() - timedelta(days=1))
+        self.assertEqual(self.read(before=django_timezone.now() - timedelta(hours=1)),
+                         {'updated': 1, 'unread_count': 2})
+        self.assertUnreadCount(2)
+
+        third.delete()
+        self.assertUnreadCount(1)
+        self.assertEqual(self.read(before=django_timezone.now()), {'updated': 1, 'unread_count': 0})
+        self.assertEqual(self.read(before=django_timezone.now()), {'updated': 0, 'unread_count': 0})
+        self.assertUnreadCount(0)
+        self.assertEqual(Profile.objects.get(user=self.other).unread_notification_count, 1)
+
+    def test_counter_clamped_at_zero(self):
+        notification = self.notify(self.resident)
+        # Счётчик, разошедшийся с уведомлениями, не уходит в минус
+        Profile.objects.filter(user=self.resident).update(unread_notification_count=0)
+        self.assertEqual(self.read(ids=[notification.pk]), {'updated': 1, 'unread_count': 0})
+        self.assertEqual(self.read(ids=[notification.pk]), {'updated': 0, 'unread_count': 0})
+        self.assertEqual(Profile.objects.get(user=self.resident).unread_notification_count, 0)
+
+
+class TemporaryMediaMixin:
+    """Файлы теста сохраняются во временный MEDIA_ROOT"""
+
+    def setUp(self):
+        super().setUp()
+        media_root = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, media_root, ignore_errors=True)
+        media_settings = override_settings(MEDIA_ROOT=media_root, FILE_DELIVERY_HEADER='',
+                                           FILE_UPLOAD_PARTS_DIR=os.path.join(media_root, 'uploads'))
+        media_settings.enable()
+        self.addCleanup(media_settings.disable)
+
+
+class UploadTest(TemporaryMediaMixin, TestCase):
+    """Загрузка файла по частям"""
+    content = b'0123456789abcdef'
+
+    def setUp(self):
+        super().setUp()
+        self.user = User.objects.create_user('resident')
+        self.client = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def start(self, checksum=None):
+        response = self.client.post('/uploads', {
+            'upload_filename': 'Акт.txt', 'upload_size': len(self.content),
+            'upload_checksum': checksum or hashlib.sha256(self.content).hexdigest()}, format='json')
+        self.assertEqual((response.status_code, response[OFFSET_HEADER]), (201, '0'))
+        return FileUpload.objects.get(pk=response.json()['upload_id'])
+
+    def patch(self, upload, offset, chunk):
+        return self.client.generic('PATCH', f'/uploads/{upload.pk}', chunk,
+                                   content_type='application/offset+octet-stream', HTTP_UPLOAD_OFFSET=str(offset))
+
+    def test_upload_in_parts(self):
+        upload = self.start()
+        response = self.patch(upload, 0, self.content[:6])
+        self.assertEqual((response.status_code, response[OFFSET_HEADER]), (204, '6'))
+        self.assertEqual(self.client.get(f'/uploads/{upload.pk}')[OFFSET_HEADER], '6')
+        response = self.patch(upload, 6, self.content[6:])
+        self.assertEqual(response.status_code, 201)
+        file = File.objects.get(pk=response.json()['id'])
+        self.assertEqual((file.file_name, file.file_creator, file.file.read()), ('Акт.txt', self.user, self.content))
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertFalse(os.path.exists(part_path(upload)))
+
+    def test_offset_mismatch(self):
+        upload = self.start()
+        self.patch(upload, 0, self.content[:6])
+        for offset in (0, 8):
+            response = self.patch(upload, offset, self.content[offset:offset + 2])
+            self.assertEqual((response.status_code, response[OFFSET_HEADER]), (409, '6'))
+        self.assertEqual(os.path.getsize(part_path(upload)), 6)
+
+    def test_lease_lock(self):
+        upload = self.start()
+        FileUpload.objects.filter(pk=upload.pk).update(
+            upload_locked_until=django_timezone.now() + timedelta(minutes=1))
+        response = self.patch(upload, 0, self.content[:6])
+        self.assertEqual((response.status_code, response[OFFSET_HEADER]), (409, '0'))
+        self.assertFalse(os.path.exists(part_path(upload)))
+
+        # Закрепление обработчика, не освободившего загрузку, истекает
+        FileUpload.objects.filter(pk=upload.pk).update(
+            upload_locked_until=django_timezone.now() - timedelta(seconds=1))
+        self.assertEqual(self.patch(upload, 0, self.content[:6]).status_code, 204)
+        self.assertIsNone(FileUpload.objects.get(pk=upload.pk).upload_locked_until)
+
+    def test_checksum_mismatch(self):
+        upload = self.start(checksum=hashlib.sha256(b'other').hexdigest())
+        response = self.patch(upload, 0, self.content)
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(FileUpload.objects.exists())
+        self.assertFalse(File.objects.exists())
+        self.assertFalse(os.path.exists(part_path(upload)))
+
+
+class FileRangeTest(TemporaryMediaMixin, TestCase):
+    """Выдача файла с заголовками Range и If-Range"""
+    content = b'0123456789'
+
+    def setUp(self):
+        super().setUp()
+        resident = User.objects.create_user('resident')
+        self.file = File(file=ContentFile(self.content, name='Акт.txt'), file_creator=resident)
+        self.file.save()
+        self.client = APIClient()
+        self.client.force_authenticate(resident)
+        self.url = f'/files/{self.file.pk}/content'
+
+    def get(self, **headers):
+        response = self.client.get(self.url, **headers)
+        body = b''.join(response.streaming_content) if response.streaming else response.content
+        return response, body
+
+    def test_full_file(self):
+        response, body = self.get()
+        self.assertEqual((response.status_code, body, response['Accept-Ranges']), (200, self.content, 'bytes'))
+
+    def test_ranges(self):
+        for header, expected, content_range in (('bytes=-3', b'789', 'bytes 7-9/10'),
+                                                ('bytes=4-', b'456789', 'bytes 4-9/10'),
+                                                ('bytes=2-4', b'234', 'bytes 2-4/10'),
+                                                ('bytes=-20', self.content, 'bytes 0-9/10')):
+            response, body = self.get(HTTP_RANGE=header)
+            self.assertEqual((response.status_code, body, response['Content-Range']), (206, expected, content_range))
+
+    def test_unsatisfiable_range(self):
+        response, body = self.get(HTTP_RANGE='bytes=10-')
+        self.assertEqual((response.status_code, response['Content-Range']), (416, 'bytes */10'))
+
+    def test_if_range(self):
+        etag = self.get()[0]['ETag']
+        response, body = self.get(HTTP_RANGE='bytes=4-', HTTP_IF_RANGE=etag)
+        self.assertEqual((response.status_code, body), (206, b'456789'))
+        response, body = self.get(HTTP_RANGE='bytes=4-', HTTP_IF_RANGE='"stale"')
+        self.assertEqual((response.status_code, body), (200, self.content))
+
+
+class FileAccessTest(TemporaryMediaMixin, TestCase):
+    """Доступ к содержимому файлов и передача файла фронтовому прокси"""
+
+    def setUp(self):
+        super().setUp()
+        self.uploader = User.objects.create_user('uploader')
+        self.neighbour = User.objects.create_user('neighbour')
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.manager = User.objects.get(pk=self.manager.pk)
+        self.file = File(file=ContentFile(b'0123456789', name='Акт о протечке.txt'), file_creator=self.uploader)
+        self.file.save()
+        self.url = f'/files/{self.file.pk}/content'
+        self.client = APIClient()
+
+    def get(self, user):
+        self.client.force_authenticate(user)
+        return self.client.get(self.url)
+
+    def test_visibility(self):
+        self.assertEqual([self.get(user).status_code for user in (self.uploader, self.neighbour, self.manager)],
+                         [200, 404, 200])
+        self.assertFalse(self.get(self.neighbour).has_header('ETag'))
+        # Фотография профиля видна всем, как и список пользователей
+        Profile.objects.filter(user=self.uploader).update(photo=self.file)
+        self.assertEqual(self.get(self.neighbour).status_code, 200)
+
+    @override_settings(FILE_DELIVERY_HEADER='X-Accel-Redirect', FILE_DELIVERY_PREFIX='/protected/')
+    def test_x_accel_redirect(self):
+        response = self.get(self.uploader)
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Accel-Redirect'], f'/protected/{quote(self.file.file.name)}')
+        self.assertTrue(response['X-Accel-Redirect'].startswith('/protected/blobs/'))
+        self.assertEqual(response['Content-Type'], 'text/plain')
+        self.assertEqual(response['Content-Disposition'], f"inline; filename*=utf-8''{quote('Акт о протечке.txt')}")
+        self.assertTrue(response.has_header('ETag'))
+        self.assertEqual(self.get(self.neighbour).status_code, 404)
+
+    @override_settings(FILE_DELIVERY_HEADER='X-Sendfile')
+    def test_x_sendfile(self):
+        response = self.get(self.uploader)
+        self.assertEqual((response.status_code, response.content), (200, b''))
+        self.assertEqual(response['X-Sendfile'], self.file.file.path)
+        self.assertTrue(os.path.isfile(response['X-Sendfile']))
+        self.assertFalse(response.has_header('X-Accel-Redirect'))
+
+
+class ThumbnailTest(TemporaryMediaMixin, TestCase):
+    """Уменьшенные копии изображений"""
+
+    def image(self, name, size=(300, 200), **params):
+        # Верхняя половина красная, нижняя - синяя
+        image = Image.new('RGB', size, (0, 0, 255))
+        image.paste((255, 0, 0), (0, 0, size[0], size[1] // 2))
+        buffer = BytesIO()
+        image.save(buffer, Image.registered_extensions()[os.path.splitext(name)[1]], **params)
+        return self.save(name, buffer.getvalue())
+
+    def save(self, name, content):
+        file = File(file=ContentFile(content, name=name))
+        file.save()
+        return file
+
+    def thumbnails(self, file):
+        generate_thumbnails(file.pk)
+        file.refresh_from_db()
+        return file.file_thumbnails
+
+    def open(self, file, size):
+        with file.file.storage.open(file.file_thumbnails[size], 'rb') as content:
+            image = Image.open(content)
+            image.load()
+        return image
+
+    def test_image(self):
+        file = self.image('photo.png')
+        self.assertEqual(sorted(self.thumbnails(file), key=int), ['64', '128', '512'])
+        for size in ('64', '128', '512'):
+            self.assertTrue(file.file_thumbnails[size].endswith('.webp'))
+            image = self.open(file, size)
+            self.assertEqual((image.format, image.size), ('WEBP', (int(size), int(size))))
+
+    def test_not_image(self):
+        self.assertEqual(self.thumbnails(self.save('act.txt', b'not an image')), {})
+
+    def test_exif_orientation(self):
+        exif = Image.Exif()
+        exif[0x0112] = 6  # Повёрнуто на 90° по часовой стрелке
+        file = self.image('photo.jpg', size=(200, 100), exif=exif)
+        self.thumbnails(file)
+        image = self.open(file, '64')
+        # После поворота красная половина справа, синяя - слева
+        red, green, blue = image.getpixel((56, 32))
+        self.assertGreater(red, blue)
+        red, green, blue = image.getpixel((8, 32))
+        self.assertGreater(blue, red)
+
+    def test_regenerate_replaces_thumbnails(self):
+        file = self.image('photo.png')
+        previous = self.thumbnails(file)
+        with patch.object(file.file.storage, 'delete') as delete:
+            self.assertEqual(self.thumbnails(file), previous)
+            self.assertFalse(delete.called)
+            File.objects.filter(pk=file.pk).update(file_thumbnails={'64': 'blobs/00/stale.webp'})
+            self.thumbnails(file)
+            delete.assert_called_once_with('blobs/00/stale.webp')
+
+
+class ContentAddressedStorageTest(TemporaryMediaMixin, TestCase):
+    """Хранилище с адресацией по содержимому и команда collect_blobs"""
+
+    def save(self, content, name='act.txt'):
+        file = File(file=ContentFile(content, name=name))
+        file.save()
+        return file
+
+    def blobs(self):
+        return sorted(os.path.relpath(os.path.join(directory, filename), default_storage.location)
+                      for directory, _, filenames in os.walk(default_storage.path('blobs')) for filename in filenames)
+
+    def age(self, name, minutes):
+        modified = time.time() - minutes * 60
+        os.utime(default_storage.path(name), (modified, modified))
+
+    def collect(self, *args):
+        call_command('collect_blobs', *args, stdout=StringIO())
+
+    def test_identical_uploads_share_blob(self):
+        first = self.save(b'content', 'Акт.TXT')
+        second = self.save(b'content', 'copy.txt')
+        self.assertEqual(first.file.name, blob_name(hashlib.sha256(b'content').hexdigest(), 'act.txt'))
+        self.assertEqual(second.file.name, first.file.name)
+        self.assertEqual((first.file_name, second.file_name), ('Акт.TXT', 'copy.txt'))
+        self.assertEqual(self.blobs(), [first.file.name])
+
+    def test_temporary_file_moved(self):
+        upload = TemporaryUploadedFile('act.txt', 'text/plain', 7, 'utf-8')
+        upload.write(b'content')
+        upload.flush()
+        file = File(file=upload)
+        file.save()
+        self.assertFalse(os.path.exists(upload.temporary_file_path()))
+        upload.close()
+        self.assertEqual(self.blobs(), [file.file.name])
+        with file.file.open('rb') as content:
+            self.assertEqual(content.read(), b'content')
+
+    def test_delete_keeps_blobs(self):
+        file = self.save(b'content')
+        default_storage.delete(file.file.name)
+        self.assertTrue(default_storage.exists(file.file.name))
+        # Файлы вне blobs/, сохранённые до хранилища по содержимому, удаляются
+        legacy = 'legacy/act.txt'
+        os.makedirs(default_storage.path('legacy'))
+        with open(default_storage.path(legacy), 'wb') as content:
+            content.write(b'legacy')
+        default_storage.delete(legacy)
+        self.assertFalse(default_storage.exists(legacy))
+
+    def test_collect_blobs(self):
+        original = self.save(b'photo', 'photo.png')
+        thumbnail = default_storage.save('photo_64.webp', ContentFile(b'thumbnail'))
+        File.objects.filter(pk=original.pk).update(file_thumbnails={'64': thumbnail})
+        orphan = default_storage.save('old.txt', ContentFile(b'orphan'))
+        for name in (original.file.name, thumbnail, orphan):
+            self.age(name, 120)
+        young = default_storage.save('new.txt', ContentFile(b'young'))
+
+        self.collect('--dry-run')
+        self.assertEqual(len(self.blobs()), 4)
+        self.collect()
+        self.assertEqual(self.blobs(), sorted([original.file.name, thumbnail, young]))
+
+        # --grace сохраняет недавно изменённые blob
+        self.age(young, 30)
+        self.collect('--grace', '45')
+        self.assertTrue(default_storage.exists(young))
+        self.collect('--grace', '15')
+        self.assertFalse(default_storage.exists(young))
+        self.assertEqual(self.blobs(), sorted([original.file.name, thumbnail]))
+
+
+@override_settings(JWT_ROLE_CLAIMS=True)
+class RoleClaimsTest(TestCase):
+    """Авторизация по утверждениям токена и отзыв токенов"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.manager = User.objects.create_user('manager', password='Пароль-123')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.manager = User.objects.get(pk=self.manager.pk)
+        self.client = APIClient()
+        response = self.client.post('/auth/login', {'username': 'manager', 'password': 'Пароль-123'}, format='json')
+        self.assertEqual(response.status_code, 200)
+        self.access, self.refresh = response.json()['access'], response.json()['refresh']
+
+    def get(self):
+        return self.client.get('/notifications/unread_count', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+
+    def refresh_token(self):
+        return self.client.post('/auth/login/refresh', {'refresh': self.refresh}, format='json')
+
+    def assertRevoked(self, detail='Токен отозван'):
+        response = self.get()
+        self.assertEqual((response.status_code, response.json()['detail']), (401, 'Токен отозван'))
+        response = self.refresh_token()
+        self.assertEqual((response.status_code, response.json()['detail']), (401, detail))
+
+    def test_claims(self):
+        token = AccessToken(self.access)
+        self.assertIs(token['is_manager'], True)
+        self.assertEqual(self.get().status_code, 200)
+        response = self.refresh_token()
+        self.assertEqual(response.status_code, 200)
+        self.assertIs(AccessToken(response.json()['access'])['is_manager'], True)
+
+    def test_login_adds_claims_once(self):
+        with patch('auth.serializers.add_role_claims', wraps=add_role_claims) as claims, \
+                CaptureQueriesContext(connection) as queries:
+            response = self.client.post('/auth/login', {'username': 'manager', 'password': 'Пароль-123'},
+                                        format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(claims.call_count, 1)
+        profile = connection.ops.quote_name(Profile._meta.db_table)
+        self.assertEqual(sum(f'FROM {profile}' in query['sql'] for query in queries.captured_queries), 1)
+        self.assertIs(AccessToken(response.json()['access'])['is_manager'], True)
+        self.assertIs(RefreshToken(response.json()['refresh'])['is_manager'], True)
+
+    def test_authenticate_without_queries(self):
+        request = APIRequestFactory().get('/todos', HTTP_AUTHORIZATION=f'Bearer {self.access}')
+        authentication = RoleClaimsJWTAuthentication()
+        authentication.authenticate(request)
+        with self.assertNumQueries(0):
+            user, token = authentication.authenticate(request)
+        self.assertEqual((user.pk, user.profile.is_manager), (self.manager.pk, True))
+
+    def test_demotion_revokes(self):
+        self.assertEqual(self.get().status_code, 200)
+        profile = Profile.objects.get(user=self.manager)
+        profile.is_manager = False
+        profile.save()
+        self.assertRevoked()
+
+    def test_password_change_revokes(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.manager.set_password('Пароль-456')
+        self.manager.save()
+        self.assertRevoked()
+
+    def test_deactivation_revokes(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.manager.is_active = False
+        self.manager.save()
+        self.assertRevoked('Пользователь не найден или заблокирован')
+
+    def test_unrelated_change_keeps_token(self):
+        self.assertEqual(self.get().status_code, 200)
+        self.manager.first_name = 'Иван'
+        self.manager.save()
+        self.assertEqual(self.get().status_code, 200)
+        self.assertEqual(self.refresh_token().status_code, 200)
+
+
+class ListQueryCountTest(TestCase):
+    """Число запросов списочных представлений не зависит от числа строк"""
+    endpoints = ['/users', '/todos', '/announcements', '/polls', '/notifications']
+
+    def setUp(self):
+        get_cache().clear()
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        # Профиль загружается сразу, как при аутентификации по утверждениям токена
+        self.manager = User.objects.select_related('profile').get(pk=self.manager.pk)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+        self.rows = 0
+
+    def add_rows(self, count):
+        for number in range(self.rows + 1, self.rows + count + 1):
+            photo = File.objects.create(file=f'blobs/ab/photo{number}.jpg',
+                                        file_thumbnails={'64': f'blobs/ab/photo{number}_64.webp'})
+            resident = User.objects.create_user(f'resident{number}')
+            Profile.objects.filter(user=resident).update(photo=photo)
+            todo = ToDo.objects.create(inquiry_title='Протечка', inquiry_text='Текст', inquiry_creator=resident,
+                                       todo_assigned_to=self.manager, todo_priority='2', todo_status='w',
+                                       todo_category='1')
+            Comment.objects.create(inquiry=todo, comment_text='Комментарий', comment_creator=resident)
+            Announcement.objects.create(inquiry_title='Собрание', inquiry_text='Текст', inquiry_creator=resident,
+                                        announcement_auto_invisible_date='2099-01-01', announcement_category='1')
+            poll = Poll.objects.create(inquiry_title='Ремонт', inquiry_text='Текст', inquiry_creator=resident,
+                                       poll_deadline=django_timezone.now() + timedelta(days=1))
+            option = VoteOption.objects.create(poll=poll, vote_option_text='За')
+            VoteOption.objects.create(poll=poll, vote_option_text='Против')
+            cast_vote(resident, option.pk)
+            Notification.objects.create(inquiry_title='Вода', inquiry_text='Текст', inquiry_creator=self.manager,
+                                        notification_recipient=resident, notification_category='0')
+        self.rows += count
+
+    def count_queries(self):
+        counts = {}
+        for endpoint in self.endpoints:
+            get_cache().clear()
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(endpoint)
+            self.assertEqual(response.status_code, 200, endpoint)
+            counts[endpoint] = len(queries)
+        return counts
+
+    def test_constant_queries(self):
+        self.add_rows(1)
+        single = self.count_queries()
+        self.add_rows(9)
+        self.assertEqual(self.count_queries(), single)
+
+
+class VoteTallyTest(TestCase):
+    """Счётчики голосов у вариантов и проценты в ответе голосования"""
+
+    def setUp(self):
+        self.residents = [User.objects.create_user(f'resident{i}') for i in range(3)]
+        self.poll = Poll.objects.create(inquiry_title='Ремонт крыльца', inquiry_text='Текст',
+                                        inquiry_creator=self.residents[0],
+                                        poll_deadline=django_timezone.now() + timedelta(days=1))
+        self.options = [VoteOption.objects.create(poll=self.poll, vote_option_text=text)
+                        for text in ('За', 'Против', 'Воздержался')]
+        self.client = APIClient()
+        self.client.force_authenticate(self.residents[0])
+
+    def counts(self):
+        return list(VoteOption.objects.filter(poll=self.poll).order_by('pk')
+                    .values_list('vote_option_vote_count', flat=True))
+
+    def results(self):
+        poll = self.client.get(f'/polls/{self.poll.pk}').json()
+        return poll['poll_vote_count'], [option['vote_option_percentage'] for option in poll['vote_options']]
+
+    def test_no_votes(self):
+        self.assertEqual(self.counts(), [0, 0, 0])
+        self.assertEqual(self.results(), (0, [0, 0, 0]))
+
+    def test_cast_and_delete(self):
+        yes, no, _ = self.options
+        cast_vote(self.residents[0], yes.pk)
+        cast_vote(self.residents[1], yes.pk)
+        vote = cast_vote(self.residents[2], no.pk)
+        self.assertEqual(self.counts(), [2, 1, 0])
+        self.assertEqual(self.results(), (3, [66.7, 33.3, 0]))
+
+        vote.delete()
+        self.assertEqual(self.counts(), [2, 0, 0])
+        self.assertEqual(self.results(), (2, [100.0, 0, 0]))
+        Vote.objects.filter(selected_option=yes).get(voter=self.residents[1]).delete()
+        Vote.objects.filter(selected_option=yes).get().delete()
+        self.assertEqual(self.counts(), [0, 0, 0])
+        self.assertEqual(self.results(), (0, [0, 0, 0]))
+
+    def test_recount_votes(self):
+        yes, no, abstain = self.options
+        cast_vote(self.residents[0], yes.pk)
+        cast_vote(self.residents[1], no.pk)
+        # Счётчики расходятся с голосами, например после update() без сигналов
+        VoteOption.objects.filter(pk=yes.pk).update(vote_option_vote_count=7)
+        VoteOption.objects.filter(pk=abstain.pk).update(vote_option_vote_count=2)
+        Vote.objects.filter(selected_option=no).update(selected_option=yes)
+        call_command('recount_votes', stdout=StringIO())
+        self.assertEqual(self.counts(), [2, 0, 0])
+        self.assertEqual(self.results(), (2, [100.0, 0, 0]))
+
+
+@override_settings(STREAMING_CHUNK_SIZE=3)
+class StreamingTest(TestCase):
+    """Потоковая выдача списков совпадает со страницей списка"""
+
+    def setUp(self):
+        self.manager = User.objects.create_user('manager')
+        Profile.objects.filter(user=self.manager).update(is_manager=True)
+        self.manager = User.objects.select_related('profile').get(pk=self.manager.pk)
+        self.resident = User.objects.create_user('resident')
+        for i in range(7):
+            todo = ToDo.objects.create(inquiry_title=f'Заявка {i}', inquiry_text='Текст', inquiry_creator=self.resident,
+                                       todo_priority='2', todo_status='n', todo_category='1')
+            Comment.objects.create(inquiry=todo, comment_text='Комментарий', comment_creator=self.manager)
+            Notification.objects.create(inquiry_title=f'Уведомление {i}', inquiry_text='Текст',
+                                        inquiry_creator=self.manager, notification_recipient=self.resident)
+        self.client = APIClient()
+        self.client.force_authenticate(self.manager)
+
+    def stream(self, path, stream_format):
+        response = self.client.get(path, {'stream': stream_format})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.streaming)
+        return response, b''.join(response.streaming_content)
+
+    def test_json_matches_page(self):
+        for path in ('/todos', '/notifications'):
+            page = self.client.get(path, {'page_size': 100})
+            response, body = self.stream(path, 'json')
+            self.assertEqual(response['Content-Type'], 'application/json')
+            self.assertEqual(body, page.content)
+            self.assertEqual(len(json.loads(body)), 7)
+
+    def test_ndjson(self):
+        page = self.client.get('/todos', {'page_size': 100}).json()
+        response, body = self.stream('/todos', 'ndjson')
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        self.assertTrue(body.endswith(b'\n'))
+        lines = body.decode().splitlines()
+        self.assertEqual([json.loads(line) for line in lines], page)
+        self.assertTrue(all(isinstance(json.loads(line), dict) for line in lines))
+
+    def test_empty_and_invalid(self):
+        self.client.force_authenticate(User.objects.select_related('profile').get(username='resident'))
+        ToDo.objects.all().delete()
+        self.assertEqual(self.stream('/todos', 'json')[1], b'[]')
+        self.assertEqual(self.stream('/todos', 'ndjson')[1], b'')
+        self.assertEqual(self.client.get('/todos', {'stream': 'csv'}).status_code, 400)
+
+
+@override_settings(ROOT_URLCONF='inquiries.async_urls', STREAMING_CHUNK_SIZE=2)
+class AsyncViewTest(TransactionTestCase):
+    """Асинхронные представления читают БД в пуле потоков и отдают потоковые ответы порциями"""
+
+    def setUp(self):
+        get_cache().clear()
+        self.resident = User.objects.create_user('resident')
+        for i in range(5):
+            ToDo.objects.create(inquiry_title=f'Заявка {i}', inquiry_text='Текст', inquiry_creator=self.resident,
+                                todo_priority='2', todo_status='n', todo_category='1')
+        self.authorization = f'Bearer {AccessToken.for_user(self.resident)}'
+
+    def asgi_get(self, path):
+        """Сообщения ответа обработчика ASGIHandler на GET path"""
+        async def scenario():
+            received = asyncio.Queue()
+            await received.put({'type': 'http.request', 'body': b'', 'more_body': False})
+            messages = []
+
+            async def send(message):
+                messages.append(message)
+            scope = {'type': 'http', 'method': 'GET', 'path': path.partition('?')[0],
+                     'query_string': path.partition('?')[2].encode('ascii'),
+                     'scheme': 'http', 'server': ('testserver', 80),
+                     'headers': [(b'host', b'testserver'), (b'authorization', self.authorization.encode('ascii'))]}
+            await ASGIHandler()(scope, received.get, send)
+            return messages
+        return asyncio.run(scenario())
+
+    def test_async_client(self):
+        async def scenario():
+            client = AsyncClient()
+            return await client.get('/todos', authorization=self.authorization), await client.get('/todos')
+        response, anonymous = asyncio.run(scenario())
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([todo['inquiry_title'] for todo in json.loads(response.content)],
+                         [f'Заявка {i}' for i in reversed(range(5))])
+        self.assertEqual(anonymous.status_code, 401)
+
+    @skipUnless(prometheus_client is not None, 'prometheus_client не установлен')
+    def test_query_metrics(self):
+        def queries():
+            return prometheus_client.REGISTRY.get_sample_value(
+                'upravdom_http_request_db_queries_sum', {'view': 'todo_list'}) or 0
+
+        for path in ('/todos', '/todos?stream=ndjson'):
+            with override_settings(ROOT_URLCONF='upravdom.urls'):
+                before = queries()
+                response = self.client.get(path, HTTP_AUTHORIZATION=self.authorization)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+                    response.close()
+                expected = queries() - before
+            self.assertGreater(expected, 0)
+
+            before = queries()
+            self.assertEqual(self.asgi_get(path)[0]['status'], 200)
+            # Запросы, выполненные в пуле потоков, учитываются в метриках запроса
+            self.assertEqual(queries() - before, expected)
+
+    def test_streaming_response(self):
+        start, *body, end = self.asgi_get('/todos?stream=ndjson')
+        self.assertEqual(start['status'], 200)
+        self.assertIn((b'Content-Type', b'application/x-ndjson'), start['headers'])
+        # Порции по STREAMING_CHUNK_SIZE записей отправляются по мере чтения
+        self.assertEqual([len(message['body'].splitlines()) for message in body], [2, 2, 1])
+        self.assertEqual(end, {'type': 'http.response.body'})
+        lines = b''.join(message['body'] for message in body).splitlines()
+        self.assertEqual([json.loads(line)['inquiry_title'] for line in lines],
+                         [f'Заявка {i}' for i in reversed(range(5))])
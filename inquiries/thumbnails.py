@@ -0,0 +1,79 @@
+"""Уменьшенные копии фотографий профиля.
+
+После загрузки фотографии задание generate_thumbnails создаёт квадратные
+копии размеров THUMBNAIL_SIZES в формате THUMBNAIL_FORMAT и сохраняет их
+в хранилище. Имя копии выбирает хранилище (при адресации по содержимому -
+по её содержимому), поэтому имена копий записываются в File.file_thumbnails:
+по ним сериализатор отдаёт адреса без обращений к хранилищу, а повторное
+создание копий удаляет прежние.
+"""
+import io
+import os
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.db.models.signals import post_delete
+from PIL import Image, ImageOps, UnidentifiedImageError
+
+from .jobs import job
+from .models import File
+
+THUMBNAIL_EXTENSIONS = {'WEBP': 'webp', 'JPEG': 'jpg'}
+
+
+def thumbnail_name(name, size):
+    root, ext = os.path.splitext(name)
+    return f'{root}_{size}.{THUMBNAIL_EXTENSIONS[settings.THUMBNAIL_FORMAT]}'
+
+
+def render_thumbnail(image, size):
+    buffer = io.BytesIO()
+    ImageOps.fit(image, (size, size), Image.LANCZOS).save(buffer, settings.THUMBNAIL_FORMAT,
+                                                           quality=settings.THUMBNAIL_QUALITY)
+    return ContentFile(buffer.getvalue())
+
+
+@job(max_attempts=3)
+def generate_thumbnails(file_id):
+    """Создаёт уменьшенные копии изображения File file_id"""
+    file = File.objects.filter(pk=file_id).first()
+    if file is None:
+        return
+    storage = file.file.storage
+    try:
+        with storage.open(file.file.name, 'rb') as original:
+            image = Image.open(original)
+            # JPEG сразу декодируется в уменьшенном масштабе, не меньше наибольшей копии
+            largest = max(settings.THUMBNAIL_SIZES)
+            image.draft('RGB', (largest, largest))
+            image = ImageOps.exif_transpose(image)
+            if image.mode not in ('RGB', 'RGBA'):
+                image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+            if settings.THUMBNAIL_FORMAT == 'JPEG' and image.mode == 'RGBA':
+                image = image.convert('RGB')
+            thumbnails = {}
+            for size in settings.THUMBNAIL_SIZES:
+                thumbnails[str(size)] = storage.save(thumbnail_name(file.file.name, size),
+                                                     render_thumbnail(image, size))
+    except UnidentifiedImageError:
+        # Не изображение: копии не нужны
+        thumbnails = {}
+    File.objects.filter(pk=file_id).update(file_thumbnails=thumbnails)
+    # Копии с прежним содержимым получают прежние имена и не удаляются
+    for name in set(file.file_thumbnails.values()) - set(thumbnails.values()):
+        storage.delete(name)
+
+
+def delete_thumbnails(file):
+    """Удаляет уменьшенные копии файла из хранилища"""
+    for name in file.file_thumbnails.values():
+        file.file.storage.delete(name)
+    file.file_thumbnails = {}
+
+
+def thumbnails_deleted(sender, instance, **kwargs):
+    delete_thumbnails(instance)
+
+
+def connect_signals():
+    post_delete.connect(thumbnails_deleted, sender=File)
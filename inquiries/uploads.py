@@ -0,0 +1,242 @@
+"""Загрузка файлов по частям и выдача файлов с поддержкой Range.
+
+Загрузка создаётся с именем, размером и контрольной суммой SHA-256 файла,
+после чего части отправляются телами запросов PATCH с заголовком
+Upload-Offset. Тело читается блоками и сразу дописывается в файл на диске,
+поэтому память не зависит от размера части, а смещение для продолжения
+прерванной загрузки - это размер уже записанного файла. Одновременную
+запись в одну загрузку исключает закрепление строки FileUpload на
+FILE_UPLOAD_LOCK_TIMEOUT секунд. После последней части контрольная сумма
+проверяется, и файл переносится в хранилище без копирования.
+
+Права на файл проверяет Django, а байты при заданной настройке
+FILE_DELIVERY_HEADER передаёт фронтовой прокси: ответ содержит только
+заголовок X-Accel-Redirect (nginx) или X-Sendfile (Apache, lighttpd), и
+диапазоны Range обрабатывает сам прокси. Без прокси файл отдаёт
+FileResponse, который WSGI-сервер передаёт через sendfile; запрос с одним
+диапазоном Range получает ответ 206, несколько диапазонов - весь файл.
+"""
+import hashlib
+import mimetypes
+import os
+import re
+from contextlib import contextmanager
+from datetime import timedelta
+from urllib.parse import quote
+
+from django.conf import settings
+from django.core.files import File as StorageFile
+from django.db.models import Q
+from django.http.response import FileResponse, HttpResponse, StreamingHttpResponse
+from django.utils import timezone
+from rest_framework import status
+
+from .jobs import job
+from .models import File, FileUpload
+
+OFFSET_HEADER = 'Upload-Offset'
+BLOCK_SIZE = 64 * 1024
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class UploadConflict(Exception):
+    """Часть не продолжает принятые данные или загрузка уже принимает другую часть"""
+    def __init__(self, offset):
+        super().__init__(offset)
+        self.offset = offset
+
+
+class ChecksumMismatch(Exception):
+    pass
+
+
+class PartFile(StorageFile):
+    # Хранилище переносит файлы с temporary_file_path() вместо копирования
+    def __init__(self, path):
+        super().__init__(None, name=path)
+
+    def temporary_file_path(self):
+        return self.name
+
+
+def part_path(upload):
+    return os.path.join(settings.FILE_UPLOAD_PARTS_DIR, f'{upload.pk}.part')
+
+
+def received(upload):
+    """Количество принятых байт загрузки"""
+    try:
+        return os.path.getsize(part_path(upload))
+    except FileNotFoundError:
+        return 0
+
+
+@contextmanager
+def locked(upload):
+    now = timezone.now()
+    acquired = FileUpload.objects.filter(Q(upload_locked_until__isnull=True) | Q(upload_locked_until__lt=now),
+                                         pk=upload.pk) \
+        .update(upload_locked_until=now + timedelta(seconds=settings.FILE_UPLOAD_LOCK_TIMEOUT))
+    if not acquired:
+        raise UploadConflict(received(upload))
+    try:
+        yield
+    finally:
+        FileUpload.objects.filter(pk=upload.pk).update(upload_locked_until=None, upload_updated_at=timezone.now())
+
+
+def write_chunk(upload, offset, stream, length):
+    """Дописывает до length байт из stream с позиции offset; возвращает новое смещение.
+
+    Если клиент оборвал передачу, принятая часть остаётся на диске и
+    загрузка продолжается с возвращённого смещения.
+    """
+    current = received(upload)
+    if offset != current:
+        raise UploadConflict(current)
+    os.makedirs(settings.FILE_UPLOAD_PARTS_DIR, exist_ok=True)
+    with open(part_path(upload), 'ab') as part:
+        while length > 0:
+            block = stream.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            part.write(block)
+            length -= len(block)
+    return received(upload)
+
+
+def complete(upload):
+    """Проверяет контрольную сумму принятого файла и сохраняет его как File"""
+    path = part_path(upload)
+    checksum = hashlib.sha256()
+    with open(path, 'rb') as part:
+        for block in iter(lambda: part.read(BLOCK_SIZE), b''):
+            checksum.update(block)
+    if checksum.hexdigest() != upload.upload_checksum.lower():
+        discard(upload)
+        raise ChecksumMismatch()
+    part = PartFile(path)
+    part.sha256 = checksum.hexdigest()
+    file = File(file_name=upload.upload_filename, file_creator=upload.upload_creator)
+    file.file.save(upload.upload_filename, part, save=False)
+    file.save()
+    # Если такое содержимое уже есть, хранилище оставляет принятый файл на месте
+    discard(upload)
+    return file
+
+
+def discard(upload):
+    """Удаляет загрузку вместе с принятыми данными"""
+    try:
+        os.remove(part_path(upload))
+    except FileNotFoundError:
+        pass
+    upload.delete()
+
+
+@job(every=60 * 60)
+def delete_stale_uploads():
+    """Удаляет загрузки, части которых не приходили FILE_UPLOAD_EXPIRY_HOURS часов"""
+    stale = FileUpload.objects.filter(
+        upload_updated_at__lt=timezone.now() - timedelta(hours=settings.FILE_UPLOAD_EXPIRY_HOURS))
+    for upload in stale:
+        discard(upload)
+
+
+def file_state(file):
+    """ETag и дата изменения содержимого файла; None, если файла нет"""
+    if file is None:
+        return None
+    storage, name = file.file.storage, file.file.name
+    try:
+        size, modified = storage.size(name), storage.get_modified_time(name)
+    except (FileNotFoundError, NotImplementedError):
+        return None
+    return f'{file.pk}-{size:x}-{int(modified.timestamp() * 1000000):x}', modified
+
+
+def parse_range(header, size):
+    """Границы (start, end) единственного диапазона Range или None, если заголовок не применим.
+
+    Неудовлетворимый диапазон вызывает ValueError.
+    """
+    match = RANGE_RE.match(header.strip())
+    if match is None or match.groups() == ('', ''):
+        return None
+    first, last = match.groups()
+    if first:
+        start, end = int(first), min(int(last), size - 1) if last else size - 1
+        if last and int(last) < start:
+            return None
+    else:
+        start, end = max(size - int(last), 0), size - 1
+    if start > end:
+        raise ValueError(header)
+    return start, end
+
+
+def read_range(content, length):
+    try:
+        while length > 0:
+            block = content.read(min(BLOCK_SIZE, length))
+            if not block:
+                break
+            length -= len(block)
+            yield block
+    finally:
+        content.close()
+
+
+def content_disposition(filename):
+    try:
+        filename.encode('ascii')
+        return 'inline; filename="{}"'.format(filename.replace('\\', '\\\\').replace('"', r'\"'))
+    except UnicodeEncodeError:
+        return f"inline; filename*=utf-8''{quote(filename)}"
+
+
+def offloaded_response(file, etag):
+    """Ответ без тела: файл передаёт прокси по заголовку FILE_DELIVERY_HEADER"""
+    header = settings.FILE_DELIVERY_HEADER
+    if header.lower() == 'x-accel-redirect':
+        target = settings.FILE_DELIVERY_PREFIX.rstrip('/') + '/' + quote(file.file.name)
+    else:
+        target = file.file.path
+    filename = file.file_name or os.path.basename(file.file.name)
+    response = HttpResponse(content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+    response[header] = target
+    response['Content-Disposition'] = content_disposition(filename)
+    response['ETag'] = etag
+    return response
+
+
+def file_response(request, file, etag):
+    """Ответ с содержимым file: весь файл или диапазон из заголовка Range"""
+    if settings.FILE_DELIVERY_HEADER:
+        return offloaded_response(file, etag)
+
+    size = file.file.size
+    byte_range = None
+    if 'Range' in request.headers and request.headers.get('If-Range', etag) == etag:
+        try:
+            byte_range = parse_range(request.headers['Range'], size)
+        except ValueError:
+            response = HttpResponse(status=status.HTTP_416_REQUESTED_RANGE_NOT_SATISFIABLE)
+            response['Content-Range'] = f'bytes */{size}'
+            return response
+
+    content = file.file.storage.open(file.file.name, 'rb')
+    filename = file.file_name or os.path.basename(file.file.name)
+    if byte_range is None:
+        response = FileResponse(content, filename=filename)
+    else:
+        start, end = byte_range
+        content.seek(start)
+        response = StreamingHttpResponse(read_range(content, end - start + 1),
+                                         status=status.HTTP_206_PARTIAL_CONTENT,
+                                         content_type=mimetypes.guess_type(filename)[0] or 'application/octet-stream')
+        response['Content-Length'] = end - start + 1
+        response['Content-Range'] = f'bytes {start}-{end}/{size}'
+    response['Accept-Ranges'] = 'bytes'
+    response['ETag'] = etag
+    return response
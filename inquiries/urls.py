@@ -9,7 +9,9 @@ from rest_framework import routers
 #     CommentViewSet, \
 #     VoteOptionViewSet, VoteViewSet, ProfileViewSet, NotificationViewSet, \
 #     AnnouncementViewSet
-from .views import FileUploadView, announcement_detail, announcement_list, comment_list, file_download, file_upload, get_user, info_panel, notification_detail, notification_list, photo_upload, poll_detail, poll_list, post_vote, user_list, voteoption_list
+from .views import FileUploadView, announcement_detail, announcement_list, comment_list, file_download, file_upload, get_user, info_panel, notification_detail, notification_list, photo_upload, poll_detail, poll_list, post_vote, user_list, voteoption_list, \
+    notification_fanout_list, notification_fanout_detail, notification_unread_count, notification_read, \
+    file_content, upload_list, upload_detail, metrics
 
 router = routers.DefaultRouter()
 # router.register(r'announcements', AnnouncementViewSet, basename='Announcements')
@@ -34,6 +36,10 @@ urlpatterns = [
     re_path(r'^announcements/(?P<pk>[0-9]+)$', announcement_detail),
     re_path(r'^notifications$', notification_list),
     re_path(r'^notifications/(?P<pk>[0-9]+)$', notification_detail),
+    re_path(r'^notifications/unread_count$', notification_unread_count),
+    re_path(r'^notifications/read$', notification_read),
+    re_path(r'^notifications/fanout$', notification_fanout_list),
+    re_path(r'^notifications/fanout/(?P<pk>[0-9]+)$', notification_fanout_detail),
     re_path(r'^comments/(?P<inquiry_id>[0-9]+)$', comment_list),
     re_path(r'^polls$', poll_list),    
     re_path(r'^polls/(?P<pk>[0-9]+)$', poll_detail),
@@ -43,7 +49,11 @@ urlpatterns = [
     re_path(r'^upload$', FileUploadView.as_view()),
     re_path(r'^files$', file_upload),
     re_path(r'^files/(?P<pk>[0-9]+)$', file_download),
+    re_path(r'^files/(?P<pk>[0-9]+)/content$', file_content),
+    re_path(r'^uploads$', upload_list),
+    re_path(r'^uploads/(?P<pk>[0-9a-f-]+)$', upload_detail),
     re_path(r'^photo/(?P<pk>[0-9]+)$', photo_upload),
+    re_path(r'^metrics$', metrics),
 ]
 
 if settings.DEBUG:
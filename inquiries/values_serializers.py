@@ -0,0 +1,169 @@
+"""Сериализация списков из строк queryset.values().
+
+Сериализатор DRF на каждую запись создаёт экземпляр модели, а вложенный
+UserSerializer в to_representation ещё и заново строит набор полей, поэтому
+на списках в тысячи строк время уходит на интроспекцию, а не на данные.
+ValuesSerializer один раз разбирает поля сериализатора serializer_class
+(вместе с вложенными сериализаторами) в план: какие столбцы выбрать через
+values() и как получить из значения столбца представление поля. Значения
+преобразуются методами to_representation тех же полей DRF, а подписи
+get_*_display берутся из заранее построенных таблиц вариантов, поэтому JSON
+совпадает с ответом исходного сериализатора.
+"""
+from django.core.exceptions import ImproperlyConfigured
+from django.utils.encoding import force_str
+from rest_framework import serializers
+from rest_framework.relations import PrimaryKeyRelatedField
+
+from .serializers import ToDoListSerializer, AnnouncementListSerializer, NotificationSerializer, UserSerializer
+
+
+class Plan:
+    """Столбцы values() и функция, собирающая представление записи из строки"""
+    def __init__(self, columns, render):
+        self.columns = columns
+        self.render = render
+
+
+def column_getter(column, convert=None):
+    if convert is None:
+        return lambda row: row[column]
+
+    def get(row):
+        value = row[column]
+        return None if value is None else convert(value)
+    return get
+
+
+def display_getter(model, column, source):
+    # get_FOO_display() без экземпляра модели
+    field = model._meta.get_field(source[len('get_'):-len('_display')])
+    labels = {value: force_str(label) for value, label in field.flatchoices}
+
+    def get(row):
+        value = row[column]
+        return None if value is None else str(labels.get(value, value))
+    return get
+
+
+def file_getter(model, column, name):
+    storage = model._meta.get_field(name).storage
+    return lambda row: storage.url(row[column]) if row[column] else None
+
+
+def method_getter(serializer, field, prefix):
+    # Метод сериализатора получает экземпляр модели, собранный из столбцов строки
+    model = serializer.Meta.model
+    attnames = [(prefix + model_field.name, model_field.attname) for model_field in model._meta.concrete_fields]
+    method = getattr(serializer, field.method_name)
+
+    def get(row):
+        return method(model(**{attname: row[column] for column, attname in attnames}))
+    return get, [column for column, _ in attnames]
+
+
+def nested_getter(serializer_class, pk_column, prefix, empty=None):
+    plan = compile_serializer(serializer_class(), prefix)
+
+    def get(row):
+        if row[pk_column] is None:
+            return None if empty is None else dict(empty)
+        return plan.render(row)
+    return get, plan.columns
+
+
+def compile_serializer(serializer, prefix='', nested_fields=None):
+    """План сериализации строк values() с полями serializer; столбцы получают префикс prefix"""
+    model = serializer.Meta.model
+    nested_fields = nested_fields or {}
+    getters, columns = [], []
+    for name, field in serializer.fields.items():
+        if field.write_only:
+            continue
+        column = prefix + field.source.replace('.', '__')
+        if name in nested_fields:
+            # Как в to_representation: Serializer(None).data - пустое представление
+            serializer_class = nested_fields[name]
+            get, nested_columns = nested_getter(serializer_class, column, column + '__',
+                                                empty=serializer_class(None).data)
+            columns.append(column)
+            columns.extend(nested_columns)
+        elif isinstance(field, serializers.SerializerMethodField):
+            get, nested_columns = method_getter(serializer, field, prefix)
+            columns.extend(nested_columns)
+        elif isinstance(field, serializers.ModelSerializer):
+            model_pk = field.Meta.model._meta.pk.name
+            get, nested_columns = nested_getter(type(field), f'{column}__{model_pk}', column + '__')
+            columns.extend(nested_columns)
+        elif field.source.startswith('get_') and field.source.endswith('_display'):
+            column = prefix + field.source[len('get_'):-len('_display')]
+            get = display_getter(model, column, field.source)
+            columns.append(column)
+        elif isinstance(field, PrimaryKeyRelatedField) and field.pk_field is None:
+            get = column_getter(column)
+            columns.append(column)
+        elif isinstance(field, serializers.FileField):
+            get = file_getter(model, column, field.source)
+            columns.append(column)
+        elif isinstance(field, serializers.Field) and not isinstance(field, (serializers.RelatedField,
+                                                                            serializers.ManyRelatedField,
+                                                                            serializers.BaseSerializer)):
+            get = column_getter(column, field.to_representation)
+            columns.append(column)
+        else:
+            raise ImproperlyConfigured(f'{type(serializer).__name__}.{name}: поле {type(field).__name__} '
+                                       f'не поддерживается ValuesSerializer')
+        getters.append((name, get))
+
+    def render(row):
+        return {name: get(row) for name, get in getters}
+    return Plan(list(dict.fromkeys(columns)), render)
+
+
+class ValuesSerializer:
+    """Быстрый вариант списочного сериализатора serializer_class для строк values().
+
+    nested_fields задаёт поля, которые to_representation исходного
+    сериализатора заменяет вложенным сериализатором (обычно UserSerializer).
+    Интерфейс совпадает с EagerLoadingMixin: представление передаёт queryset
+    в setup_eager_loading, а страницу - в ValuesSerializer(page, many=True).
+    """
+    serializer_class = None
+    nested_fields = {}
+    plan = None
+
+    def __init__(self, instance, many=False):
+        self.instance = instance
+        self.many = many
+
+    @classmethod
+    def get_plan(cls):
+        if cls.__dict__.get('plan') is None:
+            cls.plan = compile_serializer(cls.serializer_class(), nested_fields=cls.nested_fields)
+        return cls.plan
+
+    @classmethod
+    def setup_eager_loading(cls, queryset):
+        return queryset.values(*cls.get_plan().columns)
+
+    @property
+    def data(self):
+        render = self.get_plan().render
+        if self.many:
+            return [render(row) for row in self.instance]
+        return render(self.instance)
+
+
+class ToDoListValuesSerializer(ValuesSerializer):
+    serializer_class = ToDoListSerializer
+    nested_fields = {'inquiry_creator': UserSerializer}
+
+
+class AnnouncementListValuesSerializer(ValuesSerializer):
+    serializer_class = AnnouncementListSerializer
+    nested_fields = {'inquiry_creator': UserSerializer}
+
+
+class NotificationValuesSerializer(ValuesSerializer):
+    serializer_class = NotificationSerializer
+    nested_fields = {'notification_recipient': UserSerializer}
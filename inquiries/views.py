@@ -1,31 +1,82 @@
-from datetime import datetime
 import re
+from django.conf import settings
 from django.utils import timezone
+from django.utils.http import quote_etag
 from django.core.paginator import Paginator, EmptyPage, PageNotAnInteger
-from django.db.models import Q
 from django.shortcuts import render
-from django.http.response import HttpResponse, JsonResponse
+from django.http.response import HttpResponse
 
 from rest_framework.response import Response
 from rest_framework import viewsets, permissions, status
-from rest_framework.decorators import api_view, permission_classes
+from rest_framework.decorators import api_view, permission_classes, authentication_classes
 from rest_framework.views import APIView
 from rest_framework.parsers import JSONParser, FileUploadParser
+from rest_framework.settings import api_settings
 from inquiries.serializers import UserSerializer, AnnouncementSerializer, ToDoSerializer, PollSerializer, NotificationSerializer, \
-    CommentSerializer, VoteOptionSerializer, VoteSerializer, ProfileSerializer, ToDoCategorySerializer, InfoSerializer, ToDoListSerializer, AnnouncementListSerializer, \
-    FileSerializer
-from inquiries.models import Announcement, ToDo, Poll, Notification, Info, Property, Comment, VoteOption, Vote, Profile, ToDoCategory, Inquiry, File
+    CommentSerializer, VoteOptionSerializer, VoteSerializer, ProfileSerializer, ToDoCategorySerializer, InfoSerializer, \
+    FileSerializer, NotificationFanoutSerializer, NotificationReadSerializer, FileUploadSerializer
+from inquiries.values_serializers import ToDoListValuesSerializer, AnnouncementListValuesSerializer, \
+    NotificationValuesSerializer
+from inquiries.models import Announcement, ToDo, Poll, Notification, Info, Property, Comment, VoteOption, Vote, Profile, ToDoCategory, Inquiry, File, \
+    NotificationFanout, FileUpload
+from inquiries.encoding import JsonResponse
+from inquiries.pagination import KeysetPagination
+from inquiries.search import search, SEARCH_ORDERING
+from inquiries.cache import cache_response, invalidate
+from inquiries.business_logic import annotate_user_vote, cast_vote, PollClosed, AlreadyVoted, \
+    visible_todos, visible_announcements, visible_notifications, start_fanout, mark_notifications_read, \
+    unread_notification_count, visible_files
+from inquiries.conditional import conditional, list_state, detail_state
+from inquiries.events import todo_changed
+from inquiries.streaming import get_stream_format, streaming_response, STREAM_CONTENT_TYPES
+from inquiries.uploads import OFFSET_HEADER, UploadConflict, ChecksumMismatch, locked, write_chunk, complete, \
+    discard, file_state, file_response
+from inquiries.thumbnails import delete_thumbnails
+from inquiries.jobs import enqueue
+from inquiries.metrics import prometheus_client, render_metrics, MetricsTokenAuthentication, CanReadMetrics
 from django.contrib.auth.models import User
 
+
+def inquiry_pagination(request, queryset):
+    """Список заявок с учётом поиска по inquiry_title и пагинатор для него"""
+    title = request.GET.get('inquiry_title', None)
+    if title is None:
+        return queryset, KeysetPagination()
+    return search(queryset, title), KeysetPagination(ordering=SEARCH_ORDERING)
+
+
+def inquiry_list_state(visible, extra_fields=()):
+    """Состояние страницы списка заявок, доступных пользователю через visible(request)"""
+    def state(request):
+        if get_stream_format(request) is not None:
+            return None
+        return list_state(request, *inquiry_pagination(request, visible(request)), extra_fields=extra_fields)
+    return state
+
+
+def inquiry_list_response(request, queryset, serializer_class):
+    """Страница списка заявок или весь список потоком, если передан параметр stream"""
+    queryset, paginator = inquiry_pagination(request, serializer_class.setup_eager_loading(queryset))
+    stream_format = get_stream_format(request)
+    if stream_format is not None:
+        if stream_format not in STREAM_CONTENT_TYPES:
+            return JsonResponse({'stream': ['Допустимые значения: ' + ', '.join(STREAM_CONTENT_TYPES)]},
+                                status=status.HTTP_400_BAD_REQUEST)
+        return streaming_response(queryset, paginator.ordering, serializer_class, stream_format)
+    page = paginator.paginate_queryset(queryset, request)
+    return paginator.get_paginated_response(serializer_class(page, many=True).data)
+
+
 # Create your views here.
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
 def user_list(request):
     if request.method == 'GET':
         if request.user.profile.is_manager:
-            users = User.objects.all()
+            paginator = KeysetPagination(ordering=('date_joined', 'id'))
+            users = paginator.paginate_queryset(UserSerializer.setup_eager_loading(User.objects.all()), request)
             users_serializer = UserSerializer(users, many=True)
-            return JsonResponse(users_serializer.data, safe=False)    
+            return paginator.get_paginated_response(users_serializer.data)
         return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
 
     elif request.method == 'POST':
@@ -43,7 +94,8 @@ def user_list(request):
 @permission_classes([permissions.IsAuthenticated])
 def get_user(request):
     if request.method == 'GET':
-        user = UserSerializer(request.user)
+        # request.user может быть собран из утверждений токена без профиля
+        user = UserSerializer(User.objects.select_related('profile__photo').get(pk=request.user.pk))
         return JsonResponse(user.data, safe=False)
 
     elif request.method == 'PUT':
@@ -57,20 +109,11 @@ def get_user(request):
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(inquiry_list_state(lambda request: visible_todos(request.user)))
 def todo_list(request):
     if request.method == 'GET':
-        
-        if request.user.profile.is_manager == True:
-            todos = ToDo.objects.all()
-        else:
-            todos = ToDo.objects.filter(inquiry_creator=request.user)
-        
-        title = request.GET.get('inquiry_title', None)
-        if title is not None:
-            todos = todos.filter(title__icontains=title)
-
-        todos_serializer = ToDoListSerializer(todos, many=True)
-        return JsonResponse(todos_serializer.data, safe=False)
+        todos = visible_todos(request.user)
+        return inquiry_list_response(request, todos, ToDoListValuesSerializer)
 
     elif request.method == 'POST':
         todo_data = JSONParser().parse(request)
@@ -107,18 +150,18 @@ def post_vote(request):
 
     if request.method == 'POST':
         vote_data = JSONParser().parse(request)
-        vote_data['voter'] = request.user.id
-
-        vote_options = VoteOption.objects.get(pk=vote_data['selected_option']).poll.voteoption_set.all()
-        for option in vote_options:
-            if option.vote_set.values().filter(voter_id=request.user.id):
-                return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
-
-        vote_serializer = VoteSerializer(data=vote_data)
-        if vote_serializer.is_valid():
-            vote_serializer.save()
-            return JsonResponse(vote_serializer.data, status=status.HTTP_201_CREATED)
-        return JsonResponse(vote_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            vote = cast_vote(request.user, int(vote_data['selected_option']))
+        except (KeyError, TypeError, ValueError):
+            return JsonResponse({'selected_option': ['Обязательное поле.']}, status=status.HTTP_400_BAD_REQUEST)
+        except VoteOption.DoesNotExist:
+            return JsonResponse({'message': 'Вариант голосования не существует'}, status=status.HTTP_404_NOT_FOUND)
+        except PollClosed:
+            return JsonResponse({'message': 'Голосование завершено'}, status=status.HTTP_403_FORBIDDEN)
+        except AlreadyVoted:
+            return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
+        vote_serializer = VoteSerializer(vote)
+        return JsonResponse(vote_serializer.data, status=status.HTTP_201_CREATED)
     return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
 
 
@@ -146,19 +189,18 @@ def comment_list(request, inquiry_id):
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(inquiry_list_state(lambda request: visible_announcements(request.user)))
+@cache_response('announcement_list', scope='user')
 def announcement_list(request):
 
     if request.method == 'GET':
 
-        announcements = Announcement.objects.filter(
-            Q(announcement_is_visible = True, announcement_auto_invisible_date__gt=datetime.today().date()) | 
-            Q(inquiry_creator=request.user))
-        title = request.GET.get('inquiry_title', None)
-        if title is not None:
-            announcements = announcements.filter(title__icontains=title)
-        
-        announcements_serializer = AnnouncementListSerializer(announcements, many=True)
-        return JsonResponse(announcements_serializer.data, safe=False)
+        announcements = visible_announcements(request.user)
+        announcements, paginator = inquiry_pagination(
+            request, AnnouncementListValuesSerializer.setup_eager_loading(announcements))
+        announcements = paginator.paginate_queryset(announcements, request)
+        announcements_serializer = AnnouncementListValuesSerializer(announcements, many=True)
+        return paginator.get_paginated_response(announcements_serializer.data)
 
     elif request.method == 'POST':
         announcement_data = JSONParser().parse(request)
@@ -173,17 +215,18 @@ def announcement_list(request):
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(inquiry_list_state(lambda request: Poll.objects.all()))
+@cache_response('poll_list', scope='user')
 def poll_list(request):
 
     if request.method == 'GET':
 
         polls = Poll.objects.all()
-        title = request.GET.get('inquiry_title', None)
-        if title is not None:
-            polls = polls.filter(title__icontains=title)
-        
+        polls, paginator = inquiry_pagination(
+            request, annotate_user_vote(PollSerializer.setup_eager_loading(polls), request.user))
+        polls = paginator.paginate_queryset(polls, request)
         polls_serializer = PollSerializer(polls, many=True)
-        return JsonResponse(polls_serializer.data, safe=False)
+        return paginator.get_paginated_response(polls_serializer.data)
 
     elif request.method == 'POST':
         polls_data = JSONParser().parse(request)
@@ -202,19 +245,13 @@ def poll_list(request):
 
 @api_view(['GET', 'POST', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(inquiry_list_state(lambda request: visible_notifications(request.user),
+                                 extra_fields=('notification_is_read',)))
 def notification_list(request):
 
     if request.method == 'GET':
-        if (request.user.profile.is_manager):
-            notifications = Notification.objects.all()
-        else:
-            notifications = Notification.objects.filter(notification_recipient=request.user)
-        title = request.GET.get('inquiry_title', None)
-        if title is not None:
-            notifications = notifications.filter(title__icontains=title)
-        
-        notifications_serializer = NotificationSerializer(notifications, many=True)
-        return JsonResponse(notifications_serializer.data, safe=False)
+        notifications = visible_notifications(request.user)
+        return inquiry_list_response(request, notifications, NotificationValuesSerializer)
 
     elif request.method == 'POST':
         notification_data = JSONParser().parse(request)
@@ -228,6 +265,7 @@ def notification_list(request):
 
 @api_view(['GET'])
 @permission_classes([permissions.IsAuthenticated])
+@cache_response('info_panel', scope='all')
 def info_panel(request):
 
     if request.method == 'GET':
@@ -238,11 +276,74 @@ def info_panel(request):
         return JsonResponse(infos_serializer.data, safe=False)
         
 
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_unread_count(request):
+
+    if request.method == 'GET':
+        return JsonResponse({'unread_count': unread_notification_count(request.user)})
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_read(request):
+
+    if request.method == 'POST':
+        read_serializer = NotificationReadSerializer(data=JSONParser().parse(request))
+        if read_serializer.is_valid():
+            notifications = Notification.objects.all()
+            if 'ids' in read_serializer.validated_data:
+                notifications = notifications.filter(pk__in=read_serializer.validated_data['ids'])
+            if 'before' in read_serializer.validated_data:
+                notifications = notifications.filter(inquiry_created_at__lte=read_serializer.validated_data['before'])
+            updated = mark_notifications_read(request.user, notifications)
+            return JsonResponse({'updated': updated, 'unread_count': unread_notification_count(request.user)})
+        return JsonResponse(read_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_fanout_list(request):
+
+    if request.method == 'POST':
+        if request.user.profile.is_manager:
+            fanout_data = JSONParser().parse(request)
+            fanout_data['fanout_creator'] = request.user.id
+            fanout_serializer = NotificationFanoutSerializer(data=fanout_data)
+            if fanout_serializer.is_valid():
+                fanout = start_fanout(fanout_serializer.save())
+                fanout_serializer = NotificationFanoutSerializer(fanout)
+                if fanout.fanout_status == 'q':
+                    return JsonResponse(fanout_serializer.data, status=status.HTTP_202_ACCEPTED)
+                if fanout.fanout_status == 'f':
+                    # Текст ошибки - в поле fanout_error
+                    return JsonResponse(fanout_serializer.data, status=status.HTTP_500_INTERNAL_SERVER_ERROR)
+                return JsonResponse(fanout_serializer.data, status=status.HTTP_201_CREATED)
+            return JsonResponse(fanout_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
+
+
+@api_view(['GET'])
+@permission_classes([permissions.IsAuthenticated])
+def notification_fanout_detail(request, pk):
+    if not request.user.profile.is_manager:
+        return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
+    try:
+        fanout = NotificationFanout.objects.get(pk=pk)
+    except NotificationFanout.DoesNotExist:
+        return JsonResponse({'message': 'Рассылка не существует'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method == 'GET':
+        fanout_serializer = NotificationFanoutSerializer(fanout)
+        return JsonResponse(fanout_serializer.data)
+
+
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(lambda request, pk: detail_state(request, visible_announcements(request.user).filter(pk=pk)))
 def announcement_detail(request, pk):
     try: 
-        announcement = Announcement.objects.get(pk=pk)
+        announcement = AnnouncementSerializer.setup_eager_loading(Announcement.objects.all()).get(pk=pk)
     except Announcement.DoesNotExist: 
         return JsonResponse({'message': 'Объявление не существует'}, status=status.HTTP_404_NOT_FOUND) 
 
@@ -259,6 +360,7 @@ def announcement_detail(request, pk):
                 announcement_is_visible = announcement_data['announcement_is_visible'],
                 announcement_auto_invisible_date = announcement_data['announcement_auto_invisible_date'],
                 inquiry_updated_at = timezone.now())
+            invalidate('announcement_list')
             return JsonResponse({'message': 'Статус публикации изменён'}, status=status.HTTP_200_OK)
         return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
 
@@ -272,9 +374,10 @@ def announcement_detail(request, pk):
 
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(lambda request, pk: detail_state(request, Poll.objects.filter(pk=pk)))
 def poll_detail(request, pk):
     try: 
-        poll = Poll.objects.get(pk=pk)
+        poll = annotate_user_vote(PollSerializer.setup_eager_loading(Poll.objects.all()), request.user).get(pk=pk)
     except Poll.DoesNotExist: 
         return JsonResponse({'message': 'Голосование не существует'}, status=status.HTTP_404_NOT_FOUND) 
 
@@ -286,9 +389,11 @@ def poll_detail(request, pk):
 
 @api_view(['GET', 'PUT'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(lambda request, pk: detail_state(request, visible_notifications(request.user).filter(pk=pk),
+                                              extra_fields=('notification_is_read',)))
 def notification_detail(request, pk):
     try: 
-        notification = Notification.objects.get(pk=pk)
+        notification = NotificationSerializer.setup_eager_loading(Notification.objects.all()).get(pk=pk)
     except Notification.DoesNotExist: 
         return JsonResponse({'message': 'Уведомление не существует'}, status=status.HTTP_404_NOT_FOUND) 
 
@@ -299,9 +404,7 @@ def notification_detail(request, pk):
 
     elif request.method == 'PUT': 
         if notification.notification_recipient == request.user:
-            Notification.objects.filter(pk=pk).update(
-                notification_is_read = True,
-                inquiry_updated_at = timezone.now())
+            mark_notifications_read(request.user, Notification.objects.filter(pk=pk))
             return JsonResponse({'message': 'Уведомление прочтено получателем'}, status=status.HTTP_200_OK)
         elif request.user.profile.is_manager:
             return JsonResponse({'message': 'Ok'}, status=status.HTTP_200_OK)
@@ -310,9 +413,10 @@ def notification_detail(request, pk):
  
 @api_view(['GET', 'PUT', 'DELETE'])
 @permission_classes([permissions.IsAuthenticated])
+@conditional(lambda request, pk: detail_state(request, visible_todos(request.user).filter(pk=pk)))
 def todo_detail(request, pk):
     try:
-        todo = ToDo.objects.get(pk=pk)
+        todo = ToDoSerializer.setup_eager_loading(ToDo.objects.all()).get(pk=pk)
     except ToDo.DoesNotExist:
         return JsonResponse({'message': 'Заявка не существует'}, status=status.HTTP_404_NOT_FOUND)
 
@@ -331,11 +435,13 @@ def todo_detail(request, pk):
                 todo_assigned_to = todo_data['todo_assigned_to'],
                 todo_status = todo_data['todo_status'],
                 inquiry_updated_at = timezone.now())
+            todo_changed(pk)
             return JsonResponse({'message': 'Статус заявки и исполнитель обновлены'}, status=status.HTTP_200_OK)
         elif ((todo.todo_status == 'r') & (todo.inquiry_creator==request.user)):
             todo_data = JSONParser().parse(request)
             ToDo.objects.filter(pk=pk).update(todo_status = todo_data['todo_status'],
                 inquiry_updated_at = timezone.now())
+            todo_changed(pk)
             return JsonResponse({'message': 'Статус заявки обновлён'}, status=status.HTTP_200_OK)
         return JsonResponse({'message': 'Доступ запрещён'}, status=status.HTTP_403_FORBIDDEN)
 
@@ -347,7 +453,7 @@ class FileUploadView(APIView):
       file_serializer = FileSerializer(data=request.data)
 
       if file_serializer.is_valid():
-          file_serializer.save()
+          file_serializer.save(file_creator=request.user)
           return Response(file_serializer.data, status=status.HTTP_201_CREATED)
       else:
           return Response(file_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -372,20 +478,99 @@ def file_download(request, pk):
         if file_serializer.is_valid():
             file = File.objects.get(pk=pk)
             file.file.delete()
+            delete_thumbnails(file)
             file.file = request.data['file']
             file.save()
+            if Profile.objects.filter(photo=file).exists():
+                enqueue('generate_thumbnails', file.pk)
             return JsonResponse({'message': 'Файл обновлён'}, status=status.HTTP_201_CREATED)
         else:
             return JsonResponse(file_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET', 'HEAD'])
+@permission_classes([permissions.IsAuthenticated])
+@conditional(lambda request, pk: file_state(visible_files(request.user).filter(pk=pk).first()))
+def file_content(request, pk):
+    file = visible_files(request.user).filter(pk=pk).first()
+    state = file_state(file)
+    if state is None:
+        return JsonResponse({'message': 'Файл не существует'}, status=status.HTTP_404_NOT_FOUND)
+    return file_response(request, file, quote_etag(state[0]))
+
+
+@api_view(['POST'])
+@permission_classes([permissions.IsAuthenticated])
+def upload_list(request):
+
+    if request.method == 'POST':
+        upload_data = JSONParser().parse(request)
+        upload_serializer = FileUploadSerializer(data=upload_data)
+        if upload_serializer.is_valid():
+            upload_serializer.save(upload_creator=request.user)
+            response = JsonResponse(upload_serializer.data, status=status.HTTP_201_CREATED)
+            response[OFFSET_HEADER] = 0
+            return response
+        return JsonResponse(upload_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+
+
+@api_view(['GET', 'HEAD', 'PATCH', 'DELETE'])
+@permission_classes([permissions.IsAuthenticated])
+def upload_detail(request, pk):
+    try:
+        upload = FileUpload.objects.get(pk=pk, upload_creator=request.user)
+    except FileUpload.DoesNotExist:
+        return JsonResponse({'message': 'Загрузка не существует'}, status=status.HTTP_404_NOT_FOUND)
+
+    if request.method in ('GET', 'HEAD'):
+        upload_serializer = FileUploadSerializer(upload)
+        response = JsonResponse(upload_serializer.data)
+        response[OFFSET_HEADER] = upload_serializer.data['upload_offset']
+        return response
+
+    elif request.method == 'PATCH':
+        try:
+            offset = int(request.headers[OFFSET_HEADER])
+        except (KeyError, ValueError):
+            return JsonResponse({'message': f'Не указан заголовок {OFFSET_HEADER}'}, status=status.HTTP_400_BAD_REQUEST)
+        if request.META.get('CONTENT_LENGTH') in (None, ''):
+            return JsonResponse({'message': 'Не указан размер части'}, status=status.HTTP_411_LENGTH_REQUIRED)
+        length = int(request.META['CONTENT_LENGTH'])
+        if length > settings.FILE_UPLOAD_CHUNK_SIZE:
+            return JsonResponse({'message': f'Размер части не должен превышать {settings.FILE_UPLOAD_CHUNK_SIZE} байт'},
+                                status=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE)
+        if offset + length > upload.upload_size:
+            return JsonResponse({'message': 'Часть выходит за пределы файла'}, status=status.HTTP_400_BAD_REQUEST)
+        try:
+            with locked(upload):
+                offset = write_chunk(upload, offset, request.stream, length)
+                if offset == upload.upload_size:
+                    file = complete(upload)
+                    return JsonResponse(FileSerializer(file).data, status=status.HTTP_201_CREATED)
+        except UploadConflict as exc:
+            response = JsonResponse({'message': 'Смещение части не совпадает с принятыми данными'},
+                                    status=status.HTTP_409_CONFLICT)
+            response[OFFSET_HEADER] = exc.offset
+            return response
+        except ChecksumMismatch:
+            return JsonResponse({'message': 'Контрольная сумма не совпадает, загрузите файл заново'},
+                                status=status.HTTP_400_BAD_REQUEST)
+        response = HttpResponse(status=status.HTTP_204_NO_CONTENT)
+        response[OFFSET_HEADER] = offset
+        return response
+
+    elif request.method == 'DELETE':
+        discard(upload)
+        return JsonResponse({'message': 'Загрузка отменена'}, status=status.HTTP_200_OK)
+
+
 @api_view(['POST'])
 @permission_classes([permissions.IsAuthenticated])
 def file_upload(request):
     if request.method == 'POST':
         file_serializer = FileSerializer(data=request.data)
         if file_serializer.is_valid():
-            file_serializer.save()
+            file_serializer.save(file_creator=request.user)
             return JsonResponse(file_serializer.data, status=status.HTTP_201_CREATED)
         else:
             return JsonResponse(file_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
@@ -397,15 +582,27 @@ def photo_upload(request, pk):
     if request.method == 'POST':
         file_serializer = FileSerializer(data=request.data)
         if file_serializer.is_valid():
-            file = file_serializer.save()
+            file = file_serializer.save(file_creator=request.user)
             Profile.objects.filter(user=pk).update(
                 photo = file
             )
+            enqueue('generate_thumbnails', file.pk)
             return JsonResponse(file_serializer.data, status=status.HTTP_201_CREATED)
         else:
             return JsonResponse(file_serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
+@api_view(['GET'])
+@authentication_classes([MetricsTokenAuthentication] + api_settings.DEFAULT_AUTHENTICATION_CLASSES)
+@permission_classes([CanReadMetrics])
+def metrics(request):
+    if prometheus_client is None:
+        return JsonResponse({'message': 'Метрики отключены: не установлен prometheus_client'},
+                            status=status.HTTP_404_NOT_FOUND)
+    body, content_type = render_metrics()
+    return HttpResponse(body, content_type=content_type)
+
+
 # @api_view(['GET', 'POST', 'DELETE'])
 # @permission_classes([permissions.IsAuthenticated])
 # def todocategory_list(request):
@@ -9,8 +9,17 @@ https://docs.djangoproject.com/en/3.2/howto/deployment/asgi/
 
 import os
 
-from django.core.asgi import get_asgi_application
+import django
 
 os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'upravdom.settings')
+os.environ.setdefault('ROOT_URLCONF', 'inquiries.async_urls')
 
-application = get_asgi_application()
+django.setup(set_prefix=False)
+
+from inquiries.async_views import ASGIHandler  # noqa: E402 - после настройки Django
+from inquiries.sse import EventStreamApplication  # noqa: E402
+
+# Как get_asgi_application(), но потоковые ответы читаются в пуле потоков БД
+django_application = ASGIHandler()
+
+application = EventStreamApplication(django_application)
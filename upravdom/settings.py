@@ -50,7 +50,10 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'inquiries.metrics.MetricsMiddleware',
+    'inquiries.slow_queries.SlowQueryMiddleware',
     'corsheaders.middleware.CorsMiddleware',
+    'inquiries.compression.CompressionMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -64,21 +67,80 @@ REST_FRAMEWORK = {
     'DEFAULT_FILTER_BACKENDS': [
         'django_filters.rest_framework.DjangoFilterBackend'
     ],
+    'DEFAULT_RENDERER_CLASSES': [
+        'inquiries.encoding.JSONRenderer',
+        'rest_framework.renderers.BrowsableAPIRenderer',
+    ],
     'DEFAULT_AUTHENTICATION_CLASSES': [
         'rest_framework.authentication.SessionAuthentication',
         'rest_framework.authentication.BasicAuthentication',
-        'rest_framework_simplejwt.authentication.JWTAuthentication',
+        'inquiries.authentication.RoleClaimsJWTAuthentication',
     ],
-    'EXCEPTION_HANDLER': 'upravdom.401handler.custom_exception_handler'
+    'EXCEPTION_HANDLER': 'upravdom.401handler.custom_exception_handler',
+    'DEFAULT_PAGINATION_CLASS': 'inquiries.pagination.KeysetPagination',
+    'PAGE_SIZE': int(os.getenv("PAGE_SIZE", "50")),
 }
 
+# Размер порции строк при потоковой выдаче списков (?stream=json|ndjson)
+STREAMING_CHUNK_SIZE = int(os.getenv("STREAMING_CHUNK_SIZE", "500"))
+
+# Массовая рассылка уведомлений: рассылки до FANOUT_SYNC_LIMIT получателей
+# выполняются в запросе, более крупные - фоновым заданием; строки вставляются пакетами.
+FANOUT_SYNC_LIMIT = int(os.getenv("FANOUT_SYNC_LIMIT", "200"))
+FANOUT_BATCH_SIZE = int(os.getenv("FANOUT_BATCH_SIZE", "500"))
+
+# Фоновые задания выполняет manage.py run_jobs (можно запускать несколько
+# процессов). JOBS_POLL_INTERVAL - пауза между опросами пустой очереди,
+# JOBS_LEASE - на сколько секунд задание закрепляется за обработчиком.
+JOBS_POLL_INTERVAL = int(os.getenv("JOBS_POLL_INTERVAL", "5"))
+JOBS_LEASE = int(os.getenv("JOBS_LEASE", "300"))
+JOBS_KEEP_DAYS = int(os.getenv("JOBS_KEEP_DAYS", "7"))
+# Периоды (в секундах) снятия объявлений с публикации и завершения голосований
+ANNOUNCEMENT_EXPIRY_INTERVAL = int(os.getenv("ANNOUNCEMENT_EXPIRY_INTERVAL", "600"))
+POLL_CLOSE_INTERVAL = int(os.getenv("POLL_CLOSE_INTERVAL", "60"))
+
 SIMPLE_JWT = {
     'ACCESS_TOKEN_LIFETIME': timedelta(days=1),
     'REFRESH_TOKEN_LIFETIME': timedelta(days=1),
     'ROTATE_REFRESH_TOKENS': True,
 }
 
-ROOT_URLCONF = 'upravdom.urls'
+# Роль пользователя передаётся в токене (inquiries.authentication), и
+# запросы авторизуются без обращений к БД. Смена роли, блокировка и смена
+# пароля отзывают токены не позже чем через JWT_CLAIMS_CACHE_TIMEOUT секунд
+# (сразу, если кэш 'responses' общий для всех процессов).
+JWT_ROLE_CLAIMS = os.getenv("JWT_ROLE_CLAIMS", "False") == "True"
+JWT_CLAIMS_CACHE_TIMEOUT = int(os.getenv("JWT_CLAIMS_CACHE_TIMEOUT", "60"))
+
+# Кодировщик JSON ответов API (inquiries.encoding): auto, json или orjson.
+# auto выбирает orjson, если библиотека установлена (pip install orjson).
+JSON_ENCODER = os.getenv("JSON_ENCODER", 'auto')
+
+# Сжатие ответов JSON (inquiries.compression): gzip, а при установленной
+# библиотеке brotli (pip install brotli) - br. Ответы меньше
+# COMPRESSION_MIN_SIZE байт отдаются без сжатия.
+COMPRESSION_MIN_SIZE = int(os.getenv("COMPRESSION_MIN_SIZE", "1024"))
+COMPRESSION_GZIP_LEVEL = int(os.getenv("COMPRESSION_GZIP_LEVEL", "6"))
+COMPRESSION_BROTLI_QUALITY = int(os.getenv("COMPRESSION_BROTLI_QUALITY", "5"))
+
+# Метрики запросов для Prometheus (inquiries.metrics) на /metrics. Сборщик
+# передаёт METRICS_TOKEN в заголовке Authorization: Bearer; управляющие
+# читают метрики со своим JWT. При нескольких воркерах gunicorn задайте
+# переменную окружения PROMETHEUS_MULTIPROC_DIR - пустой каталог, общий
+# для воркеров, - тогда /metrics суммирует значения всех воркеров.
+METRICS_TOKEN = os.getenv("METRICS_TOKEN", '')
+
+# Журнал медленных запросов к БД (inquiries.slow_queries): запросы дольше
+# SLOW_QUERY_THRESHOLD миллисекунд (0 - журнал отключён) пишутся в лог и в
+# таблицу SlowQuery. В PostgreSQL для доли SLOW_QUERY_EXPLAIN_RATE медленных
+# SELECT сохраняется план EXPLAIN (без повторного выполнения запроса).
+# Сводка по запросам - manage.py slow_queries.
+SLOW_QUERY_THRESHOLD = float(os.getenv("SLOW_QUERY_THRESHOLD", "500"))
+SLOW_QUERY_EXPLAIN_RATE = float(os.getenv("SLOW_QUERY_EXPLAIN_RATE", "0.1"))
+SLOW_QUERY_STACK_DEPTH = int(os.getenv("SLOW_QUERY_STACK_DEPTH", "8"))
+SLOW_QUERY_KEEP_DAYS = int(os.getenv("SLOW_QUERY_KEEP_DAYS", "30"))
+
+ROOT_URLCONF = os.getenv("ROOT_URLCONF", 'upravdom.urls')
 
 TEMPLATES = [
     {
@@ -98,6 +160,18 @@ TEMPLATES = [
 
 WSGI_APPLICATION = 'upravdom.wsgi.application'
 
+# ASGI-приложение (upravdom/asgi.py) использует inquiries.async_urls, где
+# часто читаемые представления выполняются в отдельном пуле потоков БД:
+# gunicorn upravdom.asgi:application -k uvicorn.workers.UvicornWorker
+# Размер пула - это и предел соединений с БД на один процесс.
+ASYNC_DATABASE_THREADS = int(os.getenv("ASYNC_DATABASE_THREADS", "10"))
+
+# Push-канал /events (только ASGI). Брокер inquiries.events.LocalBroker
+# работает в пределах процесса; при нескольких процессах нужен
+# inquiries.events.PostgresBroker (LISTEN/NOTIFY).
+EVENTS_BROKER = os.getenv("EVENTS_BROKER", 'inquiries.events.LocalBroker')
+EVENTS_KEEPALIVE = int(os.getenv("EVENTS_KEEPALIVE", "15"))
+
 
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
@@ -119,6 +193,28 @@ elif len(sys.argv) > 0 and sys.argv[1] != 'collectstatic':
     }
 
 
+# Cache
+# https://docs.djangoproject.com/en/4.0/topics/cache/
+# Кэш ответов списков (inquiries.cache). Локальная память живёт внутри одного
+# процесса, поэтому при нескольких воркерах gunicorn нужен общий бэкенд,
+# например django.core.cache.backends.filebased.FileBasedCache с каталогом
+# в RESPONSE_CACHE_LOCATION.
+
+CACHES = {
+    'default': {
+        'BACKEND': 'django.core.cache.backends.locmem.LocMemCache',
+    },
+    'responses': {
+        'BACKEND': os.getenv("RESPONSE_CACHE_BACKEND", 'django.core.cache.backends.locmem.LocMemCache'),
+        'LOCATION': os.getenv("RESPONSE_CACHE_LOCATION", 'responses'),
+        'TIMEOUT': int(os.getenv("RESPONSE_CACHE_TIMEOUT", "300")),
+        'OPTIONS': {
+            'MAX_ENTRIES': int(os.getenv("RESPONSE_CACHE_MAX_ENTRIES", "1000")),
+        },
+    },
+}
+
+
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
 
@@ -166,6 +262,34 @@ STATIC_ROOT = os.path.join(BASE_DIR, "staticfiles")
 
 MEDIA_URL =  '/media'
 MEDIA_ROOT = os.path.join(BASE_DIR, "media")
+# Файлы хранятся по содержимому (inquiries.storage), неиспользуемое
+# содержимое удаляет manage.py collect_blobs
+DEFAULT_FILE_STORAGE = os.getenv("DEFAULT_FILE_STORAGE", 'inquiries.storage.ContentAddressedStorage')
+
+# Загрузка файлов по частям (/uploads): наибольший размер файла и одной
+# части, каталог незавершённых загрузок (на том же диске, что и MEDIA_ROOT,
+# чтобы готовый файл переносился без копирования), на сколько секунд
+# загрузка закрепляется за запросом с частью и через сколько часов
+# брошенные загрузки удаляются.
+FILE_UPLOAD_MAX_SIZE = int(os.getenv("FILE_UPLOAD_MAX_SIZE", str(1024 ** 3)))
+FILE_UPLOAD_CHUNK_SIZE = int(os.getenv("FILE_UPLOAD_CHUNK_SIZE", str(8 * 1024 ** 2)))
+FILE_UPLOAD_PARTS_DIR = os.getenv("FILE_UPLOAD_PARTS_DIR", os.path.join(MEDIA_ROOT, "uploads"))
+FILE_UPLOAD_LOCK_TIMEOUT = int(os.getenv("FILE_UPLOAD_LOCK_TIMEOUT", "300"))
+FILE_UPLOAD_EXPIRY_HOURS = int(os.getenv("FILE_UPLOAD_EXPIRY_HOURS", "24"))
+
+# Передача содержимого файлов (/files/<id>/content) фронтовому прокси после
+# проверки прав: 'X-Accel-Redirect' (nginx) или 'X-Sendfile' (Apache,
+# lighttpd). Для nginx FILE_DELIVERY_PREFIX - внутренний location с MEDIA_ROOT:
+#     location /protected/ { internal; alias /path/to/media/; }
+# Пустое значение - файлы отдаёт сам Django.
+FILE_DELIVERY_HEADER = os.getenv("FILE_DELIVERY_HEADER", '')
+FILE_DELIVERY_PREFIX = os.getenv("FILE_DELIVERY_PREFIX", '/protected/')
+
+# Уменьшенные копии фотографий профиля: стороны квадратов в пикселях,
+# формат (WEBP или JPEG) и качество сжатия.
+THUMBNAIL_SIZES = [int(size) for size in os.getenv("THUMBNAIL_SIZES", "64,128,512").split(',')]
+THUMBNAIL_FORMAT = os.getenv("THUMBNAIL_FORMAT", 'WEBP')
+THUMBNAIL_QUALITY = int(os.getenv("THUMBNAIL_QUALITY", "80"))
 
 
 # Default primary key field type
@@ -182,4 +306,10 @@ CORS_ORIGIN_WHITELIST = [
 'http://localhost:3000',
 'http://localhost:8000',
 'http://localhost:8080',
+]
+
+CORS_EXPOSE_HEADERS = [
+    'Link',
+    'X-Next-Cursor',
+    'X-Previous-Cursor',
 ]
\ No newline at end of file